@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: stampingMemoryBenchmark.py                                            #
+# Description: misura la memoria occupata da ogni timbratura interpretata,    #
+# confrontando la classe Stamping con __slots__ con una classe ordinaria con  #
+# gli attributi nel __dict__ (rappresentazione precedente).                   #
+#                                                                             #
+# Utilizzo: python benchmarks/stampingMemoryBenchmark.py [numero_timbrature]  #
+###############################################################################
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'epas_client'))
+
+from stamping import Stamping, STAMPING_FIELDS
+from stampingImporter import StampingImporter
+from stampingParserBenchmark import writeSyntheticFile
+
+
+class DictStamping:
+    """
+    Timbratura con gli attributi nel __dict__, come prima dell'introduzione
+    di __slots__ in Stamping.
+    """
+    pass
+
+
+def toDictStamping(stamping, materializeDict=False):
+    dictStamping = DictStamping()
+    for field in STAMPING_FIELDS:
+        setattr(dictStamping, field, getattr(stamping, field))
+    if materializeDict:
+        # La serializzazione JSON leggeva stamping.__dict__, che da Python 3.11
+        # crea il dizionario degli attributi dell'oggetto
+        dictStamping.__dict__
+    return dictStamping
+
+
+def measure(build, number):
+    """
+    Restituisce i byte allocati per ogni oggetto creato da build.
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    objects = [build(i) for i in range(number)]
+    allocated = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    # la lista che contiene gli oggetti non fa parte della timbratura
+    allocated -= sys.getsizeof(objects)
+    return allocated / len(objects)
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    fileName = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timbrature-memoria.txt')
+    try:
+        writeSyntheticFile(fileName, number)
+        with open(fileName) as f:
+            lines = f.read().splitlines()
+    finally:
+        os.remove(fileName)
+
+    # Timbrature interpretate: include le stringhe dei campi estratti dalla riga
+    print("%-44s %8.0f byte/timbratura" % (
+        "Stamping (__slots__) con valori dei campi",
+        measure(lambda i: StampingImporter._parseLine(lines[i]), number)))
+
+    # Solo il contenitore: i valori dei campi sono condivisi
+    stampings = [StampingImporter._parseLine(line) for line in lines]
+    print("%-44s %8.0f byte/timbratura" % (
+        "contenitore Stamping (__slots__)",
+        measure(lambda i: Stamping(), number)))
+    print("%-44s %8.0f byte/timbratura" % (
+        "contenitore con __dict__ (precedente)",
+        measure(lambda i: toDictStamping(stampings[i]), number)))
+    print("%-44s %8.0f byte/timbratura" % (
+        "contenitore con __dict__ dopo l'invio",
+        measure(lambda i: toDictStamping(stampings[i], True), number)))
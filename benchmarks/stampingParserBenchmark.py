@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: stampingParserBenchmark.py                                            #
+# Description: misura le righe al secondo interpretate da _parseLine, riga   #
+# per riga, e da parse_buffer sull'intero file, tramite la regex o tramite il #
+# tracciato a larghezza fissa, su un file sintetico di timbrature SmartClock. #
+# La cache delle timbrature interpretate è disattivata, in modo che le        #
+# esecuzioni ripetute misurino sempre l'interpretazione delle righe.          #
+#                                                                             #
+# Utilizzo: python benchmarks/stampingParserBenchmark.py [numero_righe]       #
+###############################################################################
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'epas_client'))
+
+import stampingImporter
+from config import REGEX_STAMPING
+from stampingImporter import StampingImporter, StampingFormat
+
+stampingImporter.parseCache = None
+
+
+def writeSyntheticFile(fileName, number):
+    """
+    Scrive un file di number timbrature nel formato di default degli SmartClock.
+    """
+    with open(fileName, 'w') as f:
+        for i in range(number):
+            f.write("%s1%d%06d0000%02d%02d%02d%02d%02d1400\n" % (
+                "EU"[i % 2], i % 7 + 1, i % 1000000, i % 24, i % 60, (i * 7) % 60, i % 28 + 1, i % 12 + 1))
+
+
+def linesPerSecond(lines, stampingFormat, repeat=5):
+    """
+    Righe al secondo interpretate da _parseLine, migliore di repeat esecuzioni.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        for line in lines:
+            StampingImporter._parseLine(line, stampingFormat)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def bufferLinesPerSecond(text, number, stampingFormat, repeat=5):
+    """
+    Righe al secondo interpretate da parse_buffer sull'intero testo,
+    migliore di repeat esecuzioni.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        StampingImporter.parse_buffer(text, stampingFormat)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return number / best
+
+
+def runPath(number, path):
+    """
+    Misura le righe al secondo di _parseLine riga per riga (path = "regex"
+    o "tracciato") o di parse_buffer sull'intero file (path = "buffer-regex"
+    o "buffer-tracciato").
+    """
+    stampingFormat = StampingFormat(REGEX_STAMPING, fixedWidth=path.endswith("tracciato"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fileName = os.path.join(tmpdir, 'timbrature.txt')
+        writeSyntheticFile(fileName, number)
+        with open(fileName) as f:
+            text = f.read()
+
+    if path.startswith("buffer"):
+        rate = bufferLinesPerSecond(text, number, stampingFormat)
+    else:
+        rate = linesPerSecond(text.splitlines(), stampingFormat)
+    print("%-18s %d righe %12.0f righe/s" % (path, number, rate))
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    if len(sys.argv) > 2:
+        runPath(number, sys.argv[2])
+    else:
+        # Ogni modalità viene misurata in un processo separato, in modo che le
+        # istanze di Stamping create da una non influenzino l'altra
+        for path in ("regex", "tracciato", "buffer-regex", "buffer-tracciato"):
+            subprocess.run([sys.executable, __file__, str(number), path], check=True)
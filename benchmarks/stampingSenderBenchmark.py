@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: stampingSenderBenchmark.py                                            #
+# Description: misura il costo di CPU per timbratura della preparazione delle #
+# richieste di invio ad ePAS (url, autenticazione, serializzazione JSON e     #
+# preparazione della richiesta HTTP), senza effettuare richieste di rete.     #
+#                                                                             #
+# Utilizzo: python benchmarks/stampingSenderBenchmark.py [numero_timbrature]  #
+###############################################################################
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'epas_client'))
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from config import EPAS_SERVER_PROTOCOL, EPAS_SERVER_NAME, EPAS_SERVER_PORT, \
+    EPAS_STAMPING_URL
+from stamping import Stamping
+from stampingSender import STAMPING_URL, encodeStamping, getTemplate
+
+
+def sampleStamping():
+    stamping = Stamping()
+    stamping.operazione = "0"
+    stamping.tipo = "1"
+    stamping.giornoSettimana = "3"
+    stamping.matricolaFirma = "000232"
+    stamping.causale = None
+    stamping.ora = 13
+    stamping.minuti = 50
+    stamping.secondi = 56
+    stamping.giorno = 5
+    stamping.mese = 3
+    stamping.anno = 2014
+    stamping.lettore = "00"
+    return stamping
+
+
+def legacyRequest(stamping):
+    """
+    Preparazione della richiesta come avveniva ad ogni invio con requests.put:
+    url, autenticazione, serializzazione con json.dumps, sessione, preparazione
+    della richiesta e lettura delle impostazioni di ambiente.
+    """
+    stampingJson = json.dumps(stamping.payload())
+    url = "%s://%s:%d%s" % (EPAS_SERVER_PROTOCOL, EPAS_SERVER_NAME,
+                            EPAS_SERVER_PORT, EPAS_STAMPING_URL)
+    with requests.Session() as session:
+        request = requests.Request("PUT", url, data=stampingJson,
+                                   auth=HTTPBasicAuth("epas.client", "password"))
+        prepared = session.prepare_request(request)
+        session.merge_environment_settings(prepared.url, {}, None, None, None)
+    return prepared
+
+
+def templateRequest(stamping, template):
+    """
+    Preparazione della richiesta tramite il RequestTemplate precompilato.
+    """
+    prepared = template.prepared.copy()
+    prepared.prepare_body(encodeStamping(stamping), None)
+    return prepared
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    stamping = sampleStamping()
+    template = getTemplate(STAMPING_URL)
+
+    cases = [
+        ("serializzazione json.dumps", lambda: json.dumps(stamping.payload())),
+        ("serializzazione encodeStamping", lambda: encodeStamping(stamping)),
+        ("richiesta completa prima", lambda: legacyRequest(stamping)),
+        ("richiesta completa con template", lambda: templateRequest(stamping, template)),
+    ]
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, timer=timeit.time.process_time, repeat=3, number=number))
+        print("%-40s %8.2f µs/timbratura" % (name, seconds / number * 1e6))
@@ -62,15 +62,92 @@ SEND_ALL_STAMPINGS_EVERYTIME=False
 
 # Numero di thread da utilizzare per l'invio delle timbrature; Default 1
 MAX_THREADS = {{MAX_THREADS}}
+# Modalità di invio delle timbrature: "threads" (default) utilizza MAX_THREADS
+# thread, "asyncio" effettua le richieste in un unico thread (richiede aiohttp)
+SEND_ENGINE = "{{SEND_ENGINE}}"
+# Numero massimo di richieste contemporanee verso ePAS con SEND_ENGINE = "asyncio"
+ASYNC_MAX_CONCURRENCY = {{ASYNC_MAX_CONCURRENCY}}
+# Se impostata a True il numero di invii contemporanei parte da
+# ADAPTIVE_MIN_CONCURRENCY e cresce fino a MAX_THREADS (o ASYNC_MAX_CONCURRENCY)
+# finché il server risponde entro ADAPTIVE_LATENCY_THRESHOLD secondi, mentre
+# viene dimezzato in caso di timeout ed errori 5xx del server.
+ADAPTIVE_CONCURRENCY = {{ADAPTIVE_CONCURRENCY}}
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_LATENCY_THRESHOLD = 2
+# Numero massimo di richieste al secondo inviate mediamente ad ePAS,
+# indipendentemente dal numero di invii contemporanei. Con 0 (default) non c'è
+# nessun limite. RATE_LIMIT_BURST è il numero di richieste consecutive
+# consentite prima che il limite entri in funzione.
+RATE_LIMIT = {{RATE_LIMIT}}
+RATE_LIMIT_BURST = {{RATE_LIMIT_BURST}}
+# Numero massimo di connessioni HTTP keep-alive verso ePAS riutilizzate per
+# l'invio delle timbrature. Default pari a MAX_THREADS.
+HTTP_POOL_SIZE = MAX_THREADS
 # Numero massimo di secondi di attesa del client per ogni PUT di inserimento
 # timbratura prima di terminare il comando HTTP.
 CONNECTION_TIMEOUT=10
+# Numero di timbrature inviate ad ePAS in una singola richiesta. Con il valore 1
+# (default) ogni timbratura viene inviata singolarmente. Valori maggiori di 1
+# richiedono che il server ePAS esponga EPAS_STAMPINGS_BATCH_URL.
+SEND_BATCH_SIZE = {{SEND_BATCH_SIZE}}
+# Secondi massimi di attesa di nuove timbrature per completare un blocco prima
+# di inviarlo comunque.
+SEND_BATCH_MAX_WAIT = {{SEND_BATCH_MAX_WAIT}}
+# Numero massimo di timbrature già interpretate in attesa di essere inviate dai
+# thread di invio. Limita la memoria utilizzata indipendentemente dalla
+# dimensione dei file delle timbrature.
+SEND_QUEUE_SIZE = 1000
+
 # Gli errore ricevuti dal server che comportano un re-invio delle timbrature
 SERVER_ERROR_CODES = [{{SERVER_ERROR_CODES}}]
 
+# Numero massimo di re-invii immediati di una timbratura fallita per errori di
+# connessione o per uno dei RETRY_STATUS_CODES, prima di inserirla nelle
+# bad stampings. Con il valore 0 i re-invii sono disabilitati.
+RETRY_MAX_ATTEMPTS = {{RETRY_MAX_ATTEMPTS}}
+# Attesa iniziale e massima (secondi) tra i re-invii, con backoff esponenziale
+# e jitter. Un Retry-After del server superiore a RETRY_MAX_DELAY non viene atteso.
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+# Numero massimo di re-invii complessivi in una singola esecuzione del client
+RETRY_BUDGET = 100
+# Codici di risposta del server considerati transitori: 429 (troppe richieste,
+# con l'eventuale Retry-After) e gli errori dei gateway/server non disponibile.
+# Le timbrature con questi codici non ritentate vanno nelle bad stampings.
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+# Numero di errori di connessione consecutivi verso ePAS dopo il quale le
+# timbrature restanti non vengono più inviate ma salvate direttamente nelle bad
+# stampings (circuit breaker aperto). Con il valore 0 il controllo è disabilitato.
+CIRCUIT_BREAKER_FAILURES = {{CIRCUIT_BREAKER_FAILURES}}
+# Secondi dopo i quali, nelle esecuzioni successive, viene inviata una
+# timbratura di prova per verificare se il server è tornato raggiungibile
+CIRCUIT_BREAKER_RESET_TIMEOUT = 600
+# File in cui viene mantenuto lo stato del circuit breaker tra le esecuzioni
+CIRCUIT_BREAKER_FILE = 'circuit_breaker.txt'
+
+# Numero di giorni per cui vengono ricordate le timbrature già accettate da
+# ePAS, che non vengono re-inviate se presenti di nuovo nei file scaricati (per
+# esempio con SEND_ALL_STAMPINGS_EVERYTIME o con gli SmartClock). Con il valore 0
+# tutte le timbrature vengono sempre inviate.
+SENT_LEDGER_DAYS = {{SENT_LEDGER_DAYS}}
+# File in cui vengono registrate le timbrature già accettate da ePAS
+SENT_LEDGER_FILE = 'sent_stampings.txt'
+
 # Espressione regolare per eseguire il parsing delle timbrature
 REGEX_STAMPING = "{{REGEX_STAMPING}}"
 
+# Numero massimo di timbrature interpretate mantenute in memoria, indicizzate
+# dalla riga del file, per non interpretare più volte la stessa riga
+# (archiviazione, invio e re-invio delle timbrature con problemi).
+# Con 0 la cache è disabilitata.
+PARSE_CACHE_SIZE = 10000
+
+# Numero di processi utilizzati per interpretare i file durante l'importazione
+# di tutti i file di timbrature (recupero dello storico). Con 0 vengono
+# utilizzati tutti i processori disponibili.
+BACKFILL_PROCESSES = {{BACKFILL_PROCESSES}}
+
 # File di log dove verranno riportate le operazioni fatte dal client
 LOG_FILE = LOG_DIR + '/client.log'
 
@@ -121,6 +198,9 @@ MAPPING_OPERAZIONE_CLIENT_SERVER = {{MAPPING_OPERAZIONE_CLIENT_SERVER}}
 #File all'interno del quale vengono salvate le informazioni relative all'ultimo
 #file di timbrature processato dal client
 FILE_LAST_DOWNLOAD = "ultimo_file.txt"
+#File all'interno del quale viene salvato l'elenco dei file di timbrature
+#presenti sul server FTP/SFTP, con dimensione e data di ultima modifica
+REMOTE_CATALOG_FILE = "catalogo_file.txt"
 
 ###############################################################################
 # Parametri di configurazione standard da non modificare a meno di non        #
@@ -152,6 +232,8 @@ EPAS_REST_USERNAME = "{{EPAS_CLIENT_USER}}"
 EPAS_REST_PASSWORD = "{{EPAS_CLIENT_PASSWORD}}"
 
 EPAS_STAMPING_URL = "/stampings/create"
+# Url del servizio che accetta una lista JSON di timbrature (SEND_BATCH_SIZE > 1)
+EPAS_STAMPINGS_BATCH_URL = "/stampings/createMany"
 
 #Possibile valori sono ftp/sftp/local
 STAMPINGS_SERVER_PROTOCOL="{{STAMPINGS_SERVER_PROTOCOL}}"
@@ -182,6 +264,72 @@ FTP_SERVER_DIR = "{{FTP_SERVER_DIR}}"
 FTP_FILE_PREFIX = "{{FTP_FILE_PREFIX}}"
 FTP_FILE_SUFFIX = "{{FTP_FILE_SUFFIX}}"
 
+#Numero di byte finali della copia locale di un file di timbrature che vengono
+#riscaricati e confrontati prima di scaricare solo la parte aggiunta del file:
+#se non coincidono il file sul server è stato riscritto e viene riscaricato
+#interamente
+RESUME_CHECK_BYTES = 4096
+
+#Numero di nuovi file di timbrature scaricati in anticipo mentre vengono
+#inviate le timbrature del file precedente (es. dopo un fine settimana o
+#un'interruzione della rete). Con 0 i file vengono scaricati e processati
+#uno alla volta
+DOWNLOAD_PREFETCH_FILES = 2
+
+#Sorgenti di timbrature (lettori badge o server FTP/SFTP di più sedi) gestite
+#contemporaneamente dallo stesso client. Ogni sorgente è un dizionario con il
+#nome della sorgente ("NAME"), utilizzato come sottodirectory per i file
+#scaricati e per i file di stato, e con i parametri da utilizzare al posto di
+#quelli globali con lo stesso nome: STAMPINGS_SERVER_PROTOCOL
+#(ftp/sftp/local/smartclock), FTP_SERVER_NAME, FTP_SERVER_PORT,
+#FTP_CONNECTION_TIMEOUT, FTP_USERNAME, FTP_PASSWORD, FTP_SERVER_DIR,
+#FTP_FILE_PREFIX, FTP_FILE_SUFFIX, REGEX_STAMPING e, per i lettori smartclock,
+#BADGE_READER_IP, BADGE_READER_PORT, BADGE_READER_USER, BADGE_READER_PSW.
+#Es. [{"NAME": "sede1", "STAMPINGS_SERVER_PROTOCOL": "ftp", "FTP_SERVER_NAME": "10.0.0.1"},
+#     {"NAME": "sede2", "STAMPINGS_SERVER_PROTOCOL": "sftp", "FTP_SERVER_NAME": "10.0.0.2"},
+#     {"NAME": "sede3", "STAMPINGS_SERVER_PROTOCOL": "smartclock", "BADGE_READER_IP": "10.0.0.3"}]
+#Con la lista vuota viene utilizzata solamente la sorgente definita dai
+#parametri globali
+STAMPING_SOURCES = {{STAMPING_SOURCES}}
+
+#Numero massimo di sorgenti di STAMPING_SOURCES controllate contemporaneamente.
+#Le timbrature di tutte le sorgenti vengono inviate ad ePAS da un'unica coda
+#di invio
+SOURCE_POLL_WORKERS = {{SOURCE_POLL_WORKERS}}
+
+#Secondi tra un controllo e il successivo dei nuovi file di timbrature quando
+#il client è avviato in esecuzione continua (python client.py -l) invece che
+#dal cron. In questa modalità le connessioni FTP/SFTP restano aperte tra un
+#controllo e il successivo
+POLL_INTERVAL = {{POLL_INTERVAL}}
+
+#In esecuzione continua (python client.py -l o -w), secondi tra un re-invio e
+#il successivo delle timbrature con problemi, al posto del cron PROBLEMS_CRON.
+#Il valore 0 disabilita il re-invio
+BAD_STAMPINGS_INTERVAL = {{BAD_STAMPINGS_INTERVAL}}
+
+#Secondi di inattività dopo i quali viene inviato un NOOP (FTP) o un pacchetto
+#di keepalive (SFTP) sulle connessioni mantenute aperte in esecuzione continua
+SESSION_KEEPALIVE = 30
+
+#Se True i file di timbrature scaricati via FTP/SFTP non vengono salvati in
+#STAMPINGS_DIR e riletti, ma interpretati man mano che vengono ricevuti
+#(vengono scaricati solo i byte successivi all'ultima riga processata)
+STREAM_REMOTE_FILES = {{STREAM_REMOTE_FILES}}
+
+#Con STREAM_REMOTE_FILES, se True i byte ricevuti vengono comunque salvati in
+#STAMPINGS_DIR come copia di audit
+STREAM_AUDIT_COPY = {{STREAM_AUDIT_COPY}}
+
+#Con il client avviato in modalità watch (python client.py -w) e i file di
+#timbrature in una cartella locale, secondi di attesa dopo una modifica dei
+#file per raggruppare una raffica di scritture in un unico controllo
+WATCH_DEBOUNCE = 0.1
+
+#In modalità watch, secondi tra un controllo e il successivo della cartella
+#locale quando inotify non è disponibile
+WATCH_POLL_INTERVAL = 0.5
+
 ###############################################################################
 # Parametri di configurazione del lettore badge dal quale scaricare le        #
 # timbrature                                                                  #
@@ -29,9 +29,11 @@ from stampingImporter import StampingImporter
 class Archive:
 
     @staticmethod
-    def archive_and_check_stampings(stampings):
+    def archive_and_check_stampings(stampings, archives_dir=ARCHIVES_DIR, stampingFormat=None):
         """
         :param stampings: La lista delle timbrature da archiviare
+        :param archives_dir: La directory dei file giornalieri di archivio
+        :param stampingFormat: Il formato delle timbrature, di default quello di REGEX_STAMPING
         :return: La timbratura più recente tra le timbrature passate e la relativa data
         """
         last_stamping_date = None
@@ -39,13 +41,13 @@ class Archive:
 
         for stamping in stampings:
             try:
-                stamp = StampingImporter._parseLine(stamping)
+                stamp = StampingImporter._parseLine(stamping, stampingFormat)
                 stamping_date = datetime(stamp.anno,stamp.mese,stamp.giorno,stamp.ora,stamp.minuti)
                 if last_stamping_date is None or last_stamping_date < stamping_date:
                     last_stamping_date = stamping_date
                 last_stamping = stamping
                 dailyfile = stamping_date.__format__(ARCHIVE_FILE_FORMAT)
-                archive_path = os.path.join(ARCHIVES_DIR, dailyfile)
+                archive_path = os.path.join(archives_dir, dailyfile)
 
                 with open(archive_path, 'a+') as f:
                     f.write("%s\n" % (stamping,))
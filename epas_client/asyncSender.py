@@ -0,0 +1,308 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: asyncSender.py                                                        #
+# Description: invio delle timbrature all'applicazione "Epas" tramite asyncio #
+# in alternativa ai thread di invio (SEND_ENGINE = "asyncio").                #
+#                                                                             #
+###############################################################################
+
+import asyncio
+import logging
+from concurrent.futures import CancelledError
+from threading import Thread
+
+import aiohttp
+
+from config import CONNECTION_TIMEOUT, ASYNC_MAX_CONCURRENCY, \
+    SEND_BATCH_SIZE, SEND_BATCH_MAX_WAIT, SEND_QUEUE_SIZE, RETRY_STATUS_CODES
+from circuitBreaker import CircuitBreaker, isFailure
+from concurrencyLimiter import isCongestion
+from metrics import SEND_TIME
+from stampingImporter import StampingImporter, BATCH_UNSUPPORTED_CODES, FAILED_STATUS_CODES
+from stampingSender import STAMPING_URL, STAMPINGS_BATCH_URL, REQUEST_HEADERS, \
+    encodeStamping, encodeStampings
+
+# Segnala la fine delle timbrature inserite nella coda dal thread di lettura
+_END = object()
+
+
+class AsyncSender:
+    """
+    Invia le timbrature ad ePAS tramite asyncio in un unico thread.
+    """
+
+    def __init__(self):
+        self.badStampings = []
+        self.session = None
+        # Utilizzata per attendere uno slot libero del controllo adattivo
+        # degli invii contemporanei (ADAPTIVE_CONCURRENCY)
+        self.limiterCondition = None
+
+    async def _acquire(self, limiter):
+        async with self.limiterCondition:
+            start = limiter.tryAcquire()
+            while start is None:
+                await self.limiterCondition.wait()
+                start = limiter.tryAcquire()
+            return start
+
+    async def _release(self, limiter, start, status):
+        limiter.release(start, not isCongestion(status))
+        async with self.limiterCondition:
+            self.limiterCondition.notify_all()
+
+    async def _allow(self):
+        """
+        Verifica tramite il circuit breaker se la timbratura può essere
+        inviata, attendendo l'esito dell'eventuale invio di prova.
+        """
+        allowed = StampingImporter.circuitBreaker.tryAllow()
+        while allowed is None:
+            await asyncio.sleep(0.1)
+            allowed = StampingImporter.circuitBreaker.tryAllow()
+        return allowed
+
+    async def _put(self, url, data, probe=False):
+        """
+        Effettua una PUT Restful verso ePAS, restituisce una tupla con codice,
+        descrizione, header Retry-After e contenuto della risposta oppure None
+        in caso di errore di connessione. probe indica se si tratta dell'invio
+        di prova del circuit breaker.
+        """
+        if StampingImporter.rateLimiter:
+            wait = StampingImporter.rateLimiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        limiter = StampingImporter.concurrencyLimiter
+        start = await self._acquire(limiter) if limiter else None
+        status = None
+        try:
+            with SEND_TIME.time():
+                async with self.session.put(url, data=data) as response:
+                    content = await response.read()
+            status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning("Errore di Connessione al server: %s", e)
+            return None
+        finally:
+            StampingImporter.circuitBreaker.record(not isFailure(status), probe)
+            if limiter:
+                await self._release(limiter, start, status)
+
+        return response.status, response.reason, response.headers.get("Retry-After"), content
+
+    async def _sendStamping(self, line, stamp):
+        """
+        Invia una singola timbratura, ritentando l'invio in caso di errori
+        transitori secondo la RetryPolicy. Se l'invio non va a buon fine la
+        riga viene inserita nelle badStampings.
+        """
+        data = encodeStamping(stamp)
+        attempt = 0
+        while True:
+            allowed = await self._allow()
+            if not allowed:
+                logging.debug("Circuit breaker aperto, timbratura non inviata: %s", line)
+                self.badStampings.append(line)
+                return
+            try:
+                response = await self._put(STAMPING_URL, data, allowed is CircuitBreaker.PROBE)
+                if response is not None:
+                    logging.info("Inviata la timbratura %s. Response code=%d, response content = %s",
+                                 data, response[0], response[3])
+            except Exception as e:
+                logging.error("Eccezione nell'invio delle timbratura line = %s. " +
+                              "Timbratura = %s. Eccezione = %s", line, stamp, e)
+                response = None
+            status = response[0] if response is not None else None
+            if response is None or status in FAILED_STATUS_CODES:
+                delay = StampingImporter.retryPolicy.nextDelay(
+                    attempt, status, response[2] if response is not None else None)
+                if delay is not None:
+                    attempt += 1
+                    logging.info("Invio della timbratura %s fallito (%s), tentativo %d tra %.1f secondi",
+                                 line, status, attempt, delay)
+                    await asyncio.sleep(delay)
+                    continue
+            break
+
+        if response is None:  # Caso di errore di connessione al server
+            logging.debug("Timbratura non inserita in ePas: %s", line)
+            self.badStampings.append(line)
+        elif response[0] in FAILED_STATUS_CODES:  # Risposta del server con un errore
+            logging.warning("Errore nell'invio della timbratura %s al server di ePas: %s %s",
+                            line, response[0], response[1])
+            self.badStampings.append(line)
+        else:  # Invio OK
+            logging.debug("Timbratura inserita correttamente in ePas:  %s", line)
+            if StampingImporter.sentLedger is not None:
+                StampingImporter.sentLedger.add(line)
+
+    async def _sendBatch(self, batch):
+        """
+        Invia un blocco di timbrature. Se il blocco viene rifiutato in parte
+        (errore 4xx non transitorio) le timbrature sono re-inviate singolarmente, in caso di
+        errore di connessione o del server l'intero blocco viene inserito
+        nelle badStampings.
+        """
+        if not StampingImporter.batchSupported:
+            for line, stamp in batch:
+                await self._sendStamping(line, stamp)
+            return
+
+        response = None
+        allowed = await self._allow()
+        if allowed:
+            data = encodeStampings([stamp for line, stamp in batch])
+            response = await self._put(STAMPINGS_BATCH_URL, data, allowed is CircuitBreaker.PROBE)
+        else:
+            logging.debug("Circuit breaker aperto, blocco di %d timbrature non inviato", len(batch))
+
+        if response is not None:
+            logging.info("Inviato un blocco di %d timbrature. Response code=%d, response content = %s",
+                         len(batch), response[0], response[3])
+
+        if response is not None and 200 <= response[0] < 300:
+            logging.debug("Blocco di %d timbrature inserito correttamente in ePas", len(batch))
+            if StampingImporter.sentLedger is not None:
+                for line, stamp in batch:
+                    StampingImporter.sentLedger.add(line)
+            return
+
+        if response is not None and response[0] in BATCH_UNSUPPORTED_CODES:
+            logging.warning("Il server di ePAS non supporta l'invio a blocchi delle timbrature "
+                            "(%s %s), le timbrature verranno inviate singolarmente", *response[:2])
+            StampingImporter.batchSupported = False
+        elif response is not None and 400 <= response[0] < 500 and \
+                response[0] not in RETRY_STATUS_CODES:
+            logging.warning("Blocco di %d timbrature non accettato interamente (%s %s), "
+                            "le timbrature verranno inviate singolarmente", len(batch), *response[:2])
+        else:
+            if response is not None:
+                logging.warning("Errore nell'invio di un blocco di %d timbrature al server di ePas: %s %s",
+                                len(batch), *response[:2])
+            else:
+                logging.debug("Blocco di %d timbrature non inserito in ePas", len(batch))
+            self.badStampings.extend(line for line, stamp in batch)
+            return
+
+        for line, stamp in batch:
+            await self._sendStamping(line, stamp)
+
+    @staticmethod
+    def _feed(stampings, queue, loop):
+        """
+        Eseguito in un thread separato: preleva le timbrature, effettuando il
+        parsing delle righe o dei file quando necessario, e le inserisce nella
+        coda, in modo che gli invii in corso nell'event loop non vengano
+        bloccati. Al termine inserisce _END, o l'eccezione sollevata durante
+        la lettura delle timbrature.
+        """
+        def put(item):
+            try:
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+                return True
+            except (CancelledError, RuntimeError):
+                # Event loop terminato, le timbrature non sono più necessarie
+                return False
+
+        try:
+            for item in stampings:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_END)
+
+    async def sendAll(self, stampings):
+        timeout = aiohttp.ClientTimeout(sock_connect=3.05, sock_read=CONNECTION_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=ASYNC_MAX_CONCURRENCY)
+        self.limiterCondition = asyncio.Condition()
+
+        # Il semaforo limita le richieste contemporanee, e quindi anche i task
+        # creati, indipendentemente dal numero di righe da inviare
+        semaphore = asyncio.BoundedSemaphore(ASYNC_MAX_CONCURRENCY)
+        pending = set()
+
+        async def spawn(coroutine):
+            await semaphore.acquire()
+            task = asyncio.ensure_future(coroutine)
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            task.add_done_callback(lambda t: semaphore.release())
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        Thread(target=self._feed, args=(stampings, queue, loop), daemon=True).start()
+
+        async with aiohttp.ClientSession(headers=REQUEST_HEADERS, timeout=timeout, connector=connector) as session:
+            self.session = session
+            # Un blocco incompleto viene inviato comunque dopo
+            # SEND_BATCH_MAX_WAIT secondi dalla prima timbratura inserita
+            batch = []
+            deadline = None
+            while True:
+                try:
+                    item = await asyncio.wait_for(
+                        queue.get(), max(0, deadline - loop.time()) if batch else None)
+                except asyncio.TimeoutError:
+                    await spawn(self._sendBatch(batch))
+                    batch = []
+                    continue
+
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                if SEND_BATCH_SIZE > 1 and StampingImporter.batchSupported:
+                    if not batch:
+                        deadline = loop.time() + SEND_BATCH_MAX_WAIT
+                    batch.append(item)
+                    if len(batch) >= SEND_BATCH_SIZE or loop.time() >= deadline:
+                        await spawn(self._sendBatch(batch))
+                        batch = []
+                else:
+                    await spawn(self._sendStamping(*item))
+
+            if batch:
+                await spawn(self._sendBatch(batch))
+
+            if pending:
+                await asyncio.wait(pending)
+
+        return self.badStampings
+
+
+def sendStampingsAsync(stampings):
+    """
+    @param stampings: coppie (riga, timbratura) da inviare
+    @return la lista delle timbrature da re-inviare ad ePAS.
+
+    Stesso contratto di StampingImporter._sendWithThreads, ma le richieste
+    vengono effettuate in un unico thread tramite asyncio, con al massimo
+    ASYNC_MAX_CONCURRENCY richieste contemporanee.
+    """
+    return asyncio.run(AsyncSender().sendAll(stampings))
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: asyncSenderTest.py                                                    #
+# Description: test relativi all'invio asincrono delle timbrature, verso un  #
+# server ePAS simulato tramite aiohttp.                                       #
+#                                                                             #
+###############################################################################
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from aiohttp import web
+
+import asyncSender
+from circuitBreaker import CircuitBreaker
+from stampingImporter import StampingImporter
+
+
+class FakeEpas:
+    """
+    Server ePAS simulato, eseguito in un thread con un proprio event loop:
+    registra il contenuto delle richieste e risponde con status.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.received = threading.Event()
+        self.status = 200
+        self.batchStatus = 200
+        self.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_put("/stamping", self.stamping)
+        app.router.add_put("/stampings", self.stampings)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.url = "http://127.0.0.1:%d" % site._server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def stamping(self, request):
+        self.requests.append(("stamping", await request.json()))
+        self.received.set()
+        return web.Response(status=self.status)
+
+    async def stampings(self, request):
+        self.requests.append(("stampings", await request.json()))
+        self.received.set()
+        return web.Response(status=self.batchStatus)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+
+def stampingLine(day):
+    return "E110000920000135056%02d031400" % day
+
+
+class AsyncSenderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.epas = FakeEpas()
+        patches = [
+            mock.patch.object(asyncSender, "STAMPING_URL", self.epas.url + "/stamping"),
+            mock.patch.object(asyncSender, "STAMPINGS_BATCH_URL", self.epas.url + "/stampings"),
+            mock.patch.object(StampingImporter, "batchSupported", True),
+            mock.patch.object(StampingImporter, "circuitBreaker",
+                              CircuitBreaker(os.path.join(self.tmpdir.name, "circuit"), 100, 60)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.epas.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def stampings(self, days, waitBefore=()):
+        """
+        Generatore delle timbrature da inviare: prima delle timbrature dei
+        giorni in waitBefore attende che il server abbia ricevuto una
+        richiesta, possibile solo se gli invii non sono bloccati dalla
+        lettura delle timbrature.
+        """
+        self.waited = []
+        for day in days:
+            if day in waitBefore:
+                self.waited.append(self.epas.received.wait(5))
+                self.epas.received.clear()
+            line = stampingLine(day)
+            yield line, StampingImporter._parseLine(line)
+
+    def test_sending_is_not_blocked_by_reading(self):
+        with mock.patch.object(asyncSender, "SEND_BATCH_SIZE", 1):
+            badStampings = asyncSender.sendStampingsAsync(self.stampings([1, 2, 3], waitBefore=(2, 3)))
+
+        self.assertEqual(self.waited, [True, True])
+        self.assertEqual(len(self.epas.requests), 3)
+        self.assertEqual(badStampings, [])
+
+    def test_incomplete_batch_is_sent_after_max_wait(self):
+        with mock.patch.object(asyncSender, "SEND_BATCH_SIZE", 10), \
+                mock.patch.object(asyncSender, "SEND_BATCH_MAX_WAIT", 0.1):
+            badStampings = asyncSender.sendStampingsAsync(self.stampings([1, 2, 3], waitBefore=(3,)))
+
+        self.assertEqual(self.waited, [True])
+        self.assertEqual([len(body) for kind, body in self.epas.requests], [2, 1])
+        self.assertEqual(badStampings, [])
+
+    def test_failed_batch_is_not_sent_one_by_one(self):
+        self.epas.batchStatus = 503
+        with mock.patch.object(asyncSender, "SEND_BATCH_SIZE", 2):
+            badStampings = asyncSender.sendStampingsAsync(self.stampings([1, 2, 3]))
+
+        self.assertEqual([kind for kind, body in self.epas.requests], ["stampings", "stampings"])
+        self.assertEqual(sorted(badStampings), [stampingLine(day) for day in (1, 2, 3)])
+
+    def test_partially_rejected_batch_is_sent_one_by_one(self):
+        self.epas.batchStatus = 400
+        self.epas.status = 401
+        with mock.patch.object(asyncSender, "SEND_BATCH_SIZE", 2):
+            badStampings = asyncSender.sendStampingsAsync(self.stampings([1, 2]))
+
+        self.assertEqual([kind for kind, body in self.epas.requests], ["stampings", "stamping", "stamping"])
+        self.assertEqual(sorted(badStampings), [stampingLine(day) for day in (1, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
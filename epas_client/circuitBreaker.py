@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: circuitBreaker.py                                                     #
+# Description: circuit breaker sull'invio delle timbrature ad ePAS, evita di  #
+# attendere il timeout di connessione per ogni timbratura quando il server    #
+# non è raggiungibile.                                                        #
+#                                                                             #
+###############################################################################
+
+import logging
+import os
+import threading
+import time
+
+from metrics import CIRCUIT_BREAKER_STATE
+
+def isFailure(statusCode):
+    """
+    True se l'esito di un invio conta come errore per il circuit breaker:
+    errore di connessione/timeout (statusCode None). Le risposte 429 non
+    contano, sono già gestite dal Retry-After dei re-invii e dai limiti di
+    frequenza e di concorrenza.
+    """
+    return statusCode is None
+
+
+class CircuitBreaker:
+    """
+    Dopo failureThreshold errori di connessione consecutivi il circuito viene
+    aperto e le timbrature successive non vengono più inviate ma salvate
+    direttamente nelle bad stampings.
+    Lo stato è salvato su file, in modo che nelle esecuzioni successive, una
+    volta trascorsi resetTimeout secondi dall'apertura, venga inviata una
+    sola timbratura di prova (stato half-open): se l'invio riesce il
+    circuito viene chiuso, altrimenti resta aperto. Nello stato half-open
+    conta solo l'esito dell'invio di prova, non quello di eventuali invii
+    iniziati prima dell'apertura del circuito.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    # Valore restituito da tryAllow/allow a chi deve effettuare l'invio di prova
+    PROBE = "probe"
+
+    # Valori esportati nella metrica dello stato del circuito
+    METRIC_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(self, stateFile, failureThreshold, resetTimeout):
+        self.stateFile = stateFile
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.state = self.CLOSED
+        self.openedAt = 0
+        self.consecutiveFailures = 0
+        self._probeInFlight = False
+        self._condition = threading.Condition()
+        self._load()
+        CIRCUIT_BREAKER_STATE.set(self.METRIC_VALUES[self.state])
+
+    def _load(self):
+        if not os.path.exists(self.stateFile):
+            return
+        try:
+            with open(self.stateFile, 'r') as f:
+                state, openedAt = f.readline().strip().split('\t')
+            if state == self.OPEN:
+                self.state = self.OPEN
+                self.openedAt = float(openedAt)
+                logging.warning("Circuit breaker verso ePAS aperto dal %s",
+                                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.openedAt)))
+        except (OSError, ValueError) as e:
+            logging.warning("Impossibile leggere lo stato del circuit breaker dal file %s: %s",
+                            self.stateFile, e)
+
+    def _setState(self, state):
+        self.state = state
+        CIRCUIT_BREAKER_STATE.set(self.METRIC_VALUES[state])
+        if state == self.HALF_OPEN:
+            return
+        if state == self.OPEN:
+            self.openedAt = time.time()
+        with open(self.stateFile, 'w') as f:
+            f.write("%s\t%s" % (state, self.openedAt))
+
+    def tryAllow(self):
+        """
+        Restituisce True se la timbratura può essere inviata, PROBE se deve
+        essere inviata come invio di prova (e il suo esito va registrato con
+        record(..., probe=True)), False se va salvata direttamente nelle bad
+        stampings, None se è in corso l'invio di prova e occorre attenderne
+        l'esito.
+        """
+        if self.failureThreshold <= 0:
+            return True
+        with self._condition:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.time() - self.openedAt < self.resetTimeout:
+                    return False
+                logging.info("Circuit breaker half-open: invio di una timbratura di prova ad ePAS")
+                self._setState(self.HALF_OPEN)
+            if self._probeInFlight:
+                return None
+            self._probeInFlight = True
+            return self.PROBE
+
+    def allow(self):
+        """
+        Come tryAllow, ma attende l'esito dell'eventuale invio di prova.
+        """
+        with self._condition:
+            allowed = self.tryAllow()
+            while allowed is None:
+                self._condition.wait()
+                allowed = self.tryAllow()
+            return allowed
+
+    def record(self, connected, probe=False):
+        """
+        Registra l'esito di un invio: connected è False per gli errori di
+        connessione/timeout (vedi isFailure), True se il server ha risposto.
+        probe è True per l'esito dell'invio di prova autorizzato da tryAllow.
+        """
+        if self.failureThreshold <= 0:
+            return
+        with self._condition:
+            if self.state == self.HALF_OPEN and not probe:
+                # Esito di un invio iniziato prima dell'apertura: lo stato
+                # del circuito dipende solo dall'invio di prova in corso
+                return
+            if connected:
+                self.consecutiveFailures = 0
+                if self.state != self.CLOSED:
+                    logging.info("Server ePAS nuovamente raggiungibile: circuit breaker chiuso")
+                    self._setState(self.CLOSED)
+            else:
+                self.consecutiveFailures += 1
+                if self.state == self.HALF_OPEN or \
+                        (self.state == self.CLOSED and self.consecutiveFailures >= self.failureThreshold):
+                    logging.error("Server ePAS non raggiungibile dopo %d errori di connessione consecutivi: "
+                                  "circuit breaker aperto, le timbrature restanti verranno salvate "
+                                  "tra le bad stampings", self.consecutiveFailures)
+                    self._setState(self.OPEN)
+            if probe:
+                self._probeInFlight = False
+                self._condition.notify_all()
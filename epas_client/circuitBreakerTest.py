@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: circuitBreakerTest.py                                                 #
+# Description: test relativi al circuit breaker verso il server ePAS          #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import unittest
+
+from circuitBreaker import CircuitBreaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stateFile = os.path.join(self.tmpdir.name, 'circuit_breaker.txt')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(self.stateFile, 3, 600)
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.record(False)
+        breaker.record(True)
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_open_state_survives_restart(self):
+        breaker = CircuitBreaker(self.stateFile, 1, 600)
+        breaker.record(False)
+        self.assertFalse(CircuitBreaker(self.stateFile, 1, 600).allow())
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(self.stateFile, 1, 0)
+        breaker.record(False)
+        breaker = CircuitBreaker(self.stateFile, 1, 0)
+        self.assertEqual(breaker.tryAllow(), CircuitBreaker.PROBE)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNone(breaker.tryAllow())
+        breaker.record(True, probe=True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.tryAllow())
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(self.stateFile, 1, 0)
+        breaker.record(False)
+        breaker = CircuitBreaker(self.stateFile, 1, 600)
+        breaker.openedAt = 0
+        self.assertEqual(breaker.tryAllow(), CircuitBreaker.PROBE)
+        breaker.record(False, probe=True)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.tryAllow())
+
+    def test_late_results_do_not_end_the_probe(self):
+        breaker = CircuitBreaker(self.stateFile, 1, 0)
+        breaker.record(False)
+        self.assertEqual(breaker.tryAllow(), CircuitBreaker.PROBE)
+        # Esiti di invii iniziati prima dell'apertura del circuito
+        breaker.record(True)
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNone(breaker.tryAllow())
+        breaker.record(True, probe=True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.tryAllow())
+
+    def test_disabled(self):
+        breaker = CircuitBreaker(self.stateFile, 0, 600)
+        for _ in range(10):
+            breaker.record(False)
+        self.assertTrue(breaker.allow())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,6 +31,9 @@
 
 import logging
 import os
+import signal
+import sys
+import time
 
 from ftpDownloader import FTPDownloader
 from sftpDownloader import SFTPDownloader
@@ -39,12 +42,19 @@ from smartclockManager import SmartClockManager
 from fileUtils import FileUtils
 from lock import lock
 from epasClient import EpasClient
+from stampingImporter import StampingImporter
+from sourcePoller import SourcePoller
+from stampingSource import StampingSource, configuredSources
+from sessionManager import sessionManager
+from stampingSender import closeSession
+from folderWatcher import folderWatcher
 
 #Quando questa configurazione è true viene ignorata la parte 
 # STAMPINGS_SERVER_PROTOCOL
 from config import STAMPINGS_ON_LOCAL_FOLDER
 
-from config import STAMPINGS_SERVER_PROTOCOL, METRICS_ENABLED
+from config import STAMPINGS_SERVER_PROTOCOL, METRICS_ENABLED, STAMPING_SOURCES, \
+    POLL_INTERVAL, BAD_STAMPINGS_INTERVAL
 from config import PARSING_ERROR_FILE, BAD_STAMPINGS_FILE, DATA_DIR
 
 bad_stampings_path = os.path.join(DATA_DIR, BAD_STAMPINGS_FILE)
@@ -53,6 +63,18 @@ parsing_errors_path = os.path.join(DATA_DIR, PARSING_ERROR_FILE)
 # Comando per effettuare l'invio solo delle bad stampings
 BAD_STAMPINGS_COMMAND = '-b'
 
+# Comando per importare le timbrature di tutti i file presenti (recupero dello
+# storico), interpretandoli su più processi
+IMPORT_ALL_COMMAND = '-a'
+
+# Comando per l'esecuzione continua del client, con un controllo dei nuovi
+# file ogni POLL_INTERVAL secondi
+LOOP_COMMAND = '-l'
+
+# Comando per l'esecuzione continua del client con i file di timbrature in una
+# cartella locale, processati appena modificati
+WATCH_COMMAND = '-w'
+
 from metrics import JOB_TIME, PrometheusClient
 
 @JOB_TIME.time()
@@ -65,27 +87,147 @@ def process_stamping_files():
     """
         
     logging.info("@@ Invio timbrature @@")
-    if STAMPINGS_ON_LOCAL_FOLDER or STAMPINGS_SERVER_PROTOCOL == "local":
+    if STAMPING_SOURCES:
+        # Più sorgenti di timbrature controllate contemporaneamente
+        SourcePoller(configuredSources()).check_new_stamping_files()
+    elif STAMPINGS_ON_LOCAL_FOLDER or STAMPINGS_SERVER_PROTOCOL == "local":
         manager = LocalFolderManager()
         manager.check_new_stamping_files()
     elif STAMPINGS_SERVER_PROTOCOL == "sftp":
         manager = SFTPDownloader()
-        manager.check_new_stamping_files()
-        manager.close()            
+        try:
+            manager.check_new_stamping_files()
+        finally:
+            if manager.loggedIn:
+                manager.close()
     elif STAMPINGS_SERVER_PROTOCOL == "ftp":
         ftpDownloader = FTPDownloader()
-        ftpDownloader.check_new_stamping_files()
+        try:
+            ftpDownloader.check_new_stamping_files()
+        finally:
+            if ftpDownloader.loggedIn:
+                ftpDownloader.quit_ftp()
     elif STAMPINGS_SERVER_PROTOCOL == "smartclock":            
-        last_stamping, last_stampingdate = SmartClockManager.downloadstampings()
-        if last_stamping is not None:
-            FileUtils.save_last_request(last_stamping, last_stampingdate)
-        SmartClockManager.process_stamping_files()
+        SmartClockManager().check_new_stamping_files()
+
+
+def send_bad_stampings():
+    """
+    Re-invia le timbrature con problemi di ogni sorgente di STAMPING_SOURCES,
+    o di quella definita dai parametri globali.
+    """
+    if STAMPING_SOURCES:
+        for source in configuredSources():
+            EpasClient.send_bad_stampings(source)
+    else:
+        EpasClient.send_bad_stampings()
+
+
+def import_all_stamping_files():
+    """
+    Recupero dello storico: importa le timbrature di tutti i file presenti
+    per ogni sorgente di STAMPING_SOURCES, o per quella definita dai
+    parametri globali, interpretando i file su BACKFILL_PROCESSES processi.
+    """
+    if STAMPING_SOURCES:
+        sources = configuredSources()
+    elif STAMPINGS_ON_LOCAL_FOLDER:
+        sources = [StampingSource(parameters={"STAMPINGS_SERVER_PROTOCOL": "local"})]
+    else:
+        sources = [StampingSource()]
+
+    for source in sources:
+        logging.info("Importazione di tutti i file di timbrature della sorgente %s", source)
+        source.makedirs()
+        if source.protocol == "local":
+            LocalFolderManager(source).import_all_stamping_files()
+        elif source.protocol == "sftp":
+            manager = SFTPDownloader(source)
+            try:
+                manager.import_all_stamping_files()
+            finally:
+                if manager.loggedIn:
+                    manager.close()
+        elif source.protocol == "ftp":
+            manager = FTPDownloader(source)
+            try:
+                manager.import_all_stamping_files()
+            finally:
+                if manager.loggedIn:
+                    manager.quit_ftp()
+        else:
+            logging.error("Importazione di tutti i file di timbrature non disponibile "
+                          "per il protocollo %s", source.protocol)
+
+
+def poll_stamping_files(lastBadStampings=None):
+    """
+    Singolo controllo dei file di timbrature in esecuzione continua. Ad ogni
+    controllo il budget dei re-invii e il registro degli invii vengono
+    preparati come ad un nuovo avvio del client; ogni BAD_STAMPINGS_INTERVAL
+    secondi vengono re-inviate anche le timbrature con problemi, dato che il
+    cron delle bad stampings non può essere eseguito mentre il client è attivo.
+    @param lastBadStampings: istante (time.monotonic) dell'ultimo re-invio
+        delle timbrature con problemi, None se non ancora effettuato
+    @return l'istante dell'ultimo re-invio delle timbrature con problemi
+    """
+    try:
+        StampingImporter.newRun()
+        process_stamping_files()
+        if BAD_STAMPINGS_INTERVAL > 0 and (lastBadStampings is None or
+                                           time.monotonic() - lastBadStampings >= BAD_STAMPINGS_INTERVAL):
+            lastBadStampings = time.monotonic()
+            send_bad_stampings()
+        if METRICS_ENABLED:
+            PrometheusClient.push_metrics()
+    except Exception:
+        logging.exception("Errore durante il controllo dei file di timbrature")
+    return lastBadStampings
+
+
+def run_forever():
+    """
+    Esecuzione continua del client: i nuovi file di timbrature vengono
+    controllati ogni POLL_INTERVAL secondi, mantenendo aperte tra un
+    controllo e il successivo le connessioni con i server FTP/SFTP.
+    Termina con SIGTERM o SIGINT.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    sessionManager.startKeepalive()
+    lastBadStampings = None
+    try:
+        while True:
+            start = time.monotonic()
+            lastBadStampings = poll_stamping_files(lastBadStampings)
+            time.sleep(max(0, POLL_INTERVAL - (time.monotonic() - start)))
+    finally:
+        sessionManager.closeAll()
+
+
+def run_watch():
+    """
+    Esecuzione continua del client con i file di timbrature in una cartella
+    locale: la cartella viene osservata (tramite inotify, o controllandola
+    ogni WATCH_POLL_INTERVAL secondi) e le righe aggiunte ai file di
+    timbrature vengono processate appena scritte. Un controllo viene
+    comunque effettuato ogni POLL_INTERVAL secondi.
+    Termina con SIGTERM o SIGINT.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    manager = LocalFolderManager()
+    watcher = folderWatcher(manager.source.stampingsDir, manager.is_stamping_file)
+    lastBadStampings = None
+    try:
+        while True:
+            lastBadStampings = poll_stamping_files(lastBadStampings)
+            watcher.wait(POLL_INTERVAL)
+    finally:
+        watcher.close()
 
   
 if __name__ == "__main__":
     from config import LOGGING
     import timeit
-    import sys
     import logging.config
 
     start = timeit.default_timer()
@@ -101,10 +243,29 @@ if __name__ == "__main__":
     logging.info(LOG_START)
 
     if BAD_STAMPINGS_COMMAND in sys.argv:
-        EpasClient.send_bad_stampings()
+        send_bad_stampings()
+    elif IMPORT_ALL_COMMAND in sys.argv:
+        import_all_stamping_files()
+    elif WATCH_COMMAND in sys.argv and not STAMPING_SOURCES and \
+            (STAMPINGS_ON_LOCAL_FOLDER or STAMPINGS_SERVER_PROTOCOL == "local"):
+        try:
+            run_watch()
+        except (KeyboardInterrupt, SystemExit):
+            logging.info("Esecuzione continua del client terminata")
+    elif WATCH_COMMAND in sys.argv or LOOP_COMMAND in sys.argv:
+        if WATCH_COMMAND in sys.argv:
+            logging.warning("La modalità watch è disponibile solo per i file di timbrature "
+                            "in una cartella locale, i file vengono controllati ogni %s secondi",
+                            POLL_INTERVAL)
+        try:
+            run_forever()
+        except (KeyboardInterrupt, SystemExit):
+            logging.info("Esecuzione continua del client terminata")
     else:
         process_stamping_files()
 
+    closeSession()
+
     LOG_END = '#########################    ESECUZIONE CLIENT COMPLETATA IN  %02dmin e %02dsec   ############################'
 
     end = timeit.default_timer()
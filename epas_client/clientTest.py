@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: sourcePollerTest.py                                                   #
+# Description: test relativi al controllo contemporaneo di più sorgenti di   #
+# timbrature.                                                                 #
+#                                                                             #
+###############################################################################
+
+import unittest
+from unittest import mock
+
+import client
+from stampingImporter import StampingImporter
+
+
+class PollStampingFilesTest(unittest.TestCase):
+    def test_retry_budget_is_reset_at_each_poll(self):
+        policy = StampingImporter.retryPolicy
+        policy.budget = 0
+        with mock.patch.object(client, "process_stamping_files"), \
+                mock.patch.object(client, "send_bad_stampings"):
+            client.poll_stamping_files()
+        self.assertEqual(policy.budget, policy.initialBudget)
+
+    def test_bad_stampings_are_sent_every_interval(self):
+        with mock.patch.object(client, "process_stamping_files"), \
+                mock.patch.object(client, "send_bad_stampings") as send_bad_stampings, \
+                mock.patch.object(client, "BAD_STAMPINGS_INTERVAL", 3600), \
+                mock.patch.object(client.time, "monotonic", side_effect=[1000, 2000, 4600, 4600]):
+            lastBadStampings = client.poll_stamping_files()
+            self.assertEqual(lastBadStampings, 1000)
+            # Intervallo non ancora trascorso
+            self.assertEqual(client.poll_stamping_files(lastBadStampings), 1000)
+            self.assertEqual(client.poll_stamping_files(lastBadStampings), 4600)
+        self.assertEqual(send_bad_stampings.call_count, 2)
+
+    def test_errors_do_not_stop_the_loop(self):
+        with mock.patch.object(client, "process_stamping_files", side_effect=OSError), \
+                mock.patch.object(client, "send_bad_stampings") as send_bad_stampings:
+            self.assertIsNone(client.poll_stamping_files())
+        send_bad_stampings.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
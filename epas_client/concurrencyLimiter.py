@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: concurrencyLimiter.py                                                 #
+# Description: controllo adattivo (AIMD) del numero di invii contemporanei    #
+# di timbrature verso ePAS.                                                   #
+#                                                                             #
+###############################################################################
+
+import logging
+import threading
+import time
+
+from config import SERVER_ERROR_CODES
+from metrics import SEND_CONCURRENCY_LIMIT
+
+
+def isCongestion(statusCode):
+    """
+    True se l'esito di un invio indica un server in difficoltà: errore di
+    connessione/timeout (statusCode None), richieste rifiutate per sovraccarico
+    (429) o errore 5xx tra i SERVER_ERROR_CODES.
+    Gli altri SERVER_ERROR_CODES (es. 404 badge non trovato) dipendono dalla
+    singola timbratura e non dal carico del server.
+    """
+    return statusCode is None or statusCode == 429 or \
+        (statusCode >= 500 and statusCode in SERVER_ERROR_CODES)
+
+
+class ConcurrencyLimiter:
+    """
+    Limita il numero di invii contemporanei verso ePAS adattandolo allo stato
+    del server con un algoritmo AIMD (Additive Increase/Multiplicative
+    Decrease): il limite parte da minLimit e cresce di circa 1 ogni
+    "finestra" di invii andati a buon fine entro latencyThreshold secondi,
+    mentre viene dimezzato in caso di timeout, errori del server o latenze
+    eccessive.
+    """
+
+    BACKOFF_FACTOR = 0.5
+
+    def __init__(self, minLimit, maxLimit, latencyThreshold):
+        self.minLimit = max(1, minLimit)
+        self.maxLimit = max(self.minLimit, maxLimit)
+        self.latencyThreshold = latencyThreshold
+        self.limit = float(self.minLimit)
+        self.inflight = 0
+        self._lastBackoff = 0
+        self._condition = threading.Condition()
+        SEND_CONCURRENCY_LIMIT.set(self.minLimit)
+
+    def currentLimit(self):
+        return int(self.limit)
+
+    def tryAcquire(self):
+        """
+        Occupa uno slot di invio se disponibile, senza attendere.
+        Restituisce l'istante di inizio dell'invio oppure None.
+        """
+        with self._condition:
+            if self.inflight >= int(self.limit):
+                return None
+            self.inflight += 1
+            return time.monotonic()
+
+    def acquire(self):
+        """
+        Attende che ci sia uno slot di invio disponibile e lo occupa.
+        Restituisce l'istante di inizio dell'invio da passare a release().
+        """
+        with self._condition:
+            while self.inflight >= int(self.limit):
+                self._condition.wait()
+            self.inflight += 1
+            return time.monotonic()
+
+    def release(self, start, success):
+        """
+        Libera lo slot occupato dall'invio iniziato in start ed aggiorna il
+        limite in funzione dell'esito (success) e della latenza dell'invio.
+        """
+        now = time.monotonic()
+        latency = now - start
+        with self._condition:
+            self.inflight -= 1
+            if success and latency <= self.latencyThreshold:
+                self.limit = min(self.maxLimit, self.limit + 1 / self.limit)
+            elif start >= self._lastBackoff:
+                # Si riduce il limite una sola volta per gli invii partiti
+                # prima dell'ultima riduzione, altrimenti un singolo
+                # rallentamento del server lo riporterebbe subito al minimo
+                self.limit = max(self.minLimit, self.limit * self.BACKOFF_FACTOR)
+                self._lastBackoff = now
+                logging.info("Invio timbrature: ridotto a %d il numero di invii contemporanei "
+                             "(esito positivo = %s, latenza %.2f sec)", int(self.limit), success, latency)
+            self._condition.notify_all()
+        SEND_CONCURRENCY_LIMIT.set(int(self.limit))
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: concurrencyLimiterTest.py                                             #
+# Description: test relativi al controllo adattivo degli invii contemporanei  #
+#                                                                             #
+###############################################################################
+
+import time
+import unittest
+
+from concurrencyLimiter import ConcurrencyLimiter, isCongestion
+
+
+class ConcurrencyLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.limiter = ConcurrencyLimiter(1, 4, 10)
+
+    def test_limit_grows_on_success(self):
+        for _ in range(20):
+            self.limiter.release(self.limiter.acquire(), True)
+        self.assertEqual(self.limiter.currentLimit(), 4)
+
+    def test_limit_halves_on_failure(self):
+        self.limiter.limit = 4.0
+        self.limiter.release(self.limiter.acquire(), False)
+        self.assertEqual(self.limiter.currentLimit(), 2)
+
+    def test_single_backoff_for_inflight_sends(self):
+        self.limiter.limit = 4.0
+        starts = [self.limiter.acquire() for _ in range(4)]
+        for start in starts:
+            self.limiter.release(start, False)
+        self.assertEqual(self.limiter.currentLimit(), 2)
+
+    def test_try_acquire_respects_limit(self):
+        self.assertIsNotNone(self.limiter.tryAcquire())
+        self.assertIsNone(self.limiter.tryAcquire())
+
+    def test_slow_response_is_congestion(self):
+        limiter = ConcurrencyLimiter(1, 4, 0)
+        limiter.limit = 4.0
+        start = limiter.acquire()
+        time.sleep(0.01)
+        limiter.release(start, True)
+        self.assertEqual(limiter.currentLimit(), 2)
+
+    def test_is_congestion(self):
+        self.assertTrue(isCongestion(None))
+        self.assertTrue(isCongestion(503))
+        self.assertFalse(isCongestion(404))
+        self.assertFalse(isCongestion(200))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,14 +33,12 @@ import logging
 import os
 from datetime import datetime, timedelta
 
-from config import DATA_DIR, PARSING_ERROR_FILE, BAD_STAMPINGS_FILE,  \
+from config import PARSING_ERROR_FILE, BAD_STAMPINGS_FILE,  \
     MAX_BAD_STAMPING_DAYS
 from fileUtils import FileUtils
+from stampingSource import StampingSource
 from stampingImporter import StampingImporter
 
-bad_stampings_path = os.path.join(DATA_DIR, BAD_STAMPINGS_FILE)
-parsing_errors_path = os.path.join(DATA_DIR, PARSING_ERROR_FILE)
-
 class EpasClient:
     """
     Client per il sistema di rilevazione delle presenze ePAS.
@@ -48,7 +46,15 @@ class EpasClient:
     """
 
     @staticmethod
-    def send_bad_stampings():
+    def send_bad_stampings(source=None):
+        """
+        Re-invia le timbrature con problemi della sorgente indicata, di
+        default quella definita dai parametri globali della configurazione.
+        """
+        if source is None:
+            source = StampingSource()
+        bad_stampings_path = os.path.join(source.dataDir, BAD_STAMPINGS_FILE)
+        parsing_errors_path = os.path.join(source.dataDir, PARSING_ERROR_FILE)
 
         logging.info("@@ Invio timbrature con problemi @@")
 
@@ -66,12 +72,13 @@ class EpasClient:
                 lines = set(lines)
 
             # butto via le timbrature più vecchie di x giorni
+            # le timbrature interpretate vengono riutilizzate per il re-invio
             for line in lines:
-                stamp = StampingImporter._parseLine(line)
+                stamp = StampingImporter._parseLine(line, source.stampingFormat)
                 stamping_date = datetime(stamp.anno,stamp.mese,stamp.giorno,stamp.ora,stamp.minuti)
 
                 if stamping_date >= oldest_day_allowed:
-                    still_good_stampings.append(line)
+                    still_good_stampings.append((line, stamp))
 
             removed_lines = len(lines) - len(still_good_stampings)
             if removed_lines > 0:
@@ -82,7 +89,7 @@ class EpasClient:
             logging.info("Rimosso il file %s", BAD_STAMPINGS_FILE)
 
             if still_good_stampings:
-                bad, errors = StampingImporter.sendStampingsOnEpas(still_good_stampings)
+                bad, errors = StampingImporter.sendParsedStampingsOnEpas(still_good_stampings, [], source.name)
 
                 bad_stampings += bad
                 parsing_errors += errors
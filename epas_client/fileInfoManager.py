@@ -42,12 +42,13 @@ class FileInfoManager:
 # - nome dell'ultimo file scaricato
 # - dimensione del file all'ultimo scaricamento
 # - ultima riga processata per quel file
+# - posizione nel file successiva all'ultima riga processata
 #
 # I dati sono separati da tab
 # nome file nella forma: ATaammgg
-# dimensione in byte
+# dimensione e posizione in byte
 #
-# ultimo file\tsize\tultima riga
+# ultimo file\tsize\tultima riga\toffset
 """
 
     def __init__(self, file_name):
@@ -57,13 +58,15 @@ class FileInfoManager:
         """
         self.fileName = file_name
 
-    def save(self, last_file_name, size, line):
+    def save(self, last_file_name, size, line, offset=None):
         """
         Salva le informazioni relative all'ultimo file scaricato su file
         """
         f = open(self.fileName, 'w')
         f.write(self.COMMENT)
         info = "%s\t%s\t%s" %(last_file_name, size, line)
+        if offset is not None:
+            info += "\t%s" % (offset,)
         f.write(info)
         f.close()
         logging.debug("Salvato il file file %s con info: %s", last_file_name, info)
@@ -71,12 +74,14 @@ class FileInfoManager:
 
     def getLastDownloadInfo(self):
         """
-        Ritorna una tupla di tre elementi contenente il nome dell'ultimo 
-        file scaricato, la sua dimensioni nell'ultimo download ed il numero 
-        dell'ultima riga processata per quel file.
+        Ritorna una tupla di quattro elementi contenente il nome dell'ultimo 
+        file scaricato, la sua dimensioni nell'ultimo download, il numero 
+        dell'ultima riga processata per quel file e la posizione in byte
+        successiva all'ultima riga processata (None se non presente, per i
+        file salvati dalle versioni precedenti del client).
         Le informazioni vengono lette da file e sono nel formato:
 
-        PXAAMMGG size line
+        PXAAMMGG size line offset
         
         dove:
           PX = prefisso di due lettere (ex. AT) 
@@ -85,6 +90,7 @@ class FileInfoManager:
           GG giorno
           size dimensione del file nell'ultimo scarimento
           line numero dell'ultimo riga processata
+          offset posizione successiva all'ultima riga processata
         
         """
         f = open(self.fileName, 'r')
@@ -94,6 +100,7 @@ class FileInfoManager:
             else:
                 values = line.split('\t')
                 f.close()
-                return [values[0], int(values[1]), int(values[2])]
+                offset = int(values[3]) if len(values) > 3 else None
+                return [values[0], int(values[1]), int(values[2]), offset]
         f.close()
         raise ValueError("informazioni sull'ultimo file scaricato non trovate")
@@ -42,8 +42,8 @@ class FileUtils:
                 os.makedirs(directory)
 
     @staticmethod
-    def load_last_request():
-        lastrequestfile = os.path.join(DATA_DIR, LAST_REQUEST_FILE)
+    def load_last_request(data_dir=DATA_DIR):
+        lastrequestfile = os.path.join(data_dir, LAST_REQUEST_FILE)
 
         if os.path.exists(lastrequestfile):
             try:
@@ -62,8 +62,8 @@ class FileUtils:
             return None, None
 
     @staticmethod
-    def save_last_request(stamping, date):
-        last_request = os.path.join(DATA_DIR, LAST_REQUEST_FILE)
+    def save_last_request(stamping, date, data_dir=DATA_DIR):
+        last_request = os.path.join(data_dir, LAST_REQUEST_FILE)
         if os.path.exists(last_request):
             os.remove(last_request)
 
@@ -86,3 +86,40 @@ class FileUtils:
                 logging.debug('Aggiunta riga %s al file %s', line, file)
 
         logging.info("Aggiunte %d timbrature al file %s", len(stampings), file)
+
+    @staticmethod
+    def read_text(file_name, offset=0, skip_lines=0, complete=False):
+        """
+        Legge il file a partire dalla posizione offset (in byte), scartando
+        le prime skip_lines righe.
+        Un'ultima riga non terminata dal fine riga, probabilmente ancora in
+        scrittura, non viene restituita a meno che complete sia True.
+        Restituisce in un'unica stringa il testo letto, con i fine riga
+        normalizzati in \\n, il numero di righe lette comprese quelle
+        scartate (che possono essere meno di skip_lines se il file è più
+        corto) e la posizione in byte successiva all'ultima riga.
+        """
+        skipped = 0
+        with open(file_name, 'rb') as f:
+            f.seek(offset)
+            if skip_lines > 0:
+                for raw in f:
+                    if not complete and not raw.endswith(b'\n'):
+                        break
+                    offset += len(raw)
+                    skipped += 1
+                    if skipped == skip_lines:
+                        break
+                f.seek(offset)
+            data = f.read()
+
+        if not complete and not data.endswith(b'\n'):
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                logging.info("Ultima riga del file %s incompleta, verrà processata "
+                             "alla prossima lettura", file_name)
+                data = data[:end]
+
+        offset += len(data)
+        number_of_lines = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+        return data.decode('utf-8', 'replace').replace('\r\n', '\n'), skipped + number_of_lines, offset
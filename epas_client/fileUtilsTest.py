@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: fileUtilsTest.py                                                      #
+# Description: test relativi alla lettura incrementale dei file di timbrature #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import unittest
+
+from fileUtils import FileUtils
+
+
+class FileUtilsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpdir.name, 'AT210101')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_partial_last_line_is_held_back(self):
+        with open(self.fileName, 'w') as f:
+            f.write("E11000092000013505605031400\nE1100009200001350")
+        text, lines, offset = FileUtils.read_text(self.fileName)
+        self.assertEqual((text, lines, offset), ("E11000092000013505605031400\n", 1, 28))
+
+        with open(self.fileName, 'a') as f:
+            f.write("5605031401\r\n")
+        text, lines, offset = FileUtils.read_text(self.fileName, offset)
+        self.assertEqual((text, lines), ("E11000092000013505605031401\n", 1))
+        self.assertEqual(offset, os.path.getsize(self.fileName))
+
+    def test_skip_lines(self):
+        with open(self.fileName, 'w') as f:
+            f.write("a\nb\nc")
+        self.assertEqual(FileUtils.read_text(self.fileName, skip_lines=1), ("b\n", 2, 4))
+        self.assertEqual(FileUtils.read_text(self.fileName, skip_lines=1, complete=True), ("b\nc", 3, 5))
+
+    def test_skip_more_lines_than_file(self):
+        # Informazioni sull'ultimo download con un numero di riga oltre la
+        # fine del file: vengono contate solo le righe effettivamente scartate
+        with open(self.fileName, 'w') as f:
+            f.write("a\nb\n")
+        self.assertEqual(FileUtils.read_text(self.fileName, skip_lines=5), ("", 2, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
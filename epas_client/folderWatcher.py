@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: folderWatcher.py                                                      #
+# Description: osservazione della cartella locale delle timbrature tramite   #
+# inotify, con controllo periodico in mancanza di inotify.                    #
+#                                                                             #
+###############################################################################
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+from config import WATCH_DEBOUNCE, WATCH_POLL_INTERVAL
+
+# Eventi inotify (vedi inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+
+# Intestazione di un evento inotify: wd, mask, cookie, len
+EVENT_HEADER = struct.Struct("iIII")
+
+# Attesa massima dal primo evento prima di restituire il controllo, anche se
+# i file continuano ad essere modificati, per processare le timbrature entro
+# un secondo
+MAX_DEBOUNCE_TIME = 0.5
+
+
+class InotifyWatcher:
+    """
+    Osserva una cartella tramite inotify: wait() termina appena uno dei file
+    accettati da match viene creato, modificato o chiuso dopo la scrittura.
+    Gli eventi ricevuti entro WATCH_DEBOUNCE secondi l'uno dall'altro vengono
+    raggruppati, in modo da processare una raffica di scritture una sola
+    volta.
+    """
+
+    def __init__(self, directory, match=None):
+        self.directory = directory
+        self.match = match if match is not None else lambda name: True
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), directory)
+
+    def wait(self, timeout):
+        """
+        Attende al massimo timeout secondi una modifica dei file osservati.
+        Restituisce True se ci sono state modifiche, False altrimenti.
+        """
+        deadline = time.monotonic() + timeout
+        while not self._changed(deadline - time.monotonic()):
+            if time.monotonic() >= deadline:
+                return False
+
+        first_event = time.monotonic()
+        while time.monotonic() - first_event < MAX_DEBOUNCE_TIME:
+            if not select.select([self.fd], [], [], WATCH_DEBOUNCE)[0]:
+                break
+            self._read_events()
+        return True
+
+    def _changed(self, timeout):
+        if not select.select([self.fd], [], [], max(0, timeout))[0]:
+            return False
+        return any(mask & IN_Q_OVERFLOW or (name and self.match(name))
+                   for mask, name in self._read_events())
+
+    def _read_events(self):
+        """
+        Legge gli eventi disponibili, restituendo per ognuno la maschera e il
+        nome del file.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            position = 0
+            while position < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+                position += EVENT_HEADER.size
+                name = data[position:position + length].rstrip(b"\0")
+                position += length
+                events.append((mask, os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Alternativa ad InotifyWatcher dove inotify non è disponibile: la
+    dimensione e la data di modifica dei file accettati da match vengono
+    controllate ogni WATCH_POLL_INTERVAL secondi; dopo una modifica il
+    controllo viene ripetuto ogni WATCH_DEBOUNCE secondi finché i file non
+    cambiano più.
+    """
+
+    def __init__(self, directory, match=None):
+        self.directory = directory
+        self.match = match if match is not None else lambda name: True
+        self.snapshot = self._snapshot()
+
+    def wait(self, timeout):
+        """
+        Attende al massimo timeout secondi una modifica dei file osservati.
+        Restituisce True se ci sono state modifiche, False altrimenti.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0, min(WATCH_POLL_INTERVAL, deadline - time.monotonic())))
+            snapshot = self._snapshot()
+            if snapshot != self.snapshot:
+                break
+            if time.monotonic() >= deadline:
+                return False
+
+        first_change = time.monotonic()
+        while time.monotonic() - first_change < MAX_DEBOUNCE_TIME:
+            self.snapshot = snapshot
+            time.sleep(WATCH_DEBOUNCE)
+            snapshot = self._snapshot()
+            if snapshot == self.snapshot:
+                break
+        self.snapshot = snapshot
+        return True
+
+    def _snapshot(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if self.match(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def close(self):
+        pass
+
+
+def folderWatcher(directory, match=None):
+    """
+    Restituisce un InotifyWatcher per la cartella, o un PollingWatcher se
+    inotify non è disponibile.
+    """
+    try:
+        return InotifyWatcher(directory, match)
+    except (OSError, AttributeError) as e:
+        logging.warning("inotify non disponibile (%s), la cartella %s viene controllata "
+                        "ogni %s secondi", e, directory, WATCH_POLL_INTERVAL)
+        return PollingWatcher(directory, match)
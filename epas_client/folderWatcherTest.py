@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: folderWatcherTest.py                                                  #
+# Description: test relativi all'osservazione della cartella locale delle    #
+# timbrature.                                                                 #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from folderWatcher import InotifyWatcher, PollingWatcher
+
+
+class FolderWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stampingFile = os.path.join(self.tmpdir.name, "AT01")
+        with open(self.stampingFile, "w") as f:
+            f.write("riga 1\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def append(self, fileName, lines, delay=0):
+        with open(os.path.join(self.tmpdir.name, fileName), "a") as f:
+            for line in lines:
+                time.sleep(delay)
+                f.write(line)
+                f.flush()
+
+    def check_watcher(self, watcherClass):
+        watcher = watcherClass(self.tmpdir.name, lambda name: name.startswith("AT"))
+        try:
+            self.assertFalse(watcher.wait(0.2))
+
+            # I file che non contengono timbrature vengono ignorati
+            self.append("README", ["x\n"])
+            self.assertFalse(watcher.wait(1))
+
+            # Una raffica di scritture viene segnalata una sola volta
+            writer = threading.Thread(target=self.append, args=("AT01", ["riga 2\n", "riga 3\n"], 0.02))
+            writer.start()
+            start = time.monotonic()
+            self.assertTrue(watcher.wait(5))
+            self.assertLess(time.monotonic() - start, 1)
+            writer.join()
+            self.assertFalse(watcher.wait(1))
+
+            self.append("AT02", ["riga 1\n"])
+            self.assertTrue(watcher.wait(5))
+        finally:
+            watcher.close()
+
+    def test_inotify_watcher(self):
+        self.check_watcher(InotifyWatcher)
+
+    def test_polling_watcher(self):
+        self.check_watcher(PollingWatcher)
@@ -37,20 +37,26 @@
 #                                                                             #
 ###############################################################################
 
+import itertools
 import logging
 import os
-from ftplib import FTP
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import error_perm
 from fileInfoManager import FileInfoManager
+from stampingSource import StampingSource
+from remoteCatalog import RemoteCatalog
+from lineSplitter import LineSplitter, openAuditCopy
+from sessionManager import sessionManager, FTPSession, FTP_CONNECTION_ERRORS
 
-from config import FTP_SERVER_NAME, FTP_SERVER_PORT, FTP_USERNAME,  \
-    FTP_PASSWORD, FTP_SERVER_DIR, FTP_FILE_PREFIX, FTP_FILE_SUFFIX, \
-    FTP_CONNECTION_TIMEOUT
+from config import RESUME_CHECK_BYTES
     
 from stampingImporter import StampingImporter  
 from fileUtils import FileUtils
 
-from config import STAMPINGS_DIR, DATA_DIR, BAD_STAMPINGS_FILE, \
-    PARSING_ERROR_FILE, FILE_LAST_DOWNLOAD, SEND_ALL_STAMPINGS_EVERYTIME
+from config import BAD_STAMPINGS_FILE, \
+    PARSING_ERROR_FILE, FILE_LAST_DOWNLOAD, SEND_ALL_STAMPINGS_EVERYTIME, DOWNLOAD_PREFETCH_FILES, \
+    REMOTE_CATALOG_FILE, STREAM_REMOTE_FILES, STREAM_AUDIT_COPY
 
 class FTPDownloader:
     """
@@ -58,37 +64,106 @@ class FTPDownloader:
     FTP remoto.
     """
     
-    def __init__(self):
-        self.bad_stampings_path = os.path.join(DATA_DIR, BAD_STAMPINGS_FILE)
-        self.parsing_errors_path = os.path.join(DATA_DIR, PARSING_ERROR_FILE)
-        self.file_last_download = os.path.join(DATA_DIR, FILE_LAST_DOWNLOAD)
+    def __init__(self, source=None, send=None):
+        """
+        @param source: sorgente dei file di timbrature, di default quella
+            definita dai parametri globali della configurazione
+        @param send: funzione di invio delle timbrature interpretate, di
+            default StampingImporter.sendParsedStampingsOnEpas, chiamata con le
+            timbrature, gli errori di parsing e il nome della sorgente
+        """
+        self.source = source if source is not None else StampingSource()
+        self.send = send if send is not None else StampingImporter.sendParsedStampingsOnEpas
+        self.bad_stampings_path = os.path.join(self.source.dataDir, BAD_STAMPINGS_FILE)
+        self.parsing_errors_path = os.path.join(self.source.dataDir, PARSING_ERROR_FILE)
+        self.file_last_download = os.path.join(self.source.dataDir, FILE_LAST_DOWNLOAD)
         self.fileInfoManager = FileInfoManager(self.file_last_download)
+        self.catalog = RemoteCatalog(os.path.join(self.source.dataDir, REMOTE_CATALOG_FILE))
+        self.catalogUpdated = False
         self.loggedIn = False
 
     def _login(self):
         """
         Effettua il login sul server FTP e si sposta nella directory dove
-        sono presenti le timbrature
+        sono presenti le timbrature. In esecuzione continua viene riutilizzata
+        la connessione aperta nei controlli precedenti.
         """
-        self.ftp = FTP()
-        self.ftp.connect(FTP_SERVER_NAME, FTP_SERVER_PORT, FTP_CONNECTION_TIMEOUT)        
-        self.ftp.login(FTP_USERNAME, FTP_PASSWORD)
+        self.session = sessionManager.acquire(self.source, FTPSession)
+        self.ftp = self.session.ftp
         self.loggedIn = True
-        self.ftp.cwd(FTP_SERVER_DIR)
+
+    def _reconnect(self):
+        """
+        Riapre la connessione FTP interrotta.
+        """
+        self.ftp = sessionManager.reconnect(self.session).ftp
 
     def quit_ftp(self):
         """
-        Quit, and close the FTP connection.
+        Quit, and close the FTP connection (mantenuta aperta in esecuzione
+        continua).
         """
-        self.ftp.quit()
+        sessionManager.release(self.session)
+        self.loggedIn = False
 
     def _retrieve_file(self, file_name):
         """
-        Scarica via FTP il file richiesto come parametro e lo mette nella "downloadDir"
+        Scarica via FTP il file richiesto come parametro e lo mette nella "downloadDir".
+        Se il file è già stato scaricato vengono scaricati solo i byte
+        aggiunti sul server (RETR preceduto da REST), insieme agli ultimi
+        RESUME_CHECK_BYTES byte già presenti per verificare che il file non sia
+        stato riscritto. Se il file sul server è più piccolo della copia locale
+        o è stato riscritto, viene scaricato interamente.
+        I file non modificati secondo il catalogo del server non vengono
+        scaricati.
+        Restituisce True se il contenuto già scaricato del file è cambiato.
         """
-        with open("%s/%s" % (STAMPINGS_DIR, file_name), 'wb') as f:
+        file_path = os.path.join(self.source.stampingsDir, file_name)
+        if self.catalog.isUnchanged(file_name, file_path):
+            logging.info("Il file %s non è cambiato dall'ultimo download", file_name)
+            return False
+
+        local_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+        if local_size > 0:
+            try:
+                if self._retrieve_appended_bytes(file_name, file_path, local_size):
+                    return False
+                logging.warning("Il file %s sul server è stato riscritto o è più piccolo della "
+                                "copia locale, viene scaricato interamente", file_name)
+            except error_perm as e:
+                logging.warning("Impossibile scaricare solo la parte aggiunta del file %s (%s), "
+                                "viene scaricato interamente", file_name, e)
+                local_size = 0
+
+        with open(file_path, 'wb') as f:
             self.ftp.retrbinary("RETR %s" % (file_name,), f.write)
         logging.info("Scaricato file %s", file_name)
+        return local_size > 0
+
+    def _retrieve_appended_bytes(self, file_name, file_path, local_size):
+        """
+        Aggiunge alla copia locale del file i byte successivi a local_size.
+        Restituisce False, senza modificare la copia locale, se il file sul
+        server è più piccolo o non termina con gli stessi byte della copia
+        locale.
+        """
+        remote_size = self.ftp.size(file_name)
+        if remote_size is None or remote_size < local_size:
+            return False
+
+        check = min(local_size, RESUME_CHECK_BYTES)
+        data = bytearray()
+        self.ftp.retrbinary("RETR %s" % (file_name,), data.extend, rest=local_size - check)
+
+        with open(file_path, 'rb+') as f:
+            f.seek(local_size - check)
+            if f.read(check) != data[:check]:
+                return False
+            f.write(data[check:])
+
+        logging.info("Scaricati %d byte aggiunti al file %s", len(data) - check, file_name)
+        return True
 
     def check_new_stamping_files(self):
         """
@@ -106,22 +181,25 @@ class FTPDownloader:
                 last_file_name = stamping_file_names[-1]
             else:
                 logging.error("Non sono stati trovati file con le timbrature sul server. " +
-                              "Prefisso del file: %s, suffisso: %s", FTP_FILE_PREFIX, FTP_FILE_SUFFIX)
+                              "Prefisso del file: %s, suffisso: %s", self.source.filePrefix, self.source.fileSuffix)
                 return
                         
             logging.warning("File utilizzato per prelevare le timbrature odierne: %s", last_file_name)
             size = 0
             last_line = 0
+            offset = 0
 
         else:
-            last_file_name, size, last_line = self.fileInfoManager.getLastDownloadInfo()
+            last_file_name, size, last_line, offset = self.fileInfoManager.getLastDownloadInfo()
             logging.info("Ultimo file scaricato: %s di %s byte. Ultima riga "
                          "processata la numero %s.", last_file_name, size, last_line)
 
         if not self.loggedIn:
             self._login()
 
-        ftp_size = self.ftp.size(last_file_name)
+        ftp_size = self.catalog.size(last_file_name) if last_file_name in self._get_stamping_file_names() else None
+        if ftp_size is None:
+            ftp_size = self.ftp.size(last_file_name)
         if ftp_size != size:
             logging.debug("Il file %s risulta di dimensione diversa rispetto "
                           "all'ultimo download, dimensione sul server FTP = %s,"
@@ -130,11 +208,17 @@ class FTPDownloader:
             if SEND_ALL_STAMPINGS_EVERYTIME:
                 # Invia tutte le timbrature presenti nel file
                 from_line = None
+                offset = None
             else:
                 # Scaricato e processato a partire dalla prossima riga rispetto
                 # a last_line
                 from_line = last_line + 1
-            self._retrieve_and_process_file(last_file_name, from_line)
+
+            # Se sono presenti file più recenti il file non verrà più
+            # aggiornato, viene quindi processata anche un'eventuale ultima
+            # riga non terminata
+            complete = self._get_stamping_file_names()[-1:] != [last_file_name]
+            self._retrieve_and_process_file(last_file_name, from_line, offset, complete)
 
         # Vengono cercati e processati eventuali nuovi file con timbrature
         # presenti sul server.
@@ -142,46 +226,78 @@ class FTPDownloader:
         # passato come parametro
         self._check_new_files_on_server(last_file_name)
 
-    def _raw_stampings(self, file_name, from_line=None):
+        self.catalog.save()
+
+    def _raw_stampings(self, file_name, from_line=None, offset=None, complete=False):
         """
         @param file_name: il path assoluto del file da cui prelevare la lista delle timbrature
         @param from_line: il numero di riga da cui prelevare la timbratura
-         
-        Restituisce la liste della timbrature prelevate dal file passato a partire
-        dalla lina indicata.
+        @param offset: la posizione in byte da cui leggere il file, se presente
+            il file non viene riletto dall'inizio
+        @param complete: se True viene processata anche un'eventuale ultima riga
+            non terminata dal fine riga, altrimenti rimandata alla prossima lettura
+
+        Restituisce il testo delle timbrature prelevate dal file passato a partire
+        dalla riga (o dalla posizione) indicata, il numero di righe del file
+        processate e la posizione in byte successiva all'ultima riga processata.
         """
-        
-        f = open(file_name, "r")
         logging.info("Processo il file %s per estrarne le timbrature", file_name)
 
-        #Questo metodo di lettura delle righe toglie anche gli \n di fine riga
-        lines = f.read().splitlines()
+        first_line = from_line - 1 if from_line is not None and from_line > 0 else 0
 
-        #Numero di righe totali del file da processare
-        number_of_lines = len(lines)
+        if offset is not None and offset > os.path.getsize(file_name):
+            logging.warning("Il file %s è più piccolo della posizione dell'ultima riga processata (%d byte), "
+                            "il file viene processato dall'inizio", file_name, offset)
+            offset, first_line = 0, 0
 
-        if from_line is not None and from_line > 0:
-            logging.info("Il file %s viene processato a partire dalla riga %s", file_name, from_line)
-            if from_line > len(lines):
-                logging.info("Il file contiene solamente %d righe, è stato richiesto di processare la riga %d. Riga non processata, raggiunta fine del file.", len(lines), from_line)
-                return number_of_lines
-            else:
-                lines = lines[from_line-1:]
-        return lines, number_of_lines
+        if offset is not None:
+            logging.info("Il file %s viene processato a partire dalla riga %s (byte %d)",
+                         file_name, first_line + 1, offset)
+            text, number_of_lines, offset = FileUtils.read_text(file_name, offset, complete=complete)
+            last_line = first_line + number_of_lines
+        else:
+            if first_line > 0:
+                logging.info("Il file %s viene processato a partire dalla riga %s", file_name, from_line)
+            # Le righe scartate sono comprese nel numero di righe lette
+            text, last_line, offset = FileUtils.read_text(file_name, 0, first_line, complete)
+
+        return text, last_line, offset
     
-    def _retrieve_and_process_file(self, file_name, from_line=None):
+    def _retrieve_and_process_file(self, file_name, from_line=None, offset=None, complete=False):
         """
         Scarica il file via FTP e lo importa in Epas.
         Restituisce il numero dell'ultima riga processata del file.
         """
         logging.info("Process il file %s", file_name)
-        self._retrieve_file(file_name)
-        file_path = "%s/%s" % (STAMPINGS_DIR, file_name)
+        if STREAM_REMOTE_FILES:
+            self._send_and_save(file_name, *self._stream_file(file_name, from_line, offset, complete))
+            return
+
+        if self._retrieve_file(file_name) and (from_line is not None or offset is not None):
+            logging.warning("Il file %s è stato modificato, viene processato dall'inizio", file_name)
+            from_line, offset = None, None
+        self._process_file(file_name, from_line, offset, complete)
+
+    def _process_file(self, file_name, from_line=None, offset=None, complete=False):
+        """
+        Importa in Epas le timbrature del file già scaricato e salva le
+        informazioni sull'ultimo file processato.
+        """
+        file_path = os.path.join(self.source.stampingsDir, file_name)
         
-        lines, last_line_processed = self._raw_stampings(file_path, from_line)
+        text, last_line_processed, offset = self._raw_stampings(file_path, from_line, offset, complete)
         
-        stamping_importer = StampingImporter()
-        bad_stampings, parsing_errors = stamping_importer.sendStampingsOnEpas(lines)
+        stampings, parsing_errors = StampingImporter.parse_buffer(text, self.source.stampingFormat)
+        self._send_and_save(file_name, stampings, parsing_errors, last_line_processed, offset,
+                            os.path.getsize(file_path))
+
+    def _send_and_save(self, file_name, stampings, parsing_errors, last_line_processed, offset, file_size):
+        """
+        Invia ad Epas le timbrature interpretate del file, salva quelle da
+        re-inviare e gli errori di parsing e le informazioni sull'ultimo file
+        processato.
+        """
+        bad_stampings, parsing_errors = self.send(stampings, parsing_errors, self.source.name)
         
         if len(bad_stampings) > 0:
             # Rimuove eventuali duplicati
@@ -191,8 +307,61 @@ class FTPDownloader:
         if len(parsing_errors) > 0:
             FileUtils.storestamping(self.parsing_errors_path, parsing_errors)        
             
-        file_size = os.path.getsize(file_path)
-        self.fileInfoManager.save(file_name, file_size, last_line_processed)
+        self.fileInfoManager.save(file_name, file_size, last_line_processed, offset)
+
+    def _stream_file(self, file_name, from_line=None, offset=None, complete=False):
+        """
+        Scarica il file senza salvarlo su disco (STREAM_REMOTE_FILES): a
+        partire dalla posizione indicata, o dall'inizio saltando le righe
+        precedenti a from_line, i byte ricevuti da RETR (preceduto da REST) vengono
+        divisi in righe da un LineSplitter ed interpretati man mano che
+        arrivano. Con STREAM_AUDIT_COPY i byte ricevuti vengono salvati anche
+        in STAMPINGS_DIR.
+        Un file riscritto viene riconosciuto solo se sul server è più piccolo
+        della posizione dell'ultima riga processata.
+        Restituisce le timbrature interpretate, gli errori di parsing,
+        l'ultima riga processata, la posizione in byte successiva a
+        quest'ultima e la dimensione del file sul server.
+        """
+        first_line = from_line - 1 if from_line is not None and from_line > 0 else 0
+        start = offset if offset is not None else 0
+
+        remote_size = self.catalog.size(file_name)
+        if remote_size is None:
+            remote_size = self.ftp.size(file_name)
+        if remote_size is not None and start > remote_size:
+            logging.warning("Il file %s sul server è più piccolo della posizione dell'ultima riga "
+                            "processata (%d byte), il file viene processato dall'inizio", file_name, start)
+            start, first_line = 0, 0
+        skip_lines = first_line if offset is None else 0
+
+        stampings, parsing_errors = [], []
+
+        def parse(text):
+            parsed, errors = StampingImporter.parse_buffer(text, self.source.stampingFormat)
+            stampings.extend(parsed)
+            parsing_errors.extend(errors)
+
+        tee = openAuditCopy(os.path.join(self.source.stampingsDir, file_name), start) \
+            if STREAM_AUDIT_COPY else None
+        splitter = LineSplitter(parse, skip_lines, tee)
+        logging.info("Il file %s viene scaricato ed interpretato a partire dal byte %d", file_name, start)
+        try:
+            self.ftp.retrbinary("RETR " + file_name, splitter.feed, rest=start or None)
+        finally:
+            if tee is not None:
+                tee.close()
+
+        splitter.close(complete)
+        if splitter.pending:
+            logging.info("Ultima riga del file %s incompleta, verrà processata "
+                         "alla prossima lettura", file_name)
+
+        # Senza posizione in byte l'ultima riga processata è data dalle righe
+        # effettivamente scartate, che possono essere meno di first_line
+        last_line = (first_line if skip_lines == 0 else splitter.skipped) + splitter.lines
+        return stampings, parsing_errors, last_line, \
+            start + splitter.consumed, start + splitter.received
 
     def _check_new_files_on_server(self, from_file_name):
         """
@@ -206,40 +375,107 @@ class FTPDownloader:
         if len(new_stamping_file_names) == 0:
             logging.info("Non ci sono sul server file di timbrature più nuovi di %s", from_file_name)
             return
-        for fileName in new_stamping_file_names:
-            self._retrieve_and_process_file(fileName)
+
+        if DOWNLOAD_PREFETCH_FILES <= 0 or len(new_stamping_file_names) == 1:
+            for fileName in new_stamping_file_names:
+                self._retrieve_and_process_file(fileName, complete=fileName != stamping_file_names[-1])
+            return
+
+        # I download vengono effettuati da un unico thread, che utilizza la
+        # connessione FTP mentre il thread corrente invia le timbrature del
+        # file precedente; i file vengono processati, e le informazioni
+        # sull'ultimo file salvate, sempre nell'ordine dei file
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            file_names = iter(new_stamping_file_names)
+            downloads = deque((fileName, executor.submit(self._prefetch_file, fileName,
+                                                          fileName != stamping_file_names[-1]))
+                              for fileName in itertools.islice(file_names, DOWNLOAD_PREFETCH_FILES + 1))
+            while downloads:
+                fileName, download = downloads.popleft()
+                result = download.result()
+                for nextFileName in itertools.islice(file_names, 1):
+                    downloads.append((nextFileName, executor.submit(self._prefetch_file, nextFileName,
+                                                                    nextFileName != stamping_file_names[-1])))
+                logging.info("Process il file %s", fileName)
+                if STREAM_REMOTE_FILES:
+                    self._send_and_save(fileName, *result)
+                else:
+                    self._process_file(fileName, complete=fileName != stamping_file_names[-1])
+
+    def _prefetch_file(self, file_name, complete):
+        """
+        Download anticipato di un nuovo file: con STREAM_REMOTE_FILES il file
+        viene anche interpretato e ne vengono restituite le timbrature.
+        """
+        if STREAM_REMOTE_FILES:
+            return self._stream_file(file_name, complete=complete)
+        self._retrieve_file(file_name)
 
     def import_all_stamping_files(self):
         """
         Importa le timbrature di tutti i file che cominciano con il prefisso FTP_FILE_PREFIX
+        (recupero dello storico). I file vengono interpretati in parallelo
+        tramite StampingImporter.sendFilesOnEpas.
         """
         if not self.loggedIn:
             self._login()
 
         stamping_file_names = self._get_stamping_file_names()
 
-        for fileName in stamping_file_names[0:5]:
+        for fileName in stamping_file_names:
             self._retrieve_file(fileName)
 
-        stamping_importer = StampingImporter()
-        for fileName in stamping_file_names[0:5]:
-            stamping_importer.sendStampingsOnEpas("%s/%s" % (STAMPINGS_DIR, fileName))
+        bad_stampings, parsing_errors = StampingImporter.sendFilesOnEpas(
+            [os.path.join(self.source.stampingsDir, fileName) for fileName in stamping_file_names],
+            self.source.stampingFormat, self.source.name)
+
+        if len(bad_stampings) > 0:
+            # Rimuove eventuali duplicati
+            bad_stampings = set(bad_stampings)
+            FileUtils.storestamping(self.bad_stampings_path, bad_stampings)
+
+        if len(parsing_errors) > 0:
+            FileUtils.storestamping(self.parsing_errors_path, parsing_errors)
+
+        self.catalog.save()
 
     def _get_stamping_file_names(self):
         """
-        Restituisce la lista dei nomi di file di timbrature presenti in FTP
+        Restituisce la lista dei nomi di file di timbrature presenti in FTP.
+        La directory remota viene elencata una sola volta per esecuzione,
+        aggiornando il catalogo dei file.
         """
-        try:            
-            file_names = self.ftp.nlst()
-        except:
-            self.ftp = FTP(FTP_SERVER_NAME)
-            self._login()
-            file_names = self.ftp.nlst()
-        file_names.sort()
+        if not self.catalogUpdated:
+            if not self.loggedIn:
+                self._login()
+            try:
+                entries = self._list_directory()
+            except FTP_CONNECTION_ERRORS as e:
+                logging.warning("Errore nell'elenco dei file sul server FTP (%s), riconnessione in corso", e)
+                self._reconnect()
+                entries = self._list_directory()
+
+            # Solamente i file con il prefisso "FTP_FILE_PREFIX" sono quelli che ci
+            # interessano per le timbrature
+            self.catalog.update((fileName, attributes) for fileName, attributes in entries
+                                if fileName.startswith(self.source.filePrefix) and fileName.endswith(self.source.fileSuffix))
+            self.catalogUpdated = True
 
-        # Solamente i file con il prefisso "FTP_FILE_PREFIX" sono quelli che ci
-        # interessano per le timbrature
-        return [fileName for fileName in file_names if fileName.startswith(FTP_FILE_PREFIX) and fileName.endswith(FTP_FILE_SUFFIX)]
+        return self.catalog.names()
+
+    def _list_directory(self):
+        """
+        Elenca i file della directory remota con dimensione e data di ultima
+        modifica (MLSD). Se il server non supporta MLSD viene utilizzato NLST,
+        senza dimensione e data dei file.
+        """
+        try:
+            return [(fileName, (int(facts["size"]) if "size" in facts else None, facts.get("modify")))
+                    for fileName, facts in self.ftp.mlsd(facts=["type", "size", "modify"])
+                    if facts.get("type", "file") == "file"]
+        except error_perm as e:
+            logging.debug("Comando MLSD non supportato dal server FTP (%s), utilizzato NLST", e)
+            return [(fileName, (None, None)) for fileName in self.ftp.nlst()]
 
 if __name__ == "__main__":
     ftp = FTPDownloader()
@@ -249,7 +485,7 @@ if __name__ == "__main__":
     stamping_file = file_names[-1]
     ftp._retrieve_file(stamping_file)
     
-    file_path = "%s/%s" % (STAMPINGS_DIR, stamping_file)
-    lines, last_line_processed = ftp._raw_stampings(file_path)
+    file_path = "%s/%s" % (ftp.source.stampingsDir, stamping_file)
+    text, last_line_processed, offset = ftp._raw_stampings(file_path)
     ftp.check_new_stamping_files()
     
\ No newline at end of file
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: ftpDownloaderTest.py                                                  #
+# Description: test relativi al download incrementale dei file via FTP       #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import threading
+import unittest
+
+import ftpDownloader
+from ftpDownloader import FTPDownloader
+from remoteCatalog import RemoteCatalog
+from stampingSource import StampingSource
+
+
+class FakeFTP:
+    """
+    Server FTP simulato: restituisce il contenuto di files a partire dalla
+    posizione indicata con REST, registrando i byte trasferiti.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.transferred = 0
+        self.modify = "20240101000000"
+
+    def size(self, file_name):
+        return len(self.files[file_name])
+
+    def mlsd(self, facts=[]):
+        yield ".", {"type": "cdir"}
+        for file_name, data in self.files.items():
+            yield file_name, {"type": "file", "size": str(len(data)), "modify": self.modify}
+
+    def retrbinary(self, cmd, callback, rest=None):
+        data = self.files[cmd.split(" ", 1)[1]][rest or 0:]
+        self.transferred += len(data)
+        callback(data)
+
+
+class FTPDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = StampingSource("test", {"FTP_FILE_PREFIX": "AT", "FTP_FILE_SUFFIX": ""})
+        self.source.dataDir = self.source.stampingsDir = self.tmpdir.name
+        self.downloader = FTPDownloader(self.source)
+        self.downloader.ftp = FakeFTP({"AT01": b"a" * 10000})
+        self.downloader.loggedIn = True
+        self.localFile = os.path.join(self.tmpdir.name, "AT01")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_only_appended_bytes_are_downloaded(self):
+        self.assertFalse(self.downloader._retrieve_file("AT01"))
+        self.downloader.ftp.files["AT01"] += b"b" * 100
+        self.downloader.ftp.transferred = 0
+
+        self.assertFalse(self.downloader._retrieve_file("AT01"))
+        self.assertEqual(self.downloader.ftp.transferred, ftpDownloader.RESUME_CHECK_BYTES + 100)
+        with open(self.localFile, "rb") as f:
+            self.assertEqual(f.read(), b"a" * 10000 + b"b" * 100)
+
+    def test_rewritten_file_is_downloaded_again(self):
+        self.downloader._retrieve_file("AT01")
+        self.downloader.ftp.files["AT01"] = b"c" * 10100
+
+        self.assertTrue(self.downloader._retrieve_file("AT01"))
+        with open(self.localFile, "rb") as f:
+            self.assertEqual(f.read(), b"c" * 10100)
+
+    def test_unchanged_files_are_not_downloaded(self):
+        self.downloader.ftp.files["AT02"] = b"b" * 100
+        self.downloader.ftp.files["README"] = b"x"
+        self.assertEqual(self.downloader._get_stamping_file_names(), ["AT01", "AT02"])
+        self.downloader._retrieve_file("AT01")
+        self.downloader.catalog.save()
+
+        # Esecuzione successiva: AT01 non è cambiato, AT02 ha una nuova data di modifica
+        self.downloader.catalog = RemoteCatalog(self.downloader.catalog.catalogFile)
+        self.downloader.catalogUpdated = False
+        self.downloader.ftp.transferred = 0
+        self.downloader.ftp.modify = "20240102000000"
+        self.downloader._get_stamping_file_names()
+        self.assertFalse(self.downloader._retrieve_file("AT01"))
+        self.assertEqual(self.downloader.ftp.transferred, ftpDownloader.RESUME_CHECK_BYTES)
+
+        self.downloader.catalog.save()
+        self.downloader.catalog = RemoteCatalog(self.downloader.catalog.catalogFile)
+        self.downloader.catalogUpdated = False
+        self.downloader.ftp.transferred = 0
+        self.downloader._get_stamping_file_names()
+        self.assertFalse(self.downloader._retrieve_file("AT01"))
+        self.assertEqual(self.downloader.ftp.transferred, 0)
+
+    def test_next_files_are_downloaded_while_processing(self):
+        fileNames = ["AT01", "AT02", "AT03", "AT04"]
+        downloaded = {fileName: threading.Event() for fileName in fileNames}
+        processed = []
+
+        def retrieveFile(fileName):
+            downloaded[fileName].set()
+
+        def processFile(fileName, complete):
+            # Il file successivo viene scaricato mentre questo viene processato
+            if fileName != fileNames[-1]:
+                nextFileName = fileNames[fileNames.index(fileName) + 1]
+                self.assertTrue(downloaded[nextFileName].wait(5))
+            processed.append((fileName, complete))
+
+        self.downloader._get_stamping_file_names = lambda: fileNames
+        self.downloader._retrieve_file = retrieveFile
+        self.downloader._process_file = processFile
+        self.downloader._check_new_files_on_server("AT01")
+
+        self.assertEqual(processed, [("AT02", True), ("AT03", True), ("AT04", False)])
+
+    def test_streamed_file_is_parsed_without_local_copy(self):
+        self.downloader.ftp.files["AT01"] = b"riga 1\r\nriga 2\nriga 3"
+
+        _, errors, last_line, offset, size = self.downloader._stream_file("AT01")
+        self.assertEqual(errors, ["riga 1", "riga 2"])
+        self.assertEqual((last_line, offset, size), (2, 15, 21))
+        self.assertFalse(os.path.exists(self.localFile))
+
+        self.downloader.ftp.files["AT01"] += b"\nriga 4\n"
+        self.downloader.ftp.transferred = 0
+        _, errors, last_line, offset, size = self.downloader._stream_file("AT01", last_line + 1, offset)
+        self.assertEqual(errors, ["riga 3", "riga 4"])
+        self.assertEqual((last_line, offset, size), (4, 29, 29))
+        self.assertEqual(self.downloader.ftp.transferred, 14)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: lineSplitter.py                                                       #
+# Description: divisione in righe dei byte scaricati dai server FTP/SFTP,     #
+# interpretati man mano che arrivano senza salvare i file su disco.           #
+#                                                                             #
+###############################################################################
+
+import logging
+import os
+
+
+class LineSplitter:
+    """
+    Riceve i blocchi di byte di un download (es. dalla callback di
+    retrbinary) e passa al consumer il testo delle sole righe complete, con i
+    fine riga normalizzati in \\n, man mano che vengono ricevute. Una riga
+    divisa tra due blocchi viene trattenuta fino all'arrivo del fine riga,
+    l'eventuale ultima riga non terminata viene passata al consumer solo
+    chiudendo il LineSplitter con complete=True.
+
+    Le prime skip_lines righe ricevute vengono scartate; i byte ricevuti
+    possono essere copiati anche nel file tee (copia di audit).
+    """
+
+    def __init__(self, consumer, skip_lines=0, tee=None):
+        self.consumer = consumer
+        self.skip_lines = skip_lines
+        self.tee = tee
+        self.pending = b""
+        # Righe passate al consumer
+        self.lines = 0
+        # Righe scartate, meno di skip_lines se il file ne contiene meno
+        self.skipped = 0
+        # Byte delle righe passate al consumer o scartate
+        self.consumed = 0
+        # Byte ricevuti
+        self.received = 0
+
+    def feed(self, data):
+        if self.tee is not None:
+            self.tee.write(data)
+        self.received += len(data)
+
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            self.pending += data
+            return
+        chunk = self.pending + data[:end] if self.pending else data[:end]
+        self.pending = data[end:]
+        self._emit(chunk)
+
+    def close(self, complete=False):
+        """
+        Termina il download: con complete l'eventuale ultima riga non
+        terminata viene passata al consumer, altrimenti viene lasciata alla
+        prossima lettura.
+        """
+        if self.pending and complete:
+            chunk, self.pending = self.pending, b""
+            self._emit(chunk)
+
+    def _emit(self, chunk):
+        self.consumed += len(chunk)
+        if self.skip_lines > 0:
+            position = 0
+            while self.skip_lines > 0 and position < len(chunk):
+                newline = chunk.find(b"\n", position)
+                position = len(chunk) if newline < 0 else newline + 1
+                self.skip_lines -= 1
+                self.skipped += 1
+            chunk = chunk[position:]
+            if not chunk:
+                return
+
+        self.lines += chunk.count(b"\n") + (0 if chunk.endswith(b"\n") else 1)
+        self.consumer(chunk.decode('utf-8', 'replace').replace('\r\n', '\n'))
+
+
+def openAuditCopy(file_path, start):
+    """
+    Apre la copia su disco di un file scaricato a partire dal byte start,
+    troncata a start e posizionata alla fine per aggiungere i byte ricevuti.
+    Restituisce None se la copia non contiene tutti i byte precedenti a
+    start (es. copia di audit attivata dopo l'inizio del file).
+    """
+    local_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    if local_size < start:
+        logging.warning("La copia di audit del file %s non contiene i byte precedenti "
+                        "al download (%d byte su %d), non viene aggiornata", file_path, local_size, start)
+        return None
+
+    tee = open(file_path, 'r+b' if local_size > 0 else 'wb')
+    tee.seek(start)
+    tee.truncate()
+    return tee
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: lineSplitterTest.py                                                   #
+# Description: test relativi alla divisione in righe dei byte scaricati      #
+#                                                                             #
+###############################################################################
+
+import io
+import unittest
+
+from lineSplitter import LineSplitter
+
+
+class LineSplitterTest(unittest.TestCase):
+    def setUp(self):
+        self.texts = []
+
+    def test_lines_split_across_chunks(self):
+        splitter = LineSplitter(self.texts.append)
+        for data in [b"riga 1\r", b"\nri", b"ga 2\nriga", b" 3"]:
+            splitter.feed(data)
+        splitter.close()
+
+        self.assertEqual("".join(self.texts), "riga 1\nriga 2\n")
+        self.assertEqual(splitter.lines, 2)
+        self.assertEqual(splitter.consumed, 15)
+        self.assertEqual(splitter.received, 21)
+        self.assertEqual(splitter.pending, b"riga 3")
+
+    def test_last_line_is_emitted_when_complete(self):
+        splitter = LineSplitter(self.texts.append)
+        splitter.feed(b"riga 1\nriga 2")
+        splitter.close(complete=True)
+
+        self.assertEqual(self.texts, ["riga 1\n", "riga 2"])
+        self.assertEqual(splitter.lines, 2)
+        self.assertEqual(splitter.consumed, splitter.received)
+
+    def test_skipped_lines(self):
+        splitter = LineSplitter(self.texts.append, skip_lines=2)
+        for data in [b"riga 1\nri", b"ga 2\nriga 3\n"]:
+            splitter.feed(data)
+
+        self.assertEqual(self.texts, ["riga 3\n"])
+        self.assertEqual(splitter.lines, 1)
+        self.assertEqual(splitter.skipped, 2)
+        self.assertEqual(splitter.consumed, 21)
+
+    def test_skip_more_lines_than_file(self):
+        splitter = LineSplitter(self.texts.append, skip_lines=5)
+        splitter.feed(b"riga 1\nriga 2\n")
+        splitter.close(True)
+
+        self.assertEqual(self.texts, [])
+        self.assertEqual((splitter.lines, splitter.skipped), (0, 2))
+
+    def test_tee_receives_all_bytes(self):
+        tee = io.BytesIO()
+        splitter = LineSplitter(self.texts.append, tee=tee)
+        splitter.feed(b"riga 1\nriga")
+        splitter.close()
+
+        self.assertEqual(tee.getvalue(), b"riga 1\nriga")
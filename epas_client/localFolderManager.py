@@ -32,13 +32,13 @@ import logging
 import os
 
 from fileInfoManager import FileInfoManager
-from config import FTP_FILE_PREFIX, FTP_FILE_SUFFIX
+from stampingSource import StampingSource
 
 from stampingImporter import StampingImporter
 from fileUtils import FileUtils
     
-from config import  DATA_DIR, BAD_STAMPINGS_FILE, \
-    PARSING_ERROR_FILE, STAMPINGS_DIR, FILE_LAST_DOWNLOAD, \
+from config import  BAD_STAMPINGS_FILE, \
+    PARSING_ERROR_FILE, FILE_LAST_DOWNLOAD, \
     SEND_ALL_STAMPINGS_EVERYTIME
 
 class LocalFolderManager:
@@ -46,10 +46,19 @@ class LocalFolderManager:
     Classe per il download dei file contenenti le timbrature del sistema della Tecnosoftware
     """
     
-    def __init__(self):
-        self.bad_stampings_path = os.path.join(DATA_DIR, BAD_STAMPINGS_FILE)
-        self.parsing_errors_path = os.path.join(DATA_DIR, PARSING_ERROR_FILE) 
-        self.file_last_download = os.path.join(DATA_DIR, FILE_LAST_DOWNLOAD)
+    def __init__(self, source=None, send=None):
+        """
+        @param source: sorgente dei file di timbrature, di default quella
+            definita dai parametri globali della configurazione
+        @param send: funzione di invio delle timbrature interpretate, di
+            default StampingImporter.sendParsedStampingsOnEpas, chiamata con le
+            timbrature, gli errori di parsing e il nome della sorgente
+        """
+        self.source = source if source is not None else StampingSource()
+        self.send = send if send is not None else StampingImporter.sendParsedStampingsOnEpas
+        self.bad_stampings_path = os.path.join(self.source.dataDir, BAD_STAMPINGS_FILE)
+        self.parsing_errors_path = os.path.join(self.source.dataDir, PARSING_ERROR_FILE) 
+        self.file_last_download = os.path.join(self.source.dataDir, FILE_LAST_DOWNLOAD)
         self.fileInfoManager = FileInfoManager(self.file_last_download)
         self.loggedIn = False
 
@@ -69,19 +78,20 @@ class LocalFolderManager:
                 last_file_name = stamping_file_names[-1]
             else:
                 logging.error("Non sono stati trovati file con le timbrature sul server. " +
-                              "Prefisso del file: %s, suffisso: %s", FTP_FILE_PREFIX, FTP_FILE_SUFFIX)
+                              "Prefisso del file: %s, suffisso: %s", self.source.filePrefix, self.source.fileSuffix)
                 return
                         
             logging.warning("File utilizzato per prelevare le timbrature odierne: %s", last_file_name)
             size = 0
             last_line = 0
+            offset = 0
 
         else:
-            last_file_name, size, last_line = self.fileInfoManager.getLastDownloadInfo()
+            last_file_name, size, last_line, offset = self.fileInfoManager.getLastDownloadInfo()
             logging.info("Ultimo file scaricato: %s di %s byte. Ultima riga "
                          "processata la numero %s.", last_file_name, size, last_line)
 
-        file_size = os.path.getsize(os.path.join(STAMPINGS_DIR, last_file_name))
+        file_size = os.path.getsize(os.path.join(self.source.stampingsDir, last_file_name))
         if file_size != size:
             logging.debug("Il file %s risulta di dimensione diversa rispetto "
                           "all'ultimo download, dimensione sul filesystem = %s,"
@@ -90,11 +100,17 @@ class LocalFolderManager:
             if SEND_ALL_STAMPINGS_EVERYTIME:
                 # Invia tutte le timbrature presenti nel file
                 from_line = None
+                offset = None
             else:
                 # Scaricato e processato a partire dalla prossima riga rispetto
                 # a last_line
                 from_line = last_line + 1
-            self._retrieve_and_process_file(last_file_name, from_line)
+
+            # Se sono presenti file più recenti il file non verrà più
+            # aggiornato, viene quindi processata anche un'eventuale ultima
+            # riga non terminata
+            complete = self._get_stamping_file_names()[-1:] != [last_file_name]
+            self._retrieve_and_process_file(last_file_name, from_line, offset, complete)
 
         # Vengono cercati e processati eventuali nuovi file con timbrature
         # presenti sul server.
@@ -102,46 +118,54 @@ class LocalFolderManager:
         # passato come parametro
         self._check_new_files_on_server(last_file_name)
 
-    def _raw_stampings(self, file_name, from_line=None):
+    def _raw_stampings(self, file_name, from_line=None, offset=None, complete=False):
         """
         @param file_name: il path assoluto del file da cui prelevare la lista delle timbrature
         @param from_line: il numero di riga da cui prelevare la timbratura
-         
-        Restituisce la liste della timbrature prelevate dal file passato a partire
-        dalla lina indicata.
+        @param offset: la posizione in byte da cui leggere il file, se presente
+            il file non viene riletto dall'inizio
+        @param complete: se True viene processata anche un'eventuale ultima riga
+            non terminata dal fine riga, altrimenti rimandata alla prossima lettura
+
+        Restituisce il testo delle timbrature prelevate dal file passato a partire
+        dalla riga (o dalla posizione) indicata, il numero di righe del file
+        processate e la posizione in byte successiva all'ultima riga processata.
         """
-        
-        f = open(file_name, "r")
         logging.info("Processo il file %s per estrarne le timbrature", file_name)
 
-        #Questo metodo di lettura delle righe toglie anche gli \n di fine riga
-        lines = f.read().splitlines()
+        first_line = from_line - 1 if from_line is not None and from_line > 0 else 0
 
-        #Numero di righe totali del file da processare
-        number_of_lines = len(lines)
+        if offset is not None and offset > os.path.getsize(file_name):
+            logging.warning("Il file %s è più piccolo della posizione dell'ultima riga processata (%d byte), "
+                            "il file viene processato dall'inizio", file_name, offset)
+            offset, first_line = 0, 0
 
-        if from_line is not None and from_line > 0:
-            logging.info("Il file %s viene processato a partire dalla riga %s", file_name, from_line)
-            if from_line > len(lines):
-                logging.info("Il file contiene solamente %d righe, è stato richiesto di processare la riga %d. Riga non processata, raggiunta fine del file.", len(lines), from_line)
-                return number_of_lines
-            else:
-                lines = lines[from_line-1:]
-        return lines, number_of_lines
+        if offset is not None:
+            logging.info("Il file %s viene processato a partire dalla riga %s (byte %d)",
+                         file_name, first_line + 1, offset)
+            text, number_of_lines, offset = FileUtils.read_text(file_name, offset, complete=complete)
+            last_line = first_line + number_of_lines
+        else:
+            if first_line > 0:
+                logging.info("Il file %s viene processato a partire dalla riga %s", file_name, from_line)
+            # Le righe scartate sono comprese nel numero di righe lette
+            text, last_line, offset = FileUtils.read_text(file_name, 0, first_line, complete)
+
+        return text, last_line, offset
     
-    def _retrieve_and_process_file(self, file_name, from_line=None):
+    def _retrieve_and_process_file(self, file_name, from_line=None, offset=None, complete=False):
         """
         Scarica il file via FTP e lo importa in Epas.
         Restituisce il numero dell'ultima riga processata del file.
         """
         logging.info("Process il file %s", file_name)
         #self._retrieve_file(file_name)
-        file_path = "%s/%s" % (STAMPINGS_DIR, file_name)
+        file_path = os.path.join(self.source.stampingsDir, file_name)
         
-        lines, last_line_processed = self._raw_stampings(file_path, from_line)
+        text, last_line_processed, offset = self._raw_stampings(file_path, from_line, offset, complete)
         
-        stamping_importer = StampingImporter()
-        bad_stampings, parsing_errors = stamping_importer.sendStampingsOnEpas(lines)
+        stampings, parsing_errors = StampingImporter.parse_buffer(text, self.source.stampingFormat)
+        bad_stampings, parsing_errors = self.send(stampings, parsing_errors, self.source.name)
         
         if len(bad_stampings) > 0:
             # Rimuove eventuali duplicati
@@ -151,8 +175,11 @@ class LocalFolderManager:
         if len(parsing_errors) > 0:
             FileUtils.storestamping(self.parsing_errors_path, parsing_errors)        
             
-        file_size = os.path.getsize(file_path)
-        self.fileInfoManager.save(file_name, file_size, last_line_processed)
+        # Come dimensione viene salvata la posizione successiva all'ultima
+        # riga processata: un'ultima riga non terminata o le righe aggiunte
+        # al file durante l'invio vengono processate al prossimo controllo
+        # anche se il file non cresce ulteriormente
+        self.fileInfoManager.save(file_name, offset, last_line_processed, offset)
 
     def _check_new_files_on_server(self, from_file_name):
         """
@@ -167,20 +194,46 @@ class LocalFolderManager:
             logging.info("Non ci sono sul server file di timbrature più nuovi di %s", from_file_name)
             return
         for fileName in new_stamping_file_names:
-            self._retrieve_and_process_file(fileName)
+            self._retrieve_and_process_file(fileName, complete=fileName != stamping_file_names[-1])
+
 
+    def import_all_stamping_files(self):
+        """
+        Importa le timbrature di tutti i file che cominciano con il prefisso FTP_FILE_PREFIX
+        (recupero dello storico). I file vengono interpretati in parallelo
+        tramite StampingImporter.sendFilesOnEpas.
+        """
+        stamping_file_names = self._get_stamping_file_names()
+
+        bad_stampings, parsing_errors = StampingImporter.sendFilesOnEpas(
+            [os.path.join(self.source.stampingsDir, fileName) for fileName in stamping_file_names],
+            self.source.stampingFormat, self.source.name)
+
+        if len(bad_stampings) > 0:
+            # Rimuove eventuali duplicati
+            bad_stampings = set(bad_stampings)
+            FileUtils.storestamping(self.bad_stampings_path, bad_stampings)
+
+        if len(parsing_errors) > 0:
+            FileUtils.storestamping(self.parsing_errors_path, parsing_errors)
 
     def _get_stamping_file_names(self):
         """
         Restituisce la lista dei nomi di file di timbrature presenti in locale/FTP/SFTP
         """
          
-        file_names = os.listdir(STAMPINGS_DIR)
+        file_names = os.listdir(self.source.stampingsDir)
         file_names.sort()
 
         # Solamente i file con il prefisso "FTP_FILE_PREFIX" sono quelli che ci
         # interessano per le timbrature
-        return [fileName for fileName in file_names if fileName.startswith(FTP_FILE_PREFIX) and fileName.endswith(FTP_FILE_SUFFIX)]
+        return [fileName for fileName in file_names if self.is_stamping_file(fileName)]
+
+    def is_stamping_file(self, file_name):
+        """
+        True se il file, dal nome, contiene timbrature
+        """
+        return file_name.startswith(self.source.filePrefix) and file_name.endswith(self.source.fileSuffix)
 
 if __name__ == "__main__":
     manager = LocalFolderManager()
@@ -188,6 +241,6 @@ if __name__ == "__main__":
     print(file_names)
     if file_names:
         stamping_file = file_names[-1]    
-        file_path = "%s/%s" % (STAMPINGS_DIR, stamping_file)
-        lines, last_line_processed = manager._raw_stampings(file_path)
+        file_path = "%s/%s" % (manager.source.stampingsDir, stamping_file)
+        text, last_line_processed, offset = manager._raw_stampings(file_path)
     manager.check_new_stamping_files()
\ No newline at end of file
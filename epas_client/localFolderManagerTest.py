@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: sourcePollerTest.py                                                   #
+# Description: test relativi al controllo contemporaneo di più sorgenti di   #
+# timbrature.                                                                 #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import unittest
+
+from localFolderManager import LocalFolderManager
+from stampingSource import StampingSource
+
+
+class LocalFolderManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        source = StampingSource("test", {"STAMPINGS_SERVER_PROTOCOL": "local",
+                                         "FTP_FILE_PREFIX": "AT", "FTP_FILE_SUFFIX": ""})
+        source.dataDir = source.stampingsDir = self.tmpdir.name
+        self.filePath = os.path.join(self.tmpdir.name, "AT01")
+        self.sent = []
+        self.manager = LocalFolderManager(source, self.send)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def send(self, stampings, parsingErrors, sourceName=None):
+        self.sent.append([line for line, _ in stampings])
+        return [], parsingErrors
+
+    def test_lines_appended_during_send_are_processed(self):
+        with open(self.filePath, "w") as f:
+            f.write("E11000092000013505605031400\nE110000920000135")
+
+        def send(stampings, parsingErrors, sourceName=None):
+            # Il lettore termina l'ultima riga e ne aggiunge una durante l'invio
+            with open(self.filePath, "a") as f:
+                f.write("05605031401\nE11000092000013505605031402\n")
+            self.manager.send = self.send
+            return self.send(stampings, parsingErrors, sourceName)
+
+        self.manager.send = send
+        self.manager.check_new_stamping_files()
+        self.manager.check_new_stamping_files()
+        self.manager.check_new_stamping_files()
+
+        self.assertEqual(self.sent, [["E11000092000013505605031400"],
+                                     ["E11000092000013505605031401", "E11000092000013505605031402"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
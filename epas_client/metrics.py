@@ -29,7 +29,7 @@
 ###############################################################################
 
 from prometheus_client import CollectorRegistry, Summary, Histogram, Gauge, \
-    Info
+    Counter, Info
 from prometheus_client.exposition import basic_auth_handler
 from pathlib import Path
 
@@ -43,6 +43,10 @@ CLIENT_REGISTRY = CollectorRegistry()
 
 METRICS_LABEL_NAMES = ['instance', 'badgeReader', 'ftp_server']
 
+# Le metriche degli invii sono distinte per sorgente di timbrature (STAMPING_SOURCES),
+# con l'etichetta vuota per la sorgente definita dai parametri globali
+SOURCE_METRICS_LABEL_NAMES = METRICS_LABEL_NAMES + ['source']
+
 _CLIENT_INFO = Info('epas_client', 'Tipologia di client e protocollo utilizzato',
                     METRICS_LABEL_NAMES, registry = CLIENT_REGISTRY)
 
@@ -63,21 +67,92 @@ SEND_TIME = _SEND_TIME.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NA
 
 _STAMPINGS_SENT = Gauge('epas_client_stampings_sent_total', 
                         'Timbrature inviate',
-                        METRICS_LABEL_NAMES, 
+                        SOURCE_METRICS_LABEL_NAMES, 
                         registry = CLIENT_REGISTRY)
-STAMPINGS_SENT = _STAMPINGS_SENT.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_STAMPINGS_ALREADY_SENT = Gauge('epas_client_stampings_already_sent_total',
+                                'Timbrature non inviate perché già accettate da ePAS in precedenza',
+                                SOURCE_METRICS_LABEL_NAMES,
+                                registry = CLIENT_REGISTRY)
 
 _BAD_STAMPINGS = Gauge('epas_client_bad_stampings_total', 
                        'Timbrature inviate con problemi',
-                       METRICS_LABEL_NAMES, 
+                       SOURCE_METRICS_LABEL_NAMES, 
                        registry = CLIENT_REGISTRY)
-BAD_STAMPINGS = _BAD_STAMPINGS.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
 
 _PARSING_ERRORS = Gauge('epas_client_parsing_errors_total', 
                         'Timbrature con problemi di parsing',
+                        SOURCE_METRICS_LABEL_NAMES,
+                        registry = CLIENT_REGISTRY)
+
+def sourceMetrics(sourceName=None):
+    """
+    Restituisce le metriche degli invii (timbrature inviate, già inviate,
+    con problemi e con errori di parsing) della sorgente indicata.
+    """
+    labels = (EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME, sourceName or "")
+    return (_STAMPINGS_SENT.labels(*labels), _STAMPINGS_ALREADY_SENT.labels(*labels),
+            _BAD_STAMPINGS.labels(*labels), _PARSING_ERRORS.labels(*labels))
+
+_HTTP_POOL_HITS = Counter('epas_client_http_pool_hits_total',
+                          'Richieste HTTP verso ePAS che hanno riutilizzato una connessione keep-alive',
+                          METRICS_LABEL_NAMES,
+                          registry = CLIENT_REGISTRY)
+HTTP_POOL_HITS = _HTTP_POOL_HITS.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_HTTP_POOL_MISSES = Counter('epas_client_http_pool_misses_total',
+                            'Richieste HTTP verso ePAS che hanno aperto una nuova connessione',
+                            METRICS_LABEL_NAMES,
+                            registry = CLIENT_REGISTRY)
+HTTP_POOL_MISSES = _HTTP_POOL_MISSES.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_SEND_CONCURRENCY_LIMIT = Gauge('epas_client_send_concurrency_limit',
+                                'Numero massimo attuale di invii contemporanei di timbrature',
+                                METRICS_LABEL_NAMES,
+                                registry = CLIENT_REGISTRY)
+SEND_CONCURRENCY_LIMIT = _SEND_CONCURRENCY_LIMIT.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_SEND_RETRIES = Counter('epas_client_send_retries_total',
+                        'Re-invii di timbrature effettuati per errori transitori del server',
                         METRICS_LABEL_NAMES,
                         registry = CLIENT_REGISTRY)
-PARSING_ERRORS = _PARSING_ERRORS.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+SEND_RETRIES = _SEND_RETRIES.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_CIRCUIT_BREAKER_STATE = Gauge('epas_client_circuit_breaker_state',
+                               'Stato del circuit breaker verso ePAS (0 chiuso, 1 aperto, 2 half-open)',
+                               METRICS_LABEL_NAMES,
+                               registry = CLIENT_REGISTRY)
+CIRCUIT_BREAKER_STATE = _CIRCUIT_BREAKER_STATE.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_SEND_THROTTLED_TIME = Counter('epas_client_send_throttled_seconds_total',
+                               'Secondi di attesa degli invii dovuti al limite di frequenza delle richieste',
+                               METRICS_LABEL_NAMES,
+                               registry = CLIENT_REGISTRY)
+SEND_THROTTLED_TIME = _SEND_THROTTLED_TIME.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_PARSE_CACHE_HITS = Counter('epas_client_parse_cache_hits_total',
+                            'Righe di timbrature già interpretate e recuperate dalla cache',
+                            METRICS_LABEL_NAMES,
+                            registry = CLIENT_REGISTRY)
+PARSE_CACHE_HITS = _PARSE_CACHE_HITS.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_PARSE_CACHE_MISSES = Counter('epas_client_parse_cache_misses_total',
+                              'Righe di timbrature non presenti nella cache e quindi interpretate',
+                              METRICS_LABEL_NAMES,
+                              registry = CLIENT_REGISTRY)
+PARSE_CACHE_MISSES = _PARSE_CACHE_MISSES.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_SESSION_RECONNECTS = Counter('epas_client_session_reconnects_total',
+                              'Riconnessioni ai server FTP/SFTP per sessioni interrotte',
+                              METRICS_LABEL_NAMES,
+                              registry = CLIENT_REGISTRY)
+SESSION_RECONNECTS = _SESSION_RECONNECTS.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
+
+_SESSION_LOGIN_TIME = Histogram('epas_client_session_login_seconds',
+                                'Tempi di connessione e login ai server FTP/SFTP',
+                                METRICS_LABEL_NAMES,
+                                registry = CLIENT_REGISTRY)
+SESSION_LOGIN_TIME = _SESSION_LOGIN_TIME.labels(EPAS_REST_USERNAME, BADGE_READER_IP, FTP_SERVER_NAME)
 
 ################# FINE CONFIGURAZIONI METRICHE PROMETHEUS #####################
 
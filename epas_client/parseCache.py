@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: parseCache.py                                                         #
+# Description: cache di dimensione limitata delle timbrature già             #
+# interpretate, indicizzata dalla riga originale.                             #
+#                                                                             #
+###############################################################################
+
+import threading
+from collections import OrderedDict
+
+from metrics import PARSE_CACHE_HITS, PARSE_CACHE_MISSES
+
+
+class ParseCache:
+    """
+    Cache LRU delle timbrature interpretate, indicizzata dalla riga del
+    tracciato. Evita di interpretare più volte la stessa riga quando passa
+    da un componente all'altro (archiviazione, invio, re-invio delle
+    timbrature con problemi).
+    Le timbrature restituite sono condivise tra i chiamanti e non devono
+    essere modificate.
+    I contatori di hit e miss vengono riportati nelle metriche Prometheus
+    tramite publishMetrics(), per non aggiornarle ad ogni riga.
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._published = (0, 0)
+        self._lock = threading.Lock()
+
+    def get(self, line):
+        """
+        Restituisce la timbratura relativa alla riga, None se non presente.
+        """
+        with self._lock:
+            stamping = self.entries.get(line)
+            if stamping is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(line)
+        return stamping
+
+    def peek(self, line):
+        """
+        Come get, ma senza contare hit e miss né aggiornare l'ordine LRU:
+        utilizzata per le righe degli interi file interpretati da
+        parse_buffer, che non vengono inserite nella cache.
+        """
+        with self._lock:
+            return self.entries.get(line)
+
+    def put(self, line, stamping):
+        """
+        Inserisce la timbratura, eliminando le meno recenti oltre maxSize.
+        """
+        with self._lock:
+            self.entries[line] = stamping
+            self.entries.move_to_end(line)
+            if len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def publishMetrics(self):
+        """
+        Aggiorna le metriche con gli hit e i miss dall'ultima pubblicazione.
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            publishedHits, publishedMisses = self._published
+            self._published = (hits, misses)
+        PARSE_CACHE_HITS.inc(hits - publishedHits)
+        PARSE_CACHE_MISSES.inc(misses - publishedMisses)
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: parseCacheTest.py                                                     #
+# Description: test relativi alla cache delle timbrature interpretate         #
+#                                                                             #
+###############################################################################
+
+import unittest
+
+from parseCache import ParseCache
+from metrics import PARSE_CACHE_HITS, PARSE_CACHE_MISSES
+
+
+class ParseCacheTest(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = ParseCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_hits_and_misses_are_published(self):
+        cache = ParseCache(10)
+        hits, misses = PARSE_CACHE_HITS._value.get(), PARSE_CACHE_MISSES._value.get()
+        cache.get("a")
+        cache.put("a", 1)
+        cache.get("a")
+        cache.publishMetrics()
+        cache.publishMetrics()
+        self.assertEqual(PARSE_CACHE_HITS._value.get() - hits, 1)
+        self.assertEqual(PARSE_CACHE_MISSES._value.get() - misses, 1)
+
+    def test_peek_is_not_counted(self):
+        cache = ParseCache(10)
+        cache.put("a", 1)
+        self.assertEqual(cache.peek("a"), 1)
+        self.assertIsNone(cache.peek("b"))
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
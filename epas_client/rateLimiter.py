@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: rateLimiter.py                                                        #
+# Description: limitazione lato client della frequenza delle richieste verso  #
+# il server ePAS, condiviso tra i client di più istituti.                     #
+#                                                                             #
+###############################################################################
+
+import threading
+import time
+
+from metrics import SEND_THROTTLED_TIME
+
+
+class TokenBucket:
+    """
+    Token bucket: consente in media rate richieste al secondo, con picchi
+    fino a burst richieste consecutive.
+    Ogni richiesta prenota un token tramite reserve(), che restituisce i
+    secondi da attendere prima di effettuarla; in questo modo lo stesso
+    limite funziona sia con i thread di invio (acquire) sia con asyncio.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Prenota un token e restituisce i secondi di attesa necessari.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            SEND_THROTTLED_TIME.inc(wait)
+        return wait
+
+    def acquire(self):
+        """
+        Attende, se necessario, il token per effettuare una richiesta.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
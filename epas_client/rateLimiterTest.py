@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: rateLimiterTest.py                                                    #
+# Description: test relativi al limite di frequenza delle richieste ad ePAS   #
+#                                                                             #
+###############################################################################
+
+import unittest
+
+from rateLimiter import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_without_wait(self):
+        bucket = TokenBucket(1, 5)
+        waits = [bucket.reserve() for _ in range(5)]
+        self.assertEqual(waits, [0.0] * 5)
+
+    def test_wait_after_burst(self):
+        bucket = TokenBucket(10, 2)
+        bucket.reserve()
+        bucket.reserve()
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
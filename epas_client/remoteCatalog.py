@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: remoteCatalog.py                                                      #
+# Description: catalogo dei file di timbrature presenti sul server FTP/SFTP, #
+# con dimensione e data di ultima modifica.                                   #
+#                                                                             #
+###############################################################################
+
+import os
+
+
+class RemoteCatalog:
+    """
+    Catalogo dei file di timbrature presenti sul server FTP/SFTP, ottenuto
+    con un unico elenco della directory remota che riporta anche dimensione
+    e data di ultima modifica dei file (MLSD per FTP, listdir_attr per SFTP).
+
+    Il catalogo viene salvato su file al termine di ogni esecuzione: un file
+    con la stessa dimensione e la stessa data di modifica dell'esecuzione
+    precedente, e già scaricato interamente, non viene scaricato di nuovo.
+    Quando il server non fornisce dimensione e data dei file i relativi
+    valori sono None e i file vengono sempre considerati modificati.
+    """
+
+    def __init__(self, catalogFile):
+        self.catalogFile = catalogFile
+        # nome del file -> (dimensione, data di ultima modifica)
+        self.entries = {}
+        self.previous = self._load()
+
+    def _load(self):
+        previous = {}
+        if not os.path.exists(self.catalogFile):
+            return previous
+        with open(self.catalogFile) as f:
+            for row in f:
+                fields = row.rstrip('\n').split('\t')
+                if len(fields) == 3:
+                    previous[fields[0]] = (int(fields[1]), fields[2])
+        return previous
+
+    def update(self, entries):
+        """
+        Sostituisce il catalogo con le coppie (nome, (dimensione, data))
+        dell'ultimo elenco della directory remota.
+        """
+        self.entries = {name: (size, str(mtime) if mtime is not None else None)
+                        for name, (size, mtime) in entries}
+
+    def names(self):
+        """
+        Restituisce i nomi dei file presenti nel catalogo, in ordine alfabetico.
+        """
+        return sorted(self.entries)
+
+    def size(self, name):
+        """
+        Dimensione del file sul server, None se non disponibile.
+        """
+        return self.entries.get(name, (None, None))[0]
+
+    def isUnchanged(self, name, localPath):
+        """
+        True se il file non è cambiato rispetto all'esecuzione precedente ed
+        è già stato scaricato interamente in localPath.
+        """
+        entry = self.entries.get(name)
+        return entry is not None and None not in entry \
+            and self.previous.get(name) == entry \
+            and os.path.exists(localPath) and os.path.getsize(localPath) == entry[0]
+
+    def save(self):
+        """
+        Salva il catalogo, utilizzato come riferimento dall'esecuzione successiva.
+        """
+        tmpFile = self.catalogFile + '.tmp'
+        with open(tmpFile, 'w') as f:
+            for name, (size, mtime) in sorted(self.entries.items()):
+                if size is not None and mtime is not None:
+                    f.write('%s\t%d\t%s\n' % (name, size, mtime))
+        os.replace(tmpFile, self.catalogFile)
+        self.previous = dict(self.entries)
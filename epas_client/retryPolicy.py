@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: retryPolicy.py                                                        #
+# Description: politica di re-invio immediato, durante la stessa esecuzione,  #
+# delle timbrature fallite per errori transitori del server ePAS.             #
+#                                                                             #
+###############################################################################
+
+import logging
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from metrics import SEND_RETRIES
+
+
+def parseRetryAfter(value):
+    """
+    Restituisce i secondi di attesa indicati dall'header HTTP Retry-After,
+    espresso in secondi o come data HTTP, oppure None se assente o non valido.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Backoff esponenziale con "full jitter": il tentativo n-esimo attende un
+    tempo casuale tra 0 e min(maxDelay, baseDelay * 2^n) secondi, rispettando
+    l'eventuale Retry-After indicato dal server.
+    Il numero totale di re-invii in una esecuzione è limitato da budget, in
+    modo che con il server non disponibile il client non resti bloccato a
+    ritentare tutte le timbrature. In esecuzione continua il budget viene
+    ripristinato ad ogni controllo dei file tramite reset.
+    """
+
+    def __init__(self, maxAttempts, baseDelay, maxDelay, budget, retryStatusCodes):
+        self.maxAttempts = maxAttempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.initialBudget = budget
+        self.budget = budget
+        self.retryStatusCodes = retryStatusCodes
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Ripristina il numero di re-invii disponibili.
+        """
+        with self._lock:
+            self.budget = self.initialBudget
+
+    def isRetryable(self, statusCode):
+        """
+        Errori di connessione/timeout (statusCode None) e codici di risposta
+        transitori (RETRY_STATUS_CODES) possono essere ritentati.
+        """
+        return statusCode is None or statusCode in self.retryStatusCodes
+
+    def nextDelay(self, attempt, statusCode, retryAfter=None):
+        """
+        @param attempt: numero di re-invii già effettuati per la timbratura
+        @param statusCode: codice di risposta dell'ultimo invio, None per errori di connessione
+        @param retryAfter: valore dell'header Retry-After dell'ultima risposta
+        @return i secondi da attendere prima del prossimo tentativo, oppure None
+            se la timbratura non deve essere ritentata.
+        """
+        if attempt >= self.maxAttempts or not self.isRetryable(statusCode):
+            return None
+
+        delay = random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt))
+        retryAfter = parseRetryAfter(retryAfter)
+        if retryAfter is not None:
+            if retryAfter > self.maxDelay:
+                logging.info("Retry-After di %.0f secondi superiore al massimo consentito (%s), "
+                             "timbratura non ritentata", retryAfter, self.maxDelay)
+                return None
+            delay = max(delay, retryAfter)
+
+        with self._lock:
+            if self.budget <= 0:
+                return None
+            self.budget -= 1
+
+        SEND_RETRIES.inc()
+        return delay
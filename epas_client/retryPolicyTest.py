@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: retryPolicyTest.py                                                    #
+# Description: test relativi alla politica di re-invio delle timbrature       #
+#                                                                             #
+###############################################################################
+
+import unittest
+
+from retryPolicy import RetryPolicy, parseRetryAfter
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(3, 1, 30, 10, [502, 503, 504])
+
+    def test_delay_is_capped_exponential(self):
+        for attempt in range(3):
+            delay = self.policy.nextDelay(attempt, 502)
+            self.assertTrue(0 <= delay <= min(30, 2 ** attempt))
+
+    def test_no_retry_after_max_attempts(self):
+        self.assertIsNone(self.policy.nextDelay(3, 502))
+
+    def test_no_retry_for_permanent_errors(self):
+        self.assertIsNone(self.policy.nextDelay(0, 404))
+        self.assertIsNotNone(self.policy.nextDelay(0, None))
+
+    def test_retry_after_is_honoured(self):
+        self.assertGreaterEqual(self.policy.nextDelay(0, 503, "5"), 5)
+        self.assertIsNone(self.policy.nextDelay(0, 503, "3600"))
+
+    def test_budget_is_shared(self):
+        policy = RetryPolicy(3, 0, 0, 2, [503])
+        self.assertIsNotNone(policy.nextDelay(0, 503))
+        self.assertIsNotNone(policy.nextDelay(0, 503))
+        self.assertIsNone(policy.nextDelay(0, 503))
+
+    def test_budget_is_reset(self):
+        policy = RetryPolicy(3, 0, 0, 1, [503])
+        self.assertIsNotNone(policy.nextDelay(0, 503))
+        self.assertIsNone(policy.nextDelay(0, 503))
+        policy.reset()
+        self.assertIsNotNone(policy.nextDelay(0, 503))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parseRetryAfter("120"), 120)
+        self.assertEqual(parseRetryAfter("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        self.assertIsNone(parseRetryAfter("domani"))
+        self.assertIsNone(parseRetryAfter(None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: sentLedger.py                                                         #
+# Description: registro locale delle timbrature già accettate da ePAS, usato  #
+# per non re-inviare le stesse righe ad ogni esecuzione.                      #
+#                                                                             #
+###############################################################################
+
+import logging
+import os
+from datetime import date, timedelta
+from threading import Lock
+
+
+class SentLedger:
+    """
+    Registro delle righe di timbrature già accettate dal server ePAS.
+
+    Le righe sono mantenute in memoria in un dizionario (ricerca in tempo
+    costante) e salvate su file, una per riga, insieme alla data in cui sono
+    state registrate. Le righe registrate da più di maxAgeDays giorni vengono
+    eliminate al caricamento del file, o tramite prune in esecuzione
+    continua, e il file viene riscritto in modo da non crescere indefinitamente.
+    """
+
+    def __init__(self, ledgerFile, maxAgeDays):
+        self.ledgerFile = ledgerFile
+        self.maxAgeDays = maxAgeDays
+        # riga normalizzata -> data di registrazione (formato ISO)
+        self.entries = {}
+        # righe registrate nell'esecuzione corrente e non ancora salvate
+        self.added = []
+        self._lock = Lock()
+        self._load()
+
+    @staticmethod
+    def normalize(line):
+        return line.strip()
+
+    def _limit(self):
+        # Le date in formato ISO sono confrontabili come stringhe
+        return (date.today() - timedelta(days=self.maxAgeDays)).isoformat()
+
+    def _load(self):
+        if not os.path.exists(self.ledgerFile):
+            return
+
+        limit = self._limit()
+        rows = 0
+        with open(self.ledgerFile) as f:
+            for row in f:
+                rows += 1
+                day, sep, key = row.rstrip('\n').partition('\t')
+                if sep and day > limit and day > self.entries.get(key, ''):
+                    self.entries[key] = day
+
+        if len(self.entries) < rows:
+            logging.info("Eliminate %d righe scadute o duplicate dal registro delle timbrature inviate %s",
+                         rows - len(self.entries), self.ledgerFile)
+            self._rewrite()
+
+    def prune(self):
+        """
+        Elimina le righe registrate da più di maxAgeDays giorni, riscrivendo
+        il file del registro.
+        """
+        limit = self._limit()
+        with self._lock:
+            expired = [key for key, day in self.entries.items() if day <= limit]
+            if not expired:
+                return
+            for key in expired:
+                del self.entries[key]
+            # Il file riscritto contiene anche le righe non ancora salvate
+            self._rewrite()
+            self.added = []
+        logging.info("Eliminate %d righe scadute dal registro delle timbrature inviate %s",
+                     len(expired), self.ledgerFile)
+
+    def _rewrite(self):
+        tmpFile = self.ledgerFile + '.tmp'
+        with open(tmpFile, 'w') as f:
+            for key, day in self.entries.items():
+                f.write('%s\t%s\n' % (day, key))
+        os.replace(tmpFile, self.ledgerFile)
+
+    def __contains__(self, line):
+        return SentLedger.normalize(line) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, line):
+        """
+        Registra una riga accettata dal server ePAS.
+        """
+        key = SentLedger.normalize(line)
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = date.today().isoformat()
+                self.added.append(key)
+
+    def save(self):
+        """
+        Aggiunge al file del registro le righe registrate dall'ultimo salvataggio.
+        """
+        with self._lock:
+            added, self.added = self.added, []
+        if not added:
+            return
+        with open(self.ledgerFile, 'a') as f:
+            for key in added:
+                f.write('%s\t%s\n' % (self.entries[key], key))
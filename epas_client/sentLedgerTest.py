@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: sentLedgerTest.py                                                     #
+# Description: test relativi al registro delle timbrature già inviate         #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from sentLedger import SentLedger
+
+
+class SentLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ledgerFile = os.path.join(self.tmpdir.name, 'sent_stampings.txt')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_saved_lines_are_reloaded(self):
+        ledger = SentLedger(self.ledgerFile, 5)
+        ledger.add("E11000092000013505605031400\n")
+        ledger.save()
+
+        ledger = SentLedger(self.ledgerFile, 5)
+        self.assertIn("E11000092000013505605031400", ledger)
+        self.assertNotIn("E11000092000013505605031401", ledger)
+
+    def test_expired_lines_are_pruned(self):
+        old = (date.today() - timedelta(days=10)).isoformat()
+        with open(self.ledgerFile, 'w') as f:
+            f.write('%s\tE11000092000013505605031400\n' % old)
+            f.write('%s\tE11000092000013505605031401\n' % date.today().isoformat())
+
+        ledger = SentLedger(self.ledgerFile, 5)
+        self.assertNotIn("E11000092000013505605031400", ledger)
+        self.assertIn("E11000092000013505605031401", ledger)
+        with open(self.ledgerFile) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_prune_in_long_running_process(self):
+        ledger = SentLedger(self.ledgerFile, 5)
+        ledger.add("E11000092000013505605031400")
+        ledger.save()
+        ledger.add("E11000092000013505605031401")
+        # Riga registrata 10 giorni fa, durante l'esecuzione del processo
+        ledger.entries["E11000092000013505605031400"] = (date.today() - timedelta(days=10)).isoformat()
+
+        ledger.prune()
+        self.assertEqual(len(ledger), 1)
+        ledger.save()
+        with open(self.ledgerFile) as f:
+            self.assertEqual([row.split('\t')[1] for row in f], ["E11000092000013505605031401\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
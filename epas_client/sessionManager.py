@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: sessionManager.py                                                     #
+# Description: sessioni FTP/SFTP verso i server delle sorgenti di timbrature, #
+# mantenute aperte tra un controllo e il successivo in esecuzione continua.   #
+#                                                                             #
+###############################################################################
+
+import logging
+import time
+from ftplib import FTP, all_errors, error_reply, error_temp
+from threading import Event, Lock, Thread
+
+import paramiko
+
+from config import SESSION_KEEPALIVE
+
+from metrics import SESSION_RECONNECTS, SESSION_LOGIN_TIME
+
+# Errori che indicano una connessione con il server interrotta o non più
+# utilizzabile, per i quali la sessione viene riaperta
+FTP_CONNECTION_ERRORS = (OSError, EOFError, error_temp, error_reply)
+SFTP_CONNECTION_ERRORS = (OSError, EOFError, paramiko.SSHException)
+
+
+class FTPSession:
+    """
+    Connessione FTP autenticata e posizionata nella directory delle
+    timbrature della sorgente.
+    """
+
+    errors = FTP_CONNECTION_ERRORS
+
+    def __init__(self, source):
+        self.source = source
+        self.ftp = None
+        self.inUse = False
+        self.lastUsed = time.monotonic()
+
+    def connect(self):
+        ftp = FTP()
+        ftp.connect(self.source.serverName, self.source.serverPort, self.source.connectionTimeout)
+        ftp.login(self.source.username, self.source.password)
+        ftp.cwd(self.source.serverDir)
+        self.ftp = ftp
+
+    def noop(self):
+        self.ftp.voidcmd("NOOP")
+
+    def close(self):
+        try:
+            self.ftp.quit()
+        except all_errors:
+            self.ftp.close()
+
+
+class SFTPSession:
+    """
+    Connessione SSH con il relativo client SFTP, posizionato nella directory
+    delle timbrature della sorgente.
+    """
+
+    errors = SFTP_CONNECTION_ERRORS
+
+    def __init__(self, source):
+        self.source = source
+        self.transport = None
+        self.sftp = None
+        self.inUse = False
+        self.lastUsed = time.monotonic()
+
+    def connect(self):
+        transport = paramiko.Transport((self.source.serverName, self.source.serverPort))
+        try:
+            transport.connect(username=self.source.username, password=self.source.password)
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            sftp.chdir(self.source.serverDir)
+        except Exception:
+            transport.close()
+            raise
+        self.transport, self.sftp = transport, sftp
+
+    def noop(self):
+        self.sftp.stat(".")
+
+    def close(self):
+        self.sftp.close()
+        self.transport.close()
+
+
+class SessionManager:
+    """
+    Sessioni FTP/SFTP con i server delle sorgenti di timbrature.
+
+    Quando il client è avviato dal cron ogni sessione viene chiusa al
+    termine del controllo della sorgente. In esecuzione continua (persistent)
+    le sessioni restano aperte tra un controllo e il successivo, evitando
+    ad ogni controllo connessione, login (e per SFTP lo scambio delle chiavi):
+    un thread invia un NOOP o un keepalive sulle sessioni inattive da più di
+    SESSION_KEEPALIVE secondi e le sessioni interrotte vengono riaperte in
+    modo trasparente, al successivo utilizzo o dal thread di keepalive.
+    """
+
+    def __init__(self):
+        # (tipo di sessione, nome della sorgente) -> sessione
+        self.sessions = {}
+        self.lock = Lock()
+        self.persistent = False
+        self.stopped = Event()
+        self.keepaliveThread = None
+
+    def acquire(self, source, sessionClass):
+        """
+        Restituisce una sessione connessa con il server della sorgente,
+        riutilizzando, se possibile, quella aperta nei controlli precedenti.
+        """
+        key = (sessionClass, source.name)
+        with self.lock:
+            session = self.sessions.get(key)
+            reuse = session is not None and not session.inUse
+            if reuse:
+                session.inUse = True
+
+        if reuse:
+            try:
+                session.noop()
+                return session
+            except session.errors as e:
+                logging.warning("Connessione con la sorgente %s interrotta (%s), riconnessione in corso",
+                                source, e)
+                try:
+                    return self.reconnect(session)
+                except Exception:
+                    self._discard(session)
+                    raise
+
+        session = sessionClass(source)
+        self._login(session)
+        session.inUse = True
+        if self.persistent:
+            with self.lock:
+                self.sessions.setdefault(key, session)
+        return session
+
+    def release(self, session):
+        """
+        Termina l'utilizzo della sessione, che viene chiusa se il client non
+        è in esecuzione continua.
+        """
+        with self.lock:
+            keep = self.persistent and \
+                self.sessions.get((type(session), session.source.name)) is session
+            session.inUse = False
+            session.lastUsed = time.monotonic()
+        if not keep:
+            self._close(session)
+
+    def reconnect(self, session):
+        """
+        Chiude la sessione interrotta e la riapre.
+        """
+        self._close(session)
+        self._login(session)
+        SESSION_RECONNECTS.inc()
+        return session
+
+    def startKeepalive(self, interval=SESSION_KEEPALIVE):
+        """
+        Mantiene aperte le sessioni tra un controllo e il successivo ed
+        avvia, se interval è maggiore di zero, il thread di keepalive.
+        """
+        self.persistent = True
+        self.stopped.clear()
+        if interval > 0 and self.keepaliveThread is None:
+            self.keepaliveThread = Thread(target=self._keepalive, args=(interval,),
+                                          name="keepalive", daemon=True)
+            self.keepaliveThread.start()
+
+    def closeAll(self):
+        """
+        Ferma il thread di keepalive e chiude tutte le sessioni aperte.
+        """
+        self.stopped.set()
+        if self.keepaliveThread is not None:
+            self.keepaliveThread.join()
+            self.keepaliveThread = None
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+            self.persistent = False
+        for session in sessions:
+            self._close(session)
+
+    def _keepalive(self, interval):
+        while not self.stopped.wait(interval / 2):
+            now = time.monotonic()
+            with self.lock:
+                idle = [session for session in self.sessions.values()
+                        if not session.inUse and now - session.lastUsed >= interval]
+                for session in idle:
+                    session.inUse = True
+
+            for session in idle:
+                try:
+                    try:
+                        session.noop()
+                    except session.errors as e:
+                        logging.info("Connessione con la sorgente %s interrotta (%s), riconnessione in corso",
+                                     session.source, e)
+                        self.reconnect(session)
+                except Exception as e:
+                    # Il server non è raggiungibile: la sessione viene
+                    # riaperta al prossimo controllo della sorgente
+                    logging.warning("Impossibile riconnettersi alla sorgente %s: %s", session.source, e)
+                    self._discard(session)
+                    continue
+                with self.lock:
+                    session.inUse = False
+                    session.lastUsed = time.monotonic()
+
+    def _discard(self, session):
+        """
+        Rimuove la sessione non più utilizzabile, una nuova sessione verrà
+        aperta al prossimo controllo della sorgente.
+        """
+        with self.lock:
+            if self.sessions.get((type(session), session.source.name)) is session:
+                del self.sessions[(type(session), session.source.name)]
+        self._close(session)
+
+    @staticmethod
+    def _login(session):
+        start = time.monotonic()
+        session.connect()
+        elapsed = time.monotonic() - start
+        SESSION_LOGIN_TIME.observe(elapsed)
+        logging.debug("Connessione con la sorgente %s effettuata in %.3f secondi", session.source, elapsed)
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.close()
+        except Exception as e:
+            logging.debug("Errore nella chiusura della connessione con la sorgente %s: %s", session.source, e)
+
+
+# Sessioni condivise da tutti i controlli delle sorgenti
+sessionManager = SessionManager()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: sessionManagerTest.py                                                 #
+# Description: test relativi alle sessioni FTP/SFTP mantenute aperte in      #
+# esecuzione continua.                                                        #
+#                                                                             #
+###############################################################################
+
+import time
+import unittest
+from types import SimpleNamespace
+
+from metrics import SESSION_RECONNECTS
+from sessionManager import SessionManager
+
+
+class FakeSession:
+    """
+    Sessione simulata: conta connessioni, NOOP e chiusure.
+    """
+
+    errors = (OSError,)
+
+    def __init__(self, source):
+        self.source = source
+        self.inUse = False
+        self.lastUsed = time.monotonic()
+        self.connects = self.noops = self.closes = 0
+        self.broken = False
+
+    def connect(self):
+        self.connects += 1
+        self.broken = False
+
+    def noop(self):
+        self.noops += 1
+        if self.broken:
+            raise OSError("connessione chiusa dal server")
+
+    def close(self):
+        self.closes += 1
+
+
+class SessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = SessionManager()
+        self.source = SimpleNamespace(name="sede1")
+
+    def tearDown(self):
+        self.manager.closeAll()
+
+    def test_sessions_are_closed_without_keepalive(self):
+        session = self.manager.acquire(self.source, FakeSession)
+        self.manager.release(session)
+        self.assertIsNot(self.manager.acquire(self.source, FakeSession), session)
+        self.assertEqual((session.connects, session.closes), (1, 1))
+
+    def test_broken_session_is_reopened_on_next_use(self):
+        self.manager.startKeepalive(0)
+        session = self.manager.acquire(self.source, FakeSession)
+        self.manager.release(session)
+        self.assertIs(self.manager.acquire(self.source, FakeSession), session)
+        self.manager.release(session)
+
+        reconnects = SESSION_RECONNECTS._value.get()
+        session.broken = True
+        self.assertIs(self.manager.acquire(self.source, FakeSession), session)
+        self.assertEqual((session.connects, session.closes), (2, 1))
+        self.assertEqual(SESSION_RECONNECTS._value.get(), reconnects + 1)
+
+    def test_idle_sessions_receive_keepalive(self):
+        self.manager.startKeepalive(0.05)
+        session = self.manager.acquire(self.source, FakeSession)
+        self.manager.release(session)
+        time.sleep(0.3)
+        self.assertGreater(session.noops, 0)
+        self.assertEqual(session.connects, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
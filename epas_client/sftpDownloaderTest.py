@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: sftpDownloaderTest.py                                                 #
+# Description: test relativi al download incrementale dei file via SFTP      #
+#                                                                             #
+###############################################################################
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+
+import sftpDownloader
+from sftpDownloader import SFTPDownloader
+from stampingSource import StampingSource
+
+
+class FakeRemoteFile(io.BytesIO):
+    """
+    File remoto simulato, registra i byte letti tramite il client SFTP.
+    """
+
+    def __init__(self, sftp, data):
+        io.BytesIO.__init__(self, data)
+        self.sftp = sftp
+
+    def stat(self):
+        return SimpleNamespace(st_size=len(self.getvalue()))
+
+    def prefetch(self, file_size=None):
+        pass
+
+    def read(self, size=-1):
+        data = io.BytesIO.read(self, size)
+        self.sftp.transferred += len(data)
+        return data
+
+
+class FakeSFTP:
+    """
+    Client SFTP simulato con i file contenuti in files.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.transferred = 0
+
+    def open(self, file_name, mode):
+        return FakeRemoteFile(self, self.files[file_name])
+
+    def get(self, file_name, local_path):
+        with self.open(file_name, 'rb') as remote, open(local_path, 'wb') as f:
+            shutil.copyfileobj(remote, f)
+
+
+class SFTPDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        source = StampingSource("test")
+        source.dataDir = source.stampingsDir = self.tmpdir.name
+        self.downloader = SFTPDownloader(source)
+        self.downloader.sftp = FakeSFTP({"AT01": b"a" * 10000})
+        self.downloader.loggedIn = True
+        self.localFile = os.path.join(self.tmpdir.name, "AT01")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_only_appended_bytes_are_read(self):
+        self.assertFalse(self.downloader._retrieve_file("AT01"))
+        self.downloader.sftp.files["AT01"] += b"b" * 100
+        self.downloader.sftp.transferred = 0
+
+        self.assertFalse(self.downloader._retrieve_file("AT01"))
+        self.assertEqual(self.downloader.sftp.transferred, sftpDownloader.RESUME_CHECK_BYTES + 100)
+        with open(self.localFile, "rb") as f:
+            self.assertEqual(f.read(), b"a" * 10000 + b"b" * 100)
+
+    def test_shrunk_file_is_downloaded_again(self):
+        self.downloader._retrieve_file("AT01")
+        self.downloader.sftp.files["AT01"] = b"c" * 50
+
+        self.assertTrue(self.downloader._retrieve_file("AT01"))
+        with open(self.localFile, "rb") as f:
+            self.assertEqual(f.read(), b"c" * 50)
+
+    def test_streamed_file_is_parsed_without_local_copy(self):
+        self.downloader.sftp.files["AT01"] = b"riga 1\r\nriga 2\nriga 3"
+
+        with mock.patch.object(sftpDownloader, "STREAM_BLOCK_SIZE", 4):
+            _, errors, last_line, offset, size = self.downloader._stream_file("AT01")
+        self.assertEqual(errors, ["riga 1", "riga 2"])
+        self.assertEqual((last_line, offset, size), (2, 15, 21))
+        self.assertFalse(os.path.exists(self.localFile))
+
+        # Lettura ranged: vengono scaricati solo i byte successivi a offset
+        self.downloader.sftp.files["AT01"] += b"\nriga 4\n"
+        self.downloader.sftp.transferred = 0
+        _, errors, last_line, offset, size = self.downloader._stream_file("AT01", last_line + 1, offset)
+        self.assertEqual(errors, ["riga 3", "riga 4"])
+        self.assertEqual((last_line, offset, size), (4, 29, 29))
+        self.assertEqual(self.downloader.sftp.transferred, 14)
+
+    def test_streamed_file_with_fewer_lines_than_skipped(self):
+        self.downloader.sftp.files["AT01"] = b"riga 1\nriga 2\n"
+
+        _, errors, last_line, _, _ = self.downloader._stream_file("AT01", 6)
+        self.assertEqual(errors, [])
+        self.assertEqual(last_line, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
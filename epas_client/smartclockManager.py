@@ -54,14 +54,14 @@ from datetime import datetime, timedelta
 from ftplib import FTP
 
 from archive import Archive
-from config import BADGE_READER_IP, BADGE_READER_PORT, BADGE_READER_USER, \
-    BADGE_READER_PSW, DAYS_TO_DOWNLOAD, FTP_CONNECTION_TIMEOUT, WAIT_SECONDS, \
+from config import DAYS_TO_DOWNLOAD, WAIT_SECONDS, \
     STAMPING_FILTER_COMMAND, STAMPINGS_FILE, COMMAND_FILE, LOG_FILE, \
-    F4_COMMAND_DATA_FORMAT, SUCCESS_MSG, DATA_DIR, BAD_STAMPINGS_FILE, \
+    F4_COMMAND_DATA_FORMAT, SUCCESS_MSG, BAD_STAMPINGS_FILE, \
     PARSING_ERROR_FILE, CHECK_SUCCESS_MSG
 
-from config import BASE_DIR, STAMPINGS_FILE_FORMAT, STAMPINGS_DIR 
+from config import BASE_DIR, STAMPINGS_FILE_FORMAT
 from stampingImporter import StampingImporter
+from stampingSource import StampingSource
 from fileUtils import FileUtils
 
 class SmartClockManager:
@@ -69,29 +69,49 @@ class SmartClockManager:
     Classe per il download del file contenente le timbrature dal lettore smartclock
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, source=None, send=None):
+        """
+        @param source: sorgente delle timbrature, di default quella definita
+            dai parametri globali della configurazione (BADGE_READER_*)
+        @param send: funzione di invio delle timbrature interpretate, di
+            default StampingImporter.sendParsedStampingsOnEpas, chiamata con le
+            timbrature, gli errori di parsing e il nome della sorgente
+        """
+        self.source = source if source is not None else StampingSource()
+        self.send = send if send is not None else StampingImporter.sendParsedStampingsOnEpas
+        # I file di scambio con il lettore delle sorgenti di STAMPING_SOURCES
+        # sono nella directory della sorgente, per non sovrapporsi tra i lettori
+        self.work_dir = self.source.dataDir if self.source.name else BASE_DIR
+
+    def check_new_stamping_files(self):
+        """
+        Scarica le nuove timbrature dal lettore, salva la più recente per il
+        download successivo e invia ad ePAS quelle scaricate.
+        """
+        last_stamping, last_stampingdate = self.downloadstampings()
+        if last_stamping is not None:
+            FileUtils.save_last_request(last_stamping, last_stampingdate, self.source.dataDir)
+        self.process_stamping_files()
 
-    @staticmethod
-    def downloadstampings():
+    def downloadstampings(self):
         """
         :return: la timbratura più recente scaricata e la data relativa, se presenti
         """
 
-        last_stamping, from_date = FileUtils.load_last_request()
+        last_stamping, from_date = FileUtils.load_last_request(self.source.dataDir)
 
         now = datetime.now()
 
         # Elimino nel caso esistano i file residui dall'esecuzione precedente
-        command_file = os.path.join(BASE_DIR, COMMAND_FILE)
+        command_file = os.path.join(self.work_dir, COMMAND_FILE)
         if os.path.exists(command_file):
             os.remove(command_file)
 
-        log_file = os.path.join(BASE_DIR, LOG_FILE)
+        log_file = os.path.join(self.work_dir, LOG_FILE)
         if os.path.exists(log_file):
             os.remove(log_file)
 
-        stamping_file = os.path.join(BASE_DIR, STAMPINGS_FILE)
+        stamping_file = os.path.join(self.work_dir, STAMPINGS_FILE)
         if os.path.exists(stamping_file):
             os.remove(stamping_file)
 
@@ -107,16 +127,16 @@ class SmartClockManager:
         with open(command_file, 'w') as new_command_file:
             new_command_file.writelines("%s\r\n" % filter_command)
 
-        logging.info('Tentativo di connessione al lettore %s tramite protocollo FTP', BADGE_READER_IP)
+        logging.info('Tentativo di connessione al lettore %s tramite protocollo FTP', self.source.badgeReaderIp)
 
         ftp = None
 
         try:
             ftp = FTP()
-            logging.debug(f"Tenativo di connessione al lettore {BADGE_READER_IP}:{BADGE_READER_PORT}" + 
-                f"(connection timeout = {FTP_CONNECTION_TIMEOUT}) in corso...")
-            ftp.connect(BADGE_READER_IP, int(BADGE_READER_PORT), FTP_CONNECTION_TIMEOUT)
-            ftp.login(BADGE_READER_USER, BADGE_READER_PSW)
+            logging.debug(f"Tenativo di connessione al lettore {self.source.badgeReaderIp}:{self.source.badgeReaderPort}" + 
+                f"(connection timeout = {self.source.connectionTimeout}) in corso...")
+            ftp.connect(self.source.badgeReaderIp, self.source.badgeReaderPort, self.source.connectionTimeout)
+            ftp.login(self.source.badgeReaderUser, self.source.badgeReaderPassword)
 
             logging.info("Connessione al lettore effettuata: %s" % ftp.welcome)
 
@@ -167,7 +187,7 @@ class SmartClockManager:
 
                 if len(stampings_received) > 0:
                     filename = now.__format__(STAMPINGS_FILE_FORMAT)
-                    new_stampings_file = os.path.join(STAMPINGS_DIR, filename)
+                    new_stampings_file = os.path.join(self.source.stampingsDir, filename)
                     with open(new_stampings_file, 'w') as new_file:
                         for stamping in stampings_received:
                             new_file.write("%s\n" % (stamping,))
@@ -176,7 +196,8 @@ class SmartClockManager:
                     logging.info('Nessuna nuova timbratura ricevuta.')
                     return None, None
 
-                return Archive.archive_and_check_stampings(stampings_received)
+                return Archive.archive_and_check_stampings(stampings_received, self.source.archivesDir,
+                                                           self.source.stampingFormat)
 
         except Exception as e:
             logging.error("Errore durante il download delle timbrature: %s", e)
@@ -188,12 +209,11 @@ class SmartClockManager:
 
         return None, None
 
-    @staticmethod
-    def process_stamping_files():
-        stamping_files = os.listdir(STAMPINGS_DIR)
+    def process_stamping_files(self):
+        stamping_files = os.listdir(self.source.stampingsDir)
         
-        bad_stampings_path = os.path.join(DATA_DIR, BAD_STAMPINGS_FILE)
-        parsing_errors_path = os.path.join(DATA_DIR, PARSING_ERROR_FILE)
+        bad_stampings_path = os.path.join(self.source.dataDir, BAD_STAMPINGS_FILE)
+        parsing_errors_path = os.path.join(self.source.dataDir, PARSING_ERROR_FILE)
 
         bad_stampings = []
         parsing_errors = []
@@ -201,18 +221,18 @@ class SmartClockManager:
         for stamping_file in stamping_files:
             logging.info("Processo il file %s per estrarne le timbrature", stamping_file)
 
-            stamping_file_path = os.path.join(STAMPINGS_DIR, stamping_file)
+            stamping_file_path = os.path.join(self.source.stampingsDir, stamping_file)
 
             with open(stamping_file_path, 'r') as f:
-                # Questo metodo di lettura delle righe toglie anche gli \n di fine riga
-                lines = f.read().splitlines()
+                stampings, errors = StampingImporter.parse_buffer(f.read(), self.source.stampingFormat)
 
             # Rimuove eventuali duplicati
-            lines = set(lines)
+            stampings = list(dict(stampings).items())
+            errors = list(dict.fromkeys(errors))
 
             # Se c'è almeno una timbratura..
-            if lines:
-                bad, errors = StampingImporter.sendStampingsOnEpas(lines)
+            if stampings or errors:
+                bad, errors = self.send(stampings, errors, self.source.name)
 
                 bad_stampings += bad
                 parsing_errors += errors
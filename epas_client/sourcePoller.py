@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: sourcePoller.py                                                       #
+# Description: controllo contemporaneo delle sorgenti di timbrature definite  #
+# in STAMPING_SOURCES, con un'unica coda di invio verso ePAS.                 #
+#                                                                             #
+###############################################################################
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import SOURCE_POLL_WORKERS
+
+from ftpDownloader import FTPDownloader
+from sftpDownloader import SFTPDownloader
+from localFolderManager import LocalFolderManager
+from smartclockManager import SmartClockManager
+from stampingImporter import StampingImporter
+
+
+class SendPipeline:
+    """
+    Coda di invio condivisa dalle sorgenti controllate contemporaneamente:
+    le timbrature di tutte le sorgenti vengono inviate ad ePAS da un unico
+    thread, un blocco alla volta, condividendo connessioni HTTP, registro
+    degli invii, circuit breaker e limiti di frequenza e di concorrenza verso
+    il server. Mentre vengono inviate le timbrature di una sorgente le altre
+    continuano a scaricare e interpretare i propri file.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invio")
+
+    def send(self, stampings, parsingErrors, sourceName=None):
+        """
+        Accoda l'invio delle timbrature interpretate e ne attende il termine,
+        restituisce lo stesso risultato di StampingImporter.sendParsedStampingsOnEpas.
+        """
+        return self.executor.submit(
+            StampingImporter.sendParsedStampingsOnEpas, stampings, parsingErrors, sourceName).result()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class SourcePoller:
+    """
+    Controlla i nuovi file di timbrature di più sorgenti (STAMPING_SOURCES)
+    tramite un pool di al massimo SOURCE_POLL_WORKERS thread. Gli errori di
+    una sorgente (es. lettore non raggiungibile) vengono registrati nel log
+    senza interrompere il controllo delle altre.
+    """
+
+    def __init__(self, sources, workers=SOURCE_POLL_WORKERS):
+        self.sources = sources
+        self.workers = max(1, min(workers, len(sources)))
+
+    def check_new_stamping_files(self):
+        """
+        Controlla tutte le sorgenti e restituisce la lista di quelle in cui
+        si sono verificati errori.
+        """
+        logging.info("Controllo di %d sorgenti di timbrature tramite %d thread",
+                     len(self.sources), self.workers)
+        failed = []
+        pipeline = SendPipeline()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sorgente") as executor:
+                futures = {executor.submit(self._check_source, source, pipeline.send): source
+                           for source in self.sources}
+                for future in as_completed(futures):
+                    source = futures[future]
+                    try:
+                        future.result()
+                    except Exception:
+                        logging.exception("Errore durante il controllo della sorgente %s", source)
+                        failed.append(source)
+        finally:
+            pipeline.close()
+        return failed
+
+    @staticmethod
+    def _check_source(source, send):
+        """
+        Controlla i nuovi file di timbrature della sorgente, inviando le
+        timbrature tramite send.
+        """
+        logging.info("Controllo della sorgente %s", source)
+        source.makedirs()
+        if source.protocol == "local":
+            LocalFolderManager(source, send).check_new_stamping_files()
+        elif source.protocol == "smartclock":
+            SmartClockManager(source, send).check_new_stamping_files()
+        else:
+            manager = (SFTPDownloader if source.protocol == "sftp" else FTPDownloader)(source, send)
+            try:
+                manager.check_new_stamping_files()
+            finally:
+                if manager.loggedIn:
+                    SourcePoller._disconnect(manager)
+
+    @staticmethod
+    def _disconnect(manager):
+        """
+        Rilascia la connessione con il server della sorgente, mantenuta
+        aperta in esecuzione continua.
+        """
+        if isinstance(manager, SFTPDownloader):
+            manager.close()
+        else:
+            manager.quit_ftp()
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: sourcePollerTest.py                                                   #
+# Description: test relativi al controllo contemporaneo di più sorgenti di   #
+# timbrature.                                                                 #
+#                                                                             #
+###############################################################################
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from config import FILE_LAST_DOWNLOAD, LAST_REQUEST_FILE
+from sourcePoller import SourcePoller
+from stampingImporter import StampingImporter
+from stampingSource import StampingSource
+
+CSV_REGEX = r"^(?P<matricolaFirma>\d{6});(?P<giorno>\d{2})/(?P<mese>\d{2})/(?P<anno>\d{2});" \
+            r"(?P<operazione>[EU]);(?P<ora>\d{2})(?P<minuti>\d{2})$"
+
+
+class SourcePollerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _source(self, definition, lines=None):
+        source = StampingSource.fromDefinition(definition)
+        source.dataDir = os.path.join(self.tmpdir.name, "data", source.name)
+        source.stampingsDir = os.path.join(self.tmpdir.name, "source", source.name)
+        source.archivesDir = os.path.join(self.tmpdir.name, "archives", source.name)
+        if lines is not None:
+            os.makedirs(source.stampingsDir)
+            with open(os.path.join(source.stampingsDir, source.filePrefix + "01"), "w") as f:
+                f.write("".join(line + "\n" for line in lines))
+        return source
+
+    def test_sources_share_a_single_send_thread(self):
+        sede1 = self._source({"NAME": "sede1", "STAMPINGS_SERVER_PROTOCOL": "local",
+                              "FTP_FILE_PREFIX": "AT", "FTP_FILE_SUFFIX": ""},
+                             ["E11000092000013505605031400", "U11000092000017101005031400"])
+        sede2 = self._source({"NAME": "sede2", "STAMPINGS_SERVER_PROTOCOL": "local",
+                              "FTP_FILE_PREFIX": "BT", "FTP_FILE_SUFFIX": "",
+                              "REGEX_STAMPING": CSV_REGEX},
+                             ["000092;05/03/14;E;0830", "riga errata"])
+        # Lettore non raggiungibile: l'errore non interrompe le altre sorgenti
+        sede3 = self._source({"NAME": "sede3", "STAMPINGS_SERVER_PROTOCOL": "ftp",
+                              "FTP_SERVER_NAME": "127.0.0.1", "FTP_SERVER_PORT": 1})
+        sent = []
+        sourceNames = []
+
+        def send(stampings, parsingErrors, sourceName=None):
+            sent.append((threading.current_thread().name, stampings, parsingErrors))
+            sourceNames.append(sourceName)
+            return [], parsingErrors
+
+        with mock.patch.object(StampingImporter, "sendParsedStampingsOnEpas", send):
+            failed = SourcePoller([sede1, sede2, sede3], 3).check_new_stamping_files()
+
+        self.assertEqual(failed, [sede3])
+        self.assertEqual(len(set(threadName for threadName, _, _ in sent)), 1)
+        self.assertEqual(sorted(sourceNames), ["sede1", "sede2"])
+        sent = {tuple(line for line, _ in stampings): (stampings, parsingErrors)
+                for _, stampings, parsingErrors in sent}
+        self.assertEqual(sorted(sent), [("000092;05/03/14;E;0830",),
+                                        ("E11000092000013505605031400", "U11000092000017101005031400")])
+        stampings, parsingErrors = sent[("000092;05/03/14;E;0830",)]
+        self.assertEqual((stampings[0][1].matricolaFirma, stampings[0][1].ora), ("000092", 8))
+        self.assertEqual(parsingErrors, ["riga errata"])
+        self.assertTrue(os.path.exists(os.path.join(sede2.dataDir, FILE_LAST_DOWNLOAD)))
+
+    def test_smartclock_sources_use_their_own_reader(self):
+        readers = {"10.0.0.1": ["E11000092000013505605031400"],
+                   "10.0.0.2": ["U11000093000017101005031400", "riga errata"]}
+
+        class FakeReader:
+            welcome = "220 SmartClock"
+            sock = True
+
+            def connect(self, host, port, timeout):
+                self.host = host
+
+            def login(self, user, password):
+                pass
+
+            def delete(self, name):
+                return "250"
+
+            def storbinary(self, command, file):
+                file.close()
+                return "226"
+
+            def size(self, name):
+                return 10
+
+            def retrbinary(self, command, callback):
+                if command.endswith(".log"):
+                    callback(b"T01Rx0000\r\n")
+                else:
+                    callback("".join(line + "\r\n" for line in readers[self.host]).encode())
+                return "226"
+
+            def quit(self):
+                pass
+
+        sources = [self._source({"NAME": "sede%d" % i, "STAMPINGS_SERVER_PROTOCOL": "smartclock",
+                                 "BADGE_READER_IP": ip})
+                   for i, ip in enumerate(sorted(readers), 1)]
+        sent = {}
+
+        def send(stampings, parsingErrors, sourceName=None):
+            sent[sourceName] = ([line for line, _ in stampings], parsingErrors)
+            return [], parsingErrors
+
+        with mock.patch("smartclockManager.FTP", FakeReader), mock.patch("smartclockManager.time.sleep"), \
+                mock.patch.object(StampingImporter, "sendParsedStampingsOnEpas", send):
+            failed = SourcePoller(sources, 2).check_new_stamping_files()
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sent, {"sede1": (["E11000092000013505605031400"], []),
+                                "sede2": (["U11000093000017101005031400"], ["riga errata"])})
+        for source in sources:
+            self.assertTrue(os.path.exists(os.path.join(source.dataDir, LAST_REQUEST_FILE)))
+            self.assertEqual(len(os.listdir(source.archivesDir)), 1)
+            self.assertEqual(os.listdir(source.stampingsDir), [])
+
+    def test_invalid_source_definitions(self):
+        for definition in ({"STAMPINGS_SERVER_PROTOCOL": "ftp"},
+                           {"NAME": "../sede", "STAMPINGS_SERVER_PROTOCOL": "ftp"},
+                           {"NAME": "sede", "STAMPINGS_SERVER_PROTOCOL": "smartclock-http"},
+                           {"NAME": "sede", "FTP_SERVER": "10.0.0.1"}):
+            with self.assertRaises(ValueError):
+                StampingSource.fromDefinition(definition)
+
+    def test_default_server_port_by_protocol(self):
+        with mock.patch.dict("stampingSource.SOURCE_PARAMETERS", {"FTP_SERVER_PORT": None}):
+            ftp = StampingSource("ftp", {"STAMPINGS_SERVER_PROTOCOL": "ftp"})
+            sftp = StampingSource("sftp", {"STAMPINGS_SERVER_PROTOCOL": "sftp"})
+            custom = StampingSource("custom", {"STAMPINGS_SERVER_PROTOCOL": "sftp",
+                                               "FTP_SERVER_PORT": 2222})
+        self.assertEqual(21, ftp.serverPort)
+        self.assertEqual(22, sftp.serverPort)
+        self.assertEqual(2222, custom.serverPort)
+
+
+if __name__ == '__main__':
+    unittest.main()
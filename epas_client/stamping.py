@@ -30,11 +30,35 @@
 
 from config import TIPOLOGIE_BADGE_DA_IGNORARE
 
+# Campi di una timbratura, nell'ordine in cui vengono inviati ad ePAS
+STAMPING_FIELDS = ("operazione", "tipo", "giornoSettimana", "matricolaFirma",
+                   "causale", "ora", "minuti", "secondi", "giorno", "mese",
+                   "anno", "lettore")
+
+
 class Stamping:
     """
-    Classe contenitore per le informazioni relative ad una timbratura via Badge
+    Classe contenitore per le informazioni relative ad una timbratura via Badge.
+    I campi sono fissi (__slots__), in modo da ridurre la memoria occupata
+    da ogni timbratura; i campi non presenti nel tracciato record restano None.
     """
 
+    __slots__ = STAMPING_FIELDS
+
+    def __init__(self):
+        self.operazione = None
+        self.tipo = None
+        self.giornoSettimana = None
+        self.matricolaFirma = None
+        self.causale = None
+        self.ora = None
+        self.minuti = None
+        self.secondi = None
+        self.giorno = None
+        self.mese = None
+        self.anno = None
+        self.lettore = None
+
     def isToBeIgnored(self):
         """
         Le timbrature di alcune tipologie di contratti devono essere ignorate.
@@ -52,39 +76,60 @@ class Stamping:
         Effettua dei controlli di base sui valori di cui è composta
         la timbratura, principalmente su quelli relativi a data
         e ora.
+        I valori di data e ora sono già convertiti in interi da _parseLine,
+        un valore mancante o non numerico solleva TypeError nel confronto e
+        rende la timbratura non valida.
         """
 
         # i controlli sull'anno molto empirici, chissà cosa passerà come
         # valore se superiamo l'anno 2099...
-        isValid = not (self.operazione is None \
-                       or self.anno is None or not type(self.anno) == int \
-                       or self.anno < 1980 \
-                       or self.mese is None or not type(self.mese) == int \
-                       or self.mese < 1 or self.mese > 12 \
-                       or self.giorno is None or not type(self.giorno) == int \
-                       or self.giorno < 1 or self.giorno > 31 \
-                       or self.ora is None or not type(self.ora) == int \
-                       or self.ora < 0 or self.ora > 24 \
-                       or self.minuti is None or not type(self.minuti) == int \
-                       or self.minuti < 0 or self.minuti > 60 \
-                       or self.secondi is None or not type(self.secondi) == int \
-                       or self.secondi < 0 or self.secondi > 60)
-
-        return isValid
+        try:
+            return self.operazione is not None \
+                and self.anno >= 1980 \
+                and 1 <= self.mese <= 12 \
+                and 1 <= self.giorno <= 31 \
+                and 0 <= self.ora <= 24 \
+                and 0 <= self.minuti <= 60 \
+                and 0 <= self.secondi <= 60
+        except TypeError:
+            return False
+
+    def payloadValues(self):
+        """
+        Restituisce la tupla dei valori dei campi inviati ad ePAS, nell'ordine
+        di STAMPING_FIELDS.
+        """
+        return (self.operazione, self.tipo, self.giornoSettimana, self.matricolaFirma,
+                self.causale, self.ora, self.minuti, self.secondi, self.giorno,
+                self.mese, self.anno, self.lettore)
+
+    @classmethod
+    def fromPayloadValues(cls, values):
+        """
+        Crea una timbratura dalla tupla restituita da payloadValues().
+        """
+        stamping = cls.__new__(cls)
+        (stamping.operazione, stamping.tipo, stamping.giornoSettimana, stamping.matricolaFirma,
+         stamping.causale, stamping.ora, stamping.minuti, stamping.secondi, stamping.giorno,
+         stamping.mese, stamping.anno, stamping.lettore) = values
+        return stamping
+
+    def __reduce__(self):
+        # Serializzazione compatta, utilizzata per restituire le timbrature
+        # interpretate dai processi del recupero storico (sendFilesOnEpas)
+        return Stamping.fromPayloadValues, (self.payloadValues(),)
+
+    def payload(self):
+        """
+        Restituisce il dizionario dei campi della timbratura inviati ad ePAS,
+        senza i campi non presenti nel tracciato (None).
+        """
+        return {field: value for field, value in zip(STAMPING_FIELDS, self.payloadValues())
+                if value is not None}
 
     def __str__(self):
         return """operazione: %s, tipo: %s, giorno settimana: %s, numero badge: %s, causale: %s
 ora: %s, minuti: %s, secondi: %s, giorno: %s, mese: %s, anno: %s 
-lettore: %s""" % (self.operazione if hasattr(self, "operazione") else None, 
-                  self.tipo if hasattr(self, "tipo") else None, 
-                  self.giornoSettimana if hasattr(self, "giornoSettimana") else None,
-                  self.matricolaFirma if hasattr(self, "matricolaFirma") else None, 
-                  self.causale if hasattr(self, "causale") else None,
-                  self.ora if hasattr(self, "ora") else None, 
-                  self.minuti if hasattr(self, "minuti") else None, 
-                  self.secondi if hasattr(self, "secondi") else None,
-                  self.giorno if hasattr(self, "giorno") else None, 
-                  self.mese if hasattr(self, "mese") else None, 
-                  self.anno if hasattr(self, "anno") else None,
-                  self.lettore if hasattr(self, "lettore") else None
-                  )
+lettore: %s""" % (self.operazione, self.tipo, self.giornoSettimana,
+                  self.matricolaFirma, self.causale, self.ora, self.minuti,
+                  self.secondi, self.giorno, self.mese, self.anno, self.lettore)
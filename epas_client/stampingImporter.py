@@ -80,22 +80,162 @@
 #                                                                             #
 ###############################################################################
 
+import itertools
 import logging
+import multiprocessing
+import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from queue import Queue, Empty
-from threading import Thread
+from threading import Lock, Thread
 
 from config import MAPPING_CAUSALI_CLIENT_SERVER, OFFSET_ANNO_BADGE, \
     MAX_THREADS, SERVER_ERROR_CODES, REGEX_STAMPING, \
-    MAPPING_OPERAZIONE_CLIENT_SERVER
+    MAPPING_OPERAZIONE_CLIENT_SERVER, SEND_BATCH_SIZE, SEND_BATCH_MAX_WAIT, \
+    SEND_ENGINE, ADAPTIVE_CONCURRENCY, ADAPTIVE_MIN_CONCURRENCY, \
+    ADAPTIVE_LATENCY_THRESHOLD, ASYNC_MAX_CONCURRENCY, RETRY_MAX_ATTEMPTS, \
+    RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_BUDGET, RETRY_STATUS_CODES, \
+    DATA_DIR, CIRCUIT_BREAKER_FILE, CIRCUIT_BREAKER_FAILURES, \
+    CIRCUIT_BREAKER_RESET_TIMEOUT, RATE_LIMIT, RATE_LIMIT_BURST, \
+    SENT_LEDGER_FILE, SENT_LEDGER_DAYS, SEND_QUEUE_SIZE, \
+    PARSE_CACHE_SIZE, BACKFILL_PROCESSES
+
+from circuitBreaker import CircuitBreaker, isFailure
+from concurrencyLimiter import ConcurrencyLimiter, isCongestion
+from parseCache import ParseCache
+from rateLimiter import TokenBucket
+from retryPolicy import RetryPolicy
+from sentLedger import SentLedger
+from stamping import Stamping, STAMPING_FIELDS
+from stampingLayout import FixedWidthLayout
+from stampingSender import sendStamping, sendStampings
+
+# Campi della timbratura obbligatori e che possono non essere presenti nel tracciato
+MANDATORY_FIELDS = ("operazione", "matricolaFirma", "ora", "minuti", "giorno", "mese", "anno")
+OPTIONAL_FIELDS = ("tipo", "giornoSettimana", "causale", "secondi", "lettore")
+
+
+def _groupAssigner(regex):
+    """
+    Genera la funzione che copia nella timbratura i campi estratti da una
+    corrispondenza di regex, con un'unica chiamata a group() ed
+    un'unica assegnazione multipla.
+    """
+    names = MANDATORY_FIELDS + tuple(name for name in OPTIONAL_FIELDS if name in regex.groupindex)
+    source = "def assignGroups(matchObject, stamping):\n" \
+             "    %s = matchObject.group(*names)\n" % ", ".join("stamping." + name for name in names)
+    namespace = {"names": names}
+    exec(source, namespace)
+    return namespace["assignGroups"]
+
+
+def _layoutParser(layout):
+    """
+    Genera la funzione che interpreta una riga tramite il tracciato a
+    larghezza fissa e ne converte i campi come _completeStamping, limitandosi
+    ai campi presenti nel tracciato (senza i messaggi di debug per quelli
+    assenti). La funzione restituisce la timbratura, None se la riga non
+    corrisponde al tracciato o False se i valori della riga non sono validi.
+    """
+    names = set(layout.names)
+    source = ["def parseStamping(line):",
+              "    stamping = Stamping()",
+              "    if not parse(line, stamping):",
+              "        return None"]
+    if "causale" in names:
+        source += ["    causale = stamping.causale",
+                   "    if causale in causali:",
+                   "        stamping.causale = causali[causale]",
+                   "    else:",
+                   "        logging.warning('Causale %s sconosciuta. Impostata causale vuota', causale)",
+                   "        stamping.causale = None"]
+    source += ["    operazione = stamping.operazione",
+               "    if operazione and operazione in operazioni:",
+               "        stamping.operazione = operazioni[operazione]",
+               "    try:",
+               "        stamping.anno = int(stamping.anno) + offsetAnno"]
+    source += ["        stamping.%s = int(stamping.%s)" % (name, name)
+               for name in ("mese", "giorno", "ora", "minuti", "secondi") if name in names]
+    source += ["    except ValueError:",
+               "        return False"]
+    if "secondi" not in names:
+        source += ["    stamping.secondi = 0"]
+    source += ["    return stamping if stamping.isValid() else False"]
+
+    namespace = {"Stamping": Stamping, "parse": layout.parse, "logging": logging,
+                 "causali": MAPPING_CAUSALI_CLIENT_SERVER, "operazioni": MAPPING_OPERAZIONE_CLIENT_SERVER,
+                 "offsetAnno": OFFSET_ANNO_BADGE}
+    exec("\n".join(source) + "\n", namespace)
+    return namespace["parseStamping"]
+
+
+class StampingFormat:
+    """
+    Formato delle righe di timbratura: l'espressione regolare (REGEX_STAMPING)
+    compilata per singola riga e per l'intero file e, quando la regex è a
+    larghezza fissa, il tracciato equivalente.
+    """
+
+    def __init__(self, regex, fixedWidth=True):
+        """
+        @param regex: espressione regolare delle righe di timbratura
+        @param fixedWidth: se False non viene utilizzato il tracciato a
+            larghezza fissa (es. per confrontare i tempi dei due metodi)
+        """
+        self.regex = regex
+        self.stampingRegex = re.compile(regex)
 
-from stamping import Stamping
-from stampingSender import sendStamping
+        # Versione multilinea della regex per interpretare un intero file con
+        # parse_buffer, utilizzabile solo se la regex è ancorata all'inizio e
+        # alla fine della riga.
+        self.bufferRegex = re.compile(regex, re.MULTILINE) \
+            if regex.startswith("^") and regex.endswith("$") else None
+
+        self.assignGroups = _groupAssigner(self.stampingRegex)
+
+        # Tracciato a larghezza fissa ricavato dalla regex (None se
+        # l'espressione non è a larghezza fissa), utilizzato al posto della
+        # regex per le righe che vi corrispondono tramite parseLayout
+        self.layout = FixedWidthLayout.fromRegex(regex) if fixedWidth else None
+        if self.layout is not None and not (set(MANDATORY_FIELDS) <= set(self.layout.names) <= set(STAMPING_FIELDS)):
+            self.layout = None
+        self.parseLayout = _layoutParser(self.layout) if self.layout is not None else None
 
 # ATTENZIONE: formato della timbratura impostato in configurazione.
-stampingRegex = re.compile(REGEX_STAMPING)
+defaultFormat = StampingFormat(REGEX_STAMPING)
+
+# Formati delle timbrature delle sorgenti con una REGEX_STAMPING diversa
+# da quella impostata in configurazione (STAMPING_SOURCES)
+_formats = {REGEX_STAMPING: defaultFormat}
+_formatsLock = Lock()
+
+
+def stampingFormat(regex):
+    """
+    Restituisce il formato delle timbrature per la regex indicata, creato
+    una sola volta per ogni regex.
+    """
+    if regex is None:
+        return defaultFormat
+    with _formatsLock:
+        if regex not in _formats:
+            _formats[regex] = StampingFormat(regex)
+        return _formats[regex]
+
+# Timbrature già interpretate, condivise tra archiviazione, invio e re-invio.
+# Utilizzata solo per le righe nel formato impostato in configurazione.
+parseCache = ParseCache(PARSE_CACHE_SIZE) if PARSE_CACHE_SIZE > 0 else None
+
+# Codici di risposta che indicano che il server non supporta l'invio a blocchi
+BATCH_UNSUPPORTED_CODES = [404, 405, 501]
+
+# Codici di risposta per cui la timbratura non è stata inserita in ePAS: oltre
+# ai SERVER_ERROR_CODES anche i codici transitori (es. 429) non ritentati
+FAILED_STATUS_CODES = frozenset(SERVER_ERROR_CODES) | frozenset(RETRY_STATUS_CODES)
 
-from metrics import BAD_STAMPINGS, PARSING_ERRORS, STAMPINGS_SENT
+from metrics import sourceMetrics
 
 class StampingParsingException(Exception):
     """
@@ -110,52 +250,182 @@ class StampingParsingException(Exception):
 
 
 class SendWorker(Thread):
-    def __init__(self, queue, badStampings, parsingErrors):
+    """
+    Thread di invio delle timbrature: preleva dalla coda le coppie (riga,
+    timbratura) già interpretate e le invia ad ePAS, fino a quando non riceve
+    None, che segnala la fine delle timbrature da inviare.
+    Le righe non inviate e quelle inviate correttamente vengono raccolte nel
+    thread stesso (badStampings e sentStampings) e unite a quelle degli altri
+    thread solo al termine, senza liste condivise tra i thread.
+    """
+
+    def __init__(self, queue):
         Thread.__init__(self)
         self.queue = queue
-        self.badStampings = badStampings
-        self.parsingErrors = parsingErrors
+        self.badStampings = []
+        self.sentStampings = []
 
     def run(self):
-        while not self.queue.empty():
-            # Get the work from the queue
+        if SEND_BATCH_SIZE > 1 and StampingImporter.batchSupported:
+            self._runBatches()
+            return
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self._send(*item)
+
+    def _send(self, line, stamp):
+        """
+        Invia una singola timbratura, ritentando l'invio in caso di errori
+        transitori secondo la RetryPolicy. Se l'invio non va a buon fine la
+        riga viene inserita nelle badStampings.
+        """
+        attempt = 0
+        while True:
+            allowed = StampingImporter.circuitBreaker.allow()
+            if not allowed:
+                logging.debug("Circuit breaker aperto, timbratura non inviata: %s", line)
+                self.badStampings.append(line)
+                return
+            response = self._sendOnce(line, stamp, allowed is CircuitBreaker.PROBE)
+            status = response.status_code if response is not None else None
+            if response is None or status in FAILED_STATUS_CODES:
+                delay = StampingImporter.retryPolicy.nextDelay(
+                    attempt, status, response.headers.get("Retry-After") if response is not None else None)
+                if delay is not None:
+                    attempt += 1
+                    logging.info("Invio della timbratura %s fallito (%s), tentativo %d tra %.1f secondi",
+                                 line, status, attempt, delay)
+                    time.sleep(delay)
+                    continue
+            break
+
+        if response is None:  # Caso di errore di connessione al server
+            logging.debug("Timbratura non inserita in ePas: %s", line)
+            self.badStampings.append(line)
+        elif response.status_code in FAILED_STATUS_CODES:  # Risposta del server con un errore
+            logging.warning("Errore nell'invio della timbratura %s al server di ePas: %s %s",
+                            line, response.status_code, response.reason)
+            self.badStampings.append(line)
+        else:  # Invio OK
+            logging.debug("Timbratura inserita correttamente in ePas:  %s", line)
+            if StampingImporter.sentLedger is not None:
+                self.sentStampings.append(line)
+
+    def _sendOnce(self, line, stamp, probe=False):
+        """
+        Effettua un singolo tentativo di invio della timbratura, restituisce
+        la risposta del server oppure None in caso di errore. probe indica
+        se si tratta dell'invio di prova del circuit breaker.
+        """
+        if StampingImporter.rateLimiter:
+            StampingImporter.rateLimiter.acquire()
+        limiter = StampingImporter.concurrencyLimiter
+        start = limiter.acquire() if limiter else None
+        response = None
+        try:
+            response = sendStamping(stamp)
+        except Exception as e:
+            logging.error("Eccezione nell'invio delle timbratura line = %s. " + 
+                          "Timbratura = %s. Eccezione = %s", line, stamp, e)
+        finally:
+            StampingImporter.circuitBreaker.record(
+                not isFailure(response.status_code if response is not None else None), probe)
+            if limiter:
+                limiter.release(start, not isCongestion(
+                    response.status_code if response is not None else None))
+        return response
+
+    def _runBatches(self):
+        """
+        Raggruppa le timbrature in blocchi di SEND_BATCH_SIZE elementi e li
+        invia con una sola richiesta. Un blocco incompleto viene inviato
+        comunque dopo SEND_BATCH_MAX_WAIT secondi dalla prima timbratura
+        inserita o quando non ci sono più righe da processare.
+        """
+        batch = []
+        deadline = None
+        while True:
             try:
-                line = self.queue.get_nowait()
-                stamp = None
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()) if batch else None)
             except Empty:
-                self.queue.task_done()
+                self._sendBatch(batch)
+                batch = []
+                continue
+
+            if item is None:
+                if batch:
+                    self._sendBatch(batch)
                 return
 
+            if not batch:
+                deadline = time.monotonic() + SEND_BATCH_MAX_WAIT
+            batch.append(item)
+            if len(batch) >= SEND_BATCH_SIZE or time.monotonic() >= deadline:
+                self._sendBatch(batch)
+                batch = []
+
+    def _sendBatch(self, batch):
+        """
+        Invia un blocco di timbrature. Se il blocco viene rifiutato in parte
+        (errore 4xx non transitorio) le timbrature sono re-inviate singolarmente, in modo che
+        nelle badStampings finiscano solo le righe effettivamente rifiutate.
+        In caso di errore di connessione o del server l'intero blocco viene
+        inserito nelle badStampings, senza ulteriori richieste.
+        """
+        if not StampingImporter.batchSupported:
+            for line, stamp in batch:
+                self._send(line, stamp)
+            return
+
+        response = None
+        allowed = StampingImporter.circuitBreaker.allow()
+        if allowed:
+            if StampingImporter.rateLimiter:
+                StampingImporter.rateLimiter.acquire()
+            limiter = StampingImporter.concurrencyLimiter
+            start = limiter.acquire() if limiter else None
             try:
-                stamp = StampingImporter._parseLine(line)
-            except StampingParsingException as e:
-                logging.debug(e)
-                self.parsingErrors.append(line)
-                self.queue.task_done()
-                continue
-            
-            if stamp is not None:
-                if stamp.isToBeIgnored():
-                    logging.info("Ignorata timbratura line = %s. Timbratura = %s", line, stamp)
-                else:
-                    try:
-
-                        response = sendStamping(stamp)
-
-                        if response is None:  # Caso di errore di connessione al server
-                            logging.debug("Timbratura non inserita in ePas: %s", line)
-                            self.badStampings.append(line)
-                        elif response.status_code in SERVER_ERROR_CODES:  # Risposta del server con un errore
-                            logging.warning("Errore nell'invio della timbratura %s al server di ePas: %s %s",
-                                            line, response.status_code, response.reason)
-                            self.badStampings.append(line)
-                        else:  # Invio OK
-                            logging.debug("Timbratura inserita correttamente in ePas:  %s", line)
-                    except Exception as e:
-                        logging.error("Eccezione nell'invio delle timbratura line = %s. " + 
-                                      "Timbratura = %s. Inserita nelle badStampings. Eccezione = %s", line, stamp, e)
-                        self.badStampings.append(line)                        
-            self.queue.task_done()
+                response = sendStampings([stamp for line, stamp in batch])
+            finally:
+                StampingImporter.circuitBreaker.record(
+                    not isFailure(response.status_code if response is not None else None),
+                    allowed is CircuitBreaker.PROBE)
+                if limiter:
+                    limiter.release(start, not isCongestion(
+                        response.status_code if response is not None else None))
+        else:
+            logging.debug("Circuit breaker aperto, blocco di %d timbrature non inviato", len(batch))
+
+        if response is not None and 200 <= response.status_code < 300:
+            logging.debug("Blocco di %d timbrature inserito correttamente in ePas", len(batch))
+            if StampingImporter.sentLedger is not None:
+                self.sentStampings.extend(line for line, stamp in batch)
+            return
+
+        if response is not None and response.status_code in BATCH_UNSUPPORTED_CODES:
+            logging.warning("Il server di ePAS non supporta l'invio a blocchi delle timbrature "
+                            "(%s %s), le timbrature verranno inviate singolarmente",
+                            response.status_code, response.reason)
+            StampingImporter.batchSupported = False
+        elif response is not None and 400 <= response.status_code < 500 and \
+                response.status_code not in RETRY_STATUS_CODES:
+            logging.warning("Blocco di %d timbrature non accettato interamente (%s %s), "
+                            "le timbrature verranno inviate singolarmente",
+                            len(batch), response.status_code, response.reason)
+        else:
+            if response is not None:
+                logging.warning("Errore nell'invio di un blocco di %d timbrature al server di ePas: %s %s",
+                                len(batch), response.status_code, response.reason)
+            else:
+                logging.debug("Blocco di %d timbrature non inserito in ePas", len(batch))
+            self.badStampings.extend(line for line, stamp in batch)
+            return
+
+        for line, stamp in batch:
+            self._send(line, stamp)
 
 
 class StampingImporter:
@@ -164,10 +434,35 @@ class StampingImporter:
     delle presenze Epas
     """
 
+    # Diventa False se il server non supporta l'invio a blocchi delle timbrature
+    batchSupported = True
+
+    # Controllo adattivo degli invii contemporanei, condiviso tra tutti i
+    # file processati nella stessa esecuzione (ADAPTIVE_CONCURRENCY)
+    concurrencyLimiter = None
+
+    # Re-invii delle timbrature per errori transitori, il budget di re-invii
+    # è condiviso da tutta l'esecuzione del client (da ogni controllo dei
+    # file in esecuzione continua)
+    retryPolicy = RetryPolicy(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+                              RETRY_BUDGET, RETRY_STATUS_CODES)
+
+    # Limite alla frequenza delle richieste verso ePAS (RATE_LIMIT)
+    rateLimiter = TokenBucket(RATE_LIMIT, RATE_LIMIT_BURST) if RATE_LIMIT > 0 else None
+
+    # Circuit breaker verso il server di ePAS, il suo stato è mantenuto tra
+    # le diverse esecuzioni del client
+    circuitBreaker = None
+
+    # Registro delle timbrature già accettate da ePAS (SENT_LEDGER_DAYS)
+    sentLedger = None
+
     @staticmethod
-    def sendStampingsOnEpas(stampings):
+    def sendStampingsOnEpas(stampings, sourceName=None):
         """
         @param stampings: lista delle righe prelevate dal file delle timbrature
+        @param sourceName: nome della sorgente delle timbrature, utilizzato
+            nelle metriche
         @return una tupla contenente come primo valore la lista delle timbrature da re-inviare
             ad ePAS e come secondo elemento la lista degli errori di parsing.
             
@@ -175,91 +470,429 @@ class StampingImporter:
         effettua il parsing ed invia le informazioni della timbratura via Restful
         al sistema Epas.
         """
+        StampingImporter._setUp()
+
+        already_sent = 0
+        if StampingImporter.sentLedger is not None:
+            to_send = [line for line in stampings if line not in StampingImporter.sentLedger]
+            already_sent = len(stampings) - len(to_send)
+            stampings = to_send
+
+        parsing_errors = []
+        return StampingImporter._send(
+            StampingImporter._parseStampings(stampings, parsing_errors),
+            parsing_errors, {"total": len(stampings), "alreadySent": already_sent}, sourceName)
+
+    @staticmethod
+    def sendParsedStampingsOnEpas(stampings, parsingErrors, sourceName=None):
+        """
+        @param stampings: lista delle coppie (riga, timbratura) restituite da parse_buffer
+        @param parsingErrors: lista delle righe non interpretabili restituite da parse_buffer
+        @param sourceName: nome della sorgente delle timbrature, utilizzato
+            nelle metriche
+        @return una tupla contenente come primo valore la lista delle timbrature da re-inviare
+            ad ePAS e come secondo elemento la lista degli errori di parsing.
+
+        Come sendStampingsOnEpas, per le timbrature già interpretate tramite
+        parse_buffer.
+        """
+        StampingImporter._setUp()
+
+        already_sent = 0
+        if StampingImporter.sentLedger is not None:
+            to_send = [(line, stamp) for line, stamp in stampings
+                       if line not in StampingImporter.sentLedger]
+            already_sent = len(stampings) - len(to_send)
+            stampings = to_send
+
+        return StampingImporter._send(
+            StampingImporter._notIgnored(stampings), parsingErrors,
+            {"total": len(stampings) + len(parsingErrors), "alreadySent": already_sent}, sourceName)
+
+    @staticmethod
+    def sendFilesOnEpas(fileNames, stampingFormat=None, sourceName=None):
+        """
+        @param fileNames: lista dei path dei file di timbrature da importare
+        @param stampingFormat: formato delle timbrature dei file, di default
+            quello impostato in configurazione
+        @param sourceName: nome della sorgente delle timbrature, utilizzato
+            nelle metriche
+        @return una tupla contenente come primo valore la lista delle timbrature da re-inviare
+            ad ePAS e come secondo elemento la lista degli errori di parsing.
+
+        Importazione di grandi quantità di file (recupero dello storico): il
+        parsing e la validazione dei file vengono distribuiti su
+        BACKFILL_PROCESSES processi e le timbrature interpretate vengono
+        inviate, nell'ordine dei file, man mano che i processi le restituiscono.
+        """
+        StampingImporter._setUp()
 
-        # Righe di timbrature che non è stato possibile inviare correttamente
-        bad_stampings = []
-        # Tracciati record che hanno causato un errore nel parsing
         parsing_errors = []
+        counts = {"total": 0, "alreadySent": 0}
+        return StampingImporter._send(
+            StampingImporter._parseFiles(fileNames, parsing_errors, counts,
+                                         stampingFormat.regex if stampingFormat is not None else None),
+            parsing_errors, counts, sourceName)
 
-        queue = Queue()
+    @staticmethod
+    def _parseFiles(fileNames, parsingErrors, counts, regex=None):
+        """
+        Generatore delle coppie (riga, timbratura) da inviare contenute nei
+        file, interpretati in parallelo da un pool di processi. Al massimo due
+        file per processo sono in lavorazione o in attesa di essere inviati,
+        in modo da limitare la memoria utilizzata.
+        """
+        processes = BACKFILL_PROCESSES or _availableCpus()
+        logging.info("Importazione di %d file di timbrature tramite %d processi",
+                     len(fileNames), processes)
+
+        with ProcessPoolExecutor(max_workers=processes, mp_context=_processContext()) as executor:
+            fileNames = iter(fileNames)
+            pending = deque(executor.submit(parseFile, fileName, regex)
+                            for fileName in itertools.islice(fileNames, 2 * processes))
+            while pending:
+                stampings, errors = pending.popleft().result()
+                for fileName in itertools.islice(fileNames, 1):
+                    pending.append(executor.submit(parseFile, fileName, regex))
+
+                counts["total"] += len(stampings) + len(errors)
+                parsingErrors.extend(errors)
+                if StampingImporter.sentLedger is not None:
+                    to_send = [(line, stamp) for line, stamp in stampings
+                               if line not in StampingImporter.sentLedger]
+                    counts["alreadySent"] += len(stampings) - len(to_send)
+                    stampings = to_send
+                yield from StampingImporter._notIgnored(stampings)
+
+    @staticmethod
+    def newRun():
+        """
+        In esecuzione continua, prepara gli oggetti condivisi tra gli invii
+        per un nuovo controllo dei file, come ad un nuovo avvio del client:
+        ripristina il budget dei re-invii ed elimina le righe scadute dal
+        registro degli invii.
+        """
+        StampingImporter.retryPolicy.reset()
+        if StampingImporter.sentLedger is not None:
+            StampingImporter.sentLedger.prune()
 
-        # Vengono inserite tutte le righe corrispondenti al tracciato record delle timbrature nella coda
-        for stamping in stampings:
-            queue.put(stamping)
+    @staticmethod
+    def _setUp():
+        """
+        Inizializza, al primo invio, gli oggetti condivisi tra gli invii.
+        """
+        if StampingImporter.circuitBreaker is None:
+            StampingImporter.circuitBreaker = CircuitBreaker(
+                os.path.join(DATA_DIR, CIRCUIT_BREAKER_FILE),
+                CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET_TIMEOUT)
+
+        if SENT_LEDGER_DAYS > 0 and StampingImporter.sentLedger is None:
+            StampingImporter.sentLedger = SentLedger(
+                os.path.join(DATA_DIR, SENT_LEDGER_FILE), SENT_LEDGER_DAYS)
+
+        if ADAPTIVE_CONCURRENCY and StampingImporter.concurrencyLimiter is None:
+            StampingImporter.concurrencyLimiter = ConcurrencyLimiter(
+                ADAPTIVE_MIN_CONCURRENCY,
+                ASYNC_MAX_CONCURRENCY if SEND_ENGINE == "asyncio" else MAX_THREADS,
+                ADAPTIVE_LATENCY_THRESHOLD)
+
+    @staticmethod
+    def _send(stampings, parsingErrors, counts, sourceName=None):
+        """
+        Invia le coppie (riga, timbratura) tramite il motore SEND_ENGINE e
+        aggiorna il registro degli invii e le metriche della sorgente sourceName.
+        counts contiene il numero di righe processate ("total") e di quelle
+        già inviate in precedenza ("alreadySent"), letti al termine dell'invio.
+        """
+        if SEND_ENGINE == "asyncio":
+            # Importato solo se necessario, richiede il package aiohttp
+            from asyncSender import sendStampingsAsync
+            bad_stampings = sendStampingsAsync(stampings)
+        else:
+            bad_stampings = StampingImporter._sendWithThreads(stampings)
+
+        if StampingImporter.sentLedger is not None:
+            StampingImporter.sentLedger.save()
+
+        if counts["alreadySent"]:
+            logging.info("%d timbrature già inviate ad ePAS non sono state re-inviate", counts["alreadySent"])
+
+        #Impostazione delle metriche Prometheus
+        if parseCache is not None:
+            parseCache.publishMetrics()
+        stampingsSent, stampingsAlreadySent, badStampings, parsingErrorsCount = sourceMetrics(sourceName)
+        stampingsSent.set(counts["total"])
+        stampingsAlreadySent.set(counts["alreadySent"])
+        badStampings.set(len(bad_stampings))
+        parsingErrorsCount.set(len(parsingErrors))
+
+        return bad_stampings, parsingErrors
+
+    @staticmethod
+    def _sendWithThreads(stampings):
+        """
+        Invia le coppie (riga, timbratura) tramite MAX_THREADS thread SendWorker.
+        Il thread chiamante preleva le timbrature, effettuando il parsing
+        quando necessario, e le inserisce in una coda di al massimo
+        SEND_QUEUE_SIZE elementi, attendendo che si liberi spazio quando è piena.
+        Restituisce la lista delle righe che non è stato possibile inviare.
+        """
+        queue = Queue(maxsize=SEND_QUEUE_SIZE)
 
         # Crea n thread
+        workers = []
         for x in range(MAX_THREADS):
-            worker = SendWorker(queue, bad_stampings, parsing_errors)
+            worker = SendWorker(queue)
             logging.debug(f"Avviato thread {x} per l'invio delle timbrature")
             # Setting daemon to True will let the main thread exit even though the workers are blocking
             worker.daemon = True
             worker.start()
+            workers.append(worker)
 
-        queue.join()
-        
-        #Impostazione delle metriche Prometheus
-        STAMPINGS_SENT.set(len(stampings))
-        BAD_STAMPINGS.set(len(bad_stampings))
-        PARSING_ERRORS.set(len(parsing_errors))
+        # Righe di timbrature che non è stato possibile inviare correttamente
+        bad_stampings = []
+        try:
+            for item in stampings:
+                queue.put(item)
+        finally:
+            # Anche se il prelievo delle timbrature si interrompe con un errore
+            # i thread vengono terminati e le timbrature già inviate registrate.
+            # Un None per ogni thread segnala la fine delle timbrature da inviare:
+            # ogni thread ne preleva esattamente uno e termina
+            for worker in workers:
+                queue.put(None)
+
+            for worker in workers:
+                worker.join()
+                bad_stampings.extend(worker.badStampings)
+                if StampingImporter.sentLedger is not None:
+                    for line in worker.sentStampings:
+                        StampingImporter.sentLedger.add(line)
+
+        return bad_stampings
+
+    @staticmethod
+    def _parseStampings(stampings, parsingErrors):
+        """
+        Generatore delle timbrature da inviare: effettua il parsing delle righe
+        man mano che vengono richieste e restituisce le coppie (riga, timbratura).
+        Le righe non interpretabili vengono inserite in parsingErrors, le
+        timbrature da ignorare vengono scartate.
+        """
+        for line in stampings:
+            try:
+                stamp = StampingImporter._parseLine(line)
+            except StampingParsingException as e:
+                logging.debug(e)
+                parsingErrors.append(line)
+                continue
 
-        return bad_stampings, parsing_errors
+            if stamp.isToBeIgnored():
+                logging.info("Ignorata timbratura line = %s. Timbratura = %s", line, stamp)
+                continue
+
+            yield line, stamp
 
     @staticmethod
-    def _parseLine(line):
+    def _notIgnored(stampings):
+        """
+        Generatore delle coppie (riga, timbratura) già interpretate, escluse
+        le timbrature da ignorare.
+        """
+        for line, stamp in stampings:
+            if stamp.isToBeIgnored():
+                logging.info("Ignorata timbratura line = %s. Timbratura = %s", line, stamp)
+                continue
+
+            yield line, stamp
+
+    @staticmethod
+    def _parseLine(line, stampingFormat=None):
         """
         Parsa una riga contenente le informazioni relativa ad una timbratura,
         i dati estratti vengono inseriti in un'istanza della classe Stamping
         che viene restituita dal metodo.
+        La riga viene interpretata tramite il tracciato a larghezza fissa del
+        formato, se presente, altrimenti o se la riga non vi corrisponde
+        tramite la sua espressione regolare (di default il formato impostato
+        in configurazione).
         Nel caso di errori durante il parsing viene sollevata una eccezione
         StampingParsingException.
+        Le timbrature interpretate vengono mantenute in parseCache.
         """
-        logging.debug("Parso la riga %s", line)
+        if stampingFormat is None:
+            stampingFormat = defaultFormat
+        cache = parseCache if stampingFormat is defaultFormat else None
+        if cache is not None:
+            stamping = cache.get(line)
+            if stamping is not None:
+                return stamping
 
-        matchObject = stampingRegex.search(line.strip())
+        logging.debug("Parso la riga %s", line)
 
-        if matchObject is None:
+        strippedLine = line.strip()
+        stamping = stampingFormat.parseLayout(strippedLine) if stampingFormat.parseLayout is not None else None
+        if stamping is False:
             raise StampingParsingException(
-                'Errore nel formato della riga da parsare! Riga scartata: %s' % (line,))
+                "Riga di timbratura %s non valida" %(line,))
 
-        stamping = Stamping()
-        stamping.operazione = matchObject.group("operazione")
-        stamping.matricolaFirma = matchObject.group("matricolaFirma")
-        stamping.ora = matchObject.group("ora")
-        stamping.minuti = matchObject.group("minuti")
-        stamping.giorno = matchObject.group("giorno")
-        stamping.mese = matchObject.group("mese")
-        stamping.anno = matchObject.group("anno")
+        if stamping is None:
+            matchObject = stampingFormat.stampingRegex.search(strippedLine)
 
-        try:
-            stamping.tipo = matchObject.group("tipo")
-        except IndexError:
+            if matchObject is None:
+                raise StampingParsingException(
+                    'Errore nel formato della riga da parsare! Riga scartata: %s' % (line,))
+
+            stamping = Stamping()
+            stampingFormat.assignGroups(matchObject, stamping)
+            stamping = StampingImporter._completeStamping(line, stamping)
+
+        if cache is not None:
+            cache.put(line, stamping)
+        return stamping
+
+    @staticmethod
+    def parse_buffer(text, stampingFormat=None):
+        """
+        @param text: contenuto (anche parziale) di un file di timbrature
+        @param stampingFormat: formato delle timbrature, di default quello
+            impostato in configurazione
+        @return una tupla contenente come primo valore la lista delle coppie
+            (riga, timbratura) interpretate correttamente e come secondo
+            elemento la lista delle righe non interpretabili.
+
+        Interpreta tutte le righe del testo con un'unica ricerca della
+        regex del formato in modalità multilinea, evitando il costo di una
+        chiamata per riga. Le porzioni di testo tra una corrispondenza e la
+        successiva (righe con spazi, terminatori CR LF, righe vuote o
+        errate) vengono interpretate riga per riga con _parseLine, quindi il
+        risultato è lo stesso che si ottiene passando le righe a _parseLine.
+        Se la regex non è ancorata con ^...$ tutte le righe vengono
+        interpretate con _parseLine.
+        Con un formato a larghezza fissa le righe vengono invece interpretate
+        tramite il tracciato (_parseLayoutBuffer).
+        """
+        stampings = []
+        parsingErrors = []
+
+        if stampingFormat is None:
+            stampingFormat = defaultFormat
+        if stampingFormat.parseLayout is not None:
+            StampingImporter._parseLayoutBuffer(text, stampings, parsingErrors, stampingFormat)
+            return stampings, parsingErrors
+
+        bufferRegex = stampingFormat.bufferRegex
+        if bufferRegex is None:
+            StampingImporter._parseLines(text, stampings, parsingErrors, stampingFormat)
+            return stampings, parsingErrors
+
+        completeStamping = StampingImporter._completeStamping
+        assignGroups = stampingFormat.assignGroups
+        cache = parseCache if stampingFormat is defaultFormat else None
+        # Posizione del fine riga che segue l'ultima corrispondenza trovata
+        position = -1
+        for matchObject in bufferRegex.finditer(text):
+            start, end = matchObject.span()
+            line = matchObject.group()
+            if "\n" in line:
+                # La corrispondenza attraversa più righe (es. \s nella
+                # regex), viene lasciata al parsing riga per riga
+                continue
+            if start > position + 1:
+                StampingImporter._parseLines(text[position + 1:start], stampings, parsingErrors,
+                                             stampingFormat)
+            position = end
+
+            # Le righe interpretate da parse_buffer non vengono inserite
+            # nella cache, un intero file la svuoterebbe ad ogni lettura, né
+            # contate nelle sue metriche: vengono riutilizzate solo le
+            # timbrature già presenti (es. interpretate dall'archiviazione)
+            stamping = cache.peek(line) if cache is not None else None
+            if stamping is None:
+                stamping = Stamping()
+                assignGroups(matchObject, stamping)
+                try:
+                    completeStamping(line, stamping)
+                except StampingParsingException as e:
+                    logging.debug(e)
+                    parsingErrors.append(line)
+                    continue
+            stampings.append((line, stamping))
+
+        if position + 1 < len(text):
+            StampingImporter._parseLines(text[position + 1:], stampings, parsingErrors, stampingFormat)
+
+        return stampings, parsingErrors
+
+    @staticmethod
+    def _parseLayoutBuffer(text, stampings, parsingErrors, stampingFormat):
+        """
+        Interpreta le righe del testo tramite il tracciato a larghezza fissa
+        del formato. Le righe che non corrispondono al tracciato (righe con
+        spazi, terminatori CR LF, righe vuote o errate) vengono interpretate
+        con _parseLines, quindi il risultato è lo stesso della ricerca della
+        regex sull'intero testo.
+        """
+        parseLayout = stampingFormat.parseLayout
+        cache = parseCache if stampingFormat is defaultFormat else None
+        lines = text.split("\n")
+        if lines[-1] == "":
+            # Testo terminato dal fine riga (o vuoto)
+            lines.pop()
+        for line in lines:
+            # Come in parse_buffer la cache non viene aggiornata né contata
+            stamping = cache.peek(line) if cache is not None else None
+            if stamping is None:
+                stamping = parseLayout(line)
+                if stamping is None:
+                    StampingImporter._parseLines(line + "\n", stampings, parsingErrors, stampingFormat)
+                    continue
+                if stamping is False:
+                    logging.debug("Riga di timbratura %s non valida", line)
+                    parsingErrors.append(line)
+                    continue
+            stampings.append((line, stamping))
+
+    @staticmethod
+    def _parseLines(text, stampings, parsingErrors, stampingFormat=None):
+        """
+        Interpreta riga per riga il testo, aggiungendo le coppie
+        (riga, timbratura) a stampings e le righe errate a parsingErrors.
+        """
+        for line in text.splitlines():
+            try:
+                stampings.append((line, StampingImporter._parseLine(line, stampingFormat)))
+            except StampingParsingException as e:
+                logging.debug(e)
+                parsingErrors.append(line)
+
+    @staticmethod
+    def _completeStamping(line, stamping):
+        """
+        Converte e verifica i campi estratti dalla riga, restituendo la
+        timbratura o sollevando una StampingParsingException.
+        """
+        if stamping.tipo is None:
             logging.debug("tipo non presente per timbratura %s", line)
         
-        try:
-            stamping.giornoSettimana = matchObject.group("giornoSettimana")
-        except IndexError:
+        if stamping.giornoSettimana is None:
             logging.debug("Giorno delle settimana non presente per timbratura %s", line)
 
-        try:
-            stamping.causale = matchObject.group("causale")
-            if stamping.causale and stamping.causale in MAPPING_CAUSALI_CLIENT_SERVER:
-                stamping.causale = MAPPING_CAUSALI_CLIENT_SERVER[stamping.causale]
-            else:
-                logging.warn("Causale %s sconosciuta. Impostata causale vuota" % stamping.causale)
-                stamping.causale = None
-        except IndexError:
+        if stamping.causale is None:
             logging.debug("causale non presente per timbratura %s", line)
+        elif stamping.causale in MAPPING_CAUSALI_CLIENT_SERVER:
+            stamping.causale = MAPPING_CAUSALI_CLIENT_SERVER[stamping.causale]
+        else:
+            logging.warn("Causale %s sconosciuta. Impostata causale vuota" % stamping.causale)
+            stamping.causale = None
 
-        try:
-            stamping.secondi = matchObject.group("secondi")
-            stamping.secondi = int(stamping.secondi)
-        except IndexError:
+        if stamping.secondi is None:
             stamping.secondi = 0
             logging.debug("secondi non presenti per timbratura %s", line)
+        else:
+            stamping.secondi = int(stamping.secondi)
 
-        try:
-            stamping.lettore = matchObject.group("lettore")
-        except IndexError:
+        if stamping.lettore is None:
             logging.debug("lettore non presente per timbratura %s", line)
 
         if stamping.operazione and stamping.operazione in MAPPING_OPERAZIONE_CLIENT_SERVER:
@@ -283,6 +916,41 @@ class StampingImporter:
         return stamping
 
 
+def _availableCpus():
+    """
+    Numero di processori utilizzabili dal processo, os.sched_getaffinity
+    non è disponibile su tutte le piattaforme.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _processContext():
+    """
+    Contesto dei processi di interpretazione dei file. I processi vengono
+    creati mentre i thread di invio sono già attivi: non vengono creati con
+    fork, che copierebbe nei processi figli i lock (es. quello del logging)
+    eventualmente acquisiti da quei thread, ma tramite forkserver, o spawn
+    dove forkserver non è disponibile.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def parseFile(fileName, regex=None):
+    """
+    Interpreta un intero file di timbrature tramite parse_buffer, eseguita
+    dai processi di StampingImporter.sendFilesOnEpas. Ai processi viene
+    passata la regex del formato delle timbrature, di default quella
+    impostata in configurazione.
+    """
+    logging.info("Processo il file %s per estrarne le timbrature", fileName)
+    with open(fileName, 'r', errors='replace') as f:
+        return StampingImporter.parse_buffer(f.read(), stampingFormat(regex))
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         filename='client.log',
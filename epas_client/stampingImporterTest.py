@@ -28,9 +28,16 @@
 ###############################################################################
 
 import logging
+import os
+import tempfile
+import threading
 import unittest
+from types import SimpleNamespace
+from unittest import mock
 
-from stampingImporter import StampingImporter
+import stampingImporter
+from circuitBreaker import CircuitBreaker
+from stampingImporter import StampingImporter, SendWorker
 
 
 class StampingImporterTest(unittest.TestCase):
@@ -54,6 +61,187 @@ class StampingImporterTest(unittest.TestCase):
         self.assertEqual(stamping.anno, 2014)
         self.assertTrue(not stamping.isToBeIgnored())
 
+    def test_parse_buffer(self):
+        lines = ["E11000092000013505605031400", "", "riga errata",
+                 " U11000092000017101005031400 ", "E11000092000008300006031400"]
+        stampings, parsingErrors = self.importer.parse_buffer("\n".join(lines) + "\n")
+        self.assertEqual([line for line, stamp in stampings],
+                         [lines[0], lines[3], lines[4]])
+        self.assertEqual([str(stamp) for line, stamp in stampings],
+                         [str(self.importer._parseLine(lines[i])) for i in (0, 3, 4)])
+        self.assertEqual(parsingErrors, ["", "riga errata"])
+
+    def test_layout_and_regex_give_the_same_result(self):
+        layoutFormat = stampingImporter.StampingFormat(stampingImporter.REGEX_STAMPING)
+        regexFormat = stampingImporter.StampingFormat(stampingImporter.REGEX_STAMPING, fixedWidth=False)
+        self.assertIsNotNone(layoutFormat.layout)
+
+        text = "E11000092000013505605031400\r\n\nriga errata\nU1100009200001710100503140\n" \
+               " U11000092000017101005031400 \nE11000092999913505605031400\n" \
+               "E11000092000013505699031400\nE11000092000008300006031400"
+        results = []
+        for stampingFormat in (layoutFormat, regexFormat):
+            stampings, parsingErrors = self.importer.parse_buffer(text, stampingFormat)
+            results.append(([(line, str(stamp)) for line, stamp in stampings], parsingErrors))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0][0]), 4)
+
+    def test_send_with_threads_merges_worker_results(self):
+        stampings = [("riga %d" % i, i) for i in range(200)]
+
+        def sendStamping(stamp):
+            return SimpleNamespace(status_code=401 if stamp % 3 == 0 else 200, reason="", headers={})
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(stampingImporter, "MAX_THREADS", 8), \
+                mock.patch.object(stampingImporter, "SEND_BATCH_SIZE", 1), \
+                mock.patch.object(stampingImporter, "sendStamping", sendStamping), \
+                mock.patch.object(StampingImporter, "circuitBreaker",
+                                  CircuitBreaker(os.path.join(tmpdir, "circuit"), 5, 60)):
+            badStampings = StampingImporter._sendWithThreads(iter(stampings))
+
+        self.assertEqual(sorted(badStampings),
+                         sorted(line for line, stamp in stampings if stamp % 3 == 0))
+
+    def test_send_with_threads_stops_workers_when_stampings_fail(self):
+        sent = []
+
+        def stampings():
+            yield "riga 1", 1
+            yield "riga 2", 2
+            raise OSError("file non leggibile")
+
+        def sendStamping(stamp):
+            sent.append(stamp)
+            return SimpleNamespace(status_code=200, reason="", headers={})
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(stampingImporter, "MAX_THREADS", 4), \
+                mock.patch.object(stampingImporter, "SEND_BATCH_SIZE", 1), \
+                mock.patch.object(stampingImporter, "sendStamping", sendStamping), \
+                mock.patch.object(StampingImporter, "circuitBreaker",
+                                  CircuitBreaker(os.path.join(tmpdir, "circuit"), 5, 60)):
+            threads = threading.active_count()
+            with self.assertRaises(OSError):
+                StampingImporter._sendWithThreads(stampings())
+
+        self.assertEqual(sorted(sent), [1, 2])
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_too_many_requests_is_retried(self):
+        responses = {}
+
+        def sendStamping(stamp):
+            responses[stamp] = responses.get(stamp, 0) + 1
+            status = 429 if stamp == 1 or responses[stamp] == 1 else 200
+            return SimpleNamespace(status_code=status, reason="", headers={"Retry-After": "0"})
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(stampingImporter, "sendStamping", sendStamping), \
+                mock.patch.object(StampingImporter, "retryPolicy",
+                                  stampingImporter.RetryPolicy(2, 0, 0, 10, [429])), \
+                mock.patch.object(StampingImporter, "circuitBreaker",
+                                  CircuitBreaker(os.path.join(tmpdir, "circuit"), 3, 60)):
+            worker = SendWorker(None)
+            worker._send("riga 0", 0)
+            worker._send("riga 1", 1)
+            # Le risposte 429 non contano come errori per il circuit breaker
+            self.assertEqual(StampingImporter.circuitBreaker.state, CircuitBreaker.CLOSED)
+
+        self.assertEqual(responses, {0: 2, 1: 3})
+        self.assertEqual(worker.badStampings, ["riga 1"])
+
+    def test_parse_files_keeps_file_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fileNames = []
+            for day in range(1, 6):
+                fileName = os.path.join(tmpdir, "AT%02d" % day)
+                with open(fileName, "w") as f:
+                    f.write("E110000920000135056%02d031400\nriga errata\n" % day)
+                fileNames.append(fileName)
+
+            parsingErrors = []
+            counts = {"total": 0, "alreadySent": 0}
+            with mock.patch.object(stampingImporter, "BACKFILL_PROCESSES", 2):
+                stampings = list(StampingImporter._parseFiles(fileNames, parsingErrors, counts))
+
+        self.assertEqual([stamp.giorno for line, stamp in stampings], [1, 2, 3, 4, 5])
+        self.assertEqual(parsingErrors, ["riga errata"] * 5)
+        self.assertEqual(counts, {"total": 10, "alreadySent": 0})
+
+
+class SendBatchTest(unittest.TestCase):
+    """
+    Test dell'invio a blocchi delle timbrature (SEND_BATCH_SIZE > 1).
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.batches = []
+        self.single = []
+        self.batchStatus = 200
+        patches = [
+            mock.patch.object(stampingImporter, "SEND_BATCH_SIZE", 3),
+            mock.patch.object(stampingImporter, "sendStampings", self.sendStampings),
+            mock.patch.object(stampingImporter, "sendStamping", self.sendStamping),
+            mock.patch.object(StampingImporter, "batchSupported", True),
+            mock.patch.object(StampingImporter, "circuitBreaker",
+                              CircuitBreaker(os.path.join(self.tmpdir.name, "circuit"), 100, 60)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def sendStampings(self, stamps):
+        self.batches.append(stamps)
+        if self.batchStatus is None:
+            return None
+        return SimpleNamespace(status_code=self.batchStatus, reason="", headers={})
+
+    def sendStamping(self, stamp):
+        self.single.append(stamp)
+        return SimpleNamespace(status_code=401 if stamp % 2 else 200, reason="", headers={})
+
+    def run_worker(self, count):
+        queue = stampingImporter.Queue()
+        for i in range(count):
+            queue.put(("riga %d" % i, i))
+        queue.put(None)
+        worker = SendWorker(queue)
+        worker.run()
+        return worker
+
+    def test_batches_are_sent_in_one_request(self):
+        worker = self.run_worker(7)
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(self.single, [])
+        self.assertEqual(worker.badStampings, [])
+
+    def test_unsupported_batches_are_sent_one_by_one(self):
+        self.batchStatus = 404
+        worker = self.run_worker(5)
+        self.assertEqual(self.batches, [[0, 1, 2]])
+        self.assertFalse(StampingImporter.batchSupported)
+        self.assertEqual(self.single, [0, 1, 2, 3, 4])
+        self.assertEqual(worker.badStampings, ["riga 1", "riga 3"])
+
+    def test_partially_rejected_batch_is_sent_one_by_one(self):
+        self.batchStatus = 400
+        worker = self.run_worker(3)
+        self.assertTrue(StampingImporter.batchSupported)
+        self.assertEqual(self.single, [0, 1, 2])
+        self.assertEqual(worker.badStampings, ["riga 1"])
+
+    def test_failed_batch_is_not_sent_one_by_one(self):
+        for status in (None, 503):
+            self.batchStatus = status
+            self.batches = []
+            worker = self.run_worker(4)
+            self.assertEqual(len(self.batches), 2)
+            self.assertEqual(self.single, [])
+            self.assertEqual(worker.badStampings, ["riga %d" % i for i in range(4)])
+
 if __name__ == '__main__':
     logging.basicConfig(
         filename='test.log',
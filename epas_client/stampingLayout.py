@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: stampingLayout.py                                                     #
+# Description: parsing delle timbrature a larghezza fissa tramite posizioni   #
+# dei campi nella riga, alternativo all'espressione regolare REGEX_STAMPING.  #
+#                                                                             #
+###############################################################################
+
+import re
+from operator import itemgetter
+
+# Gruppo con nome di larghezza fissa, per esempio (?P<ora>\d{2}) o (?P<tipo>\w)
+_FIXED_GROUP = re.compile(r"\(\?P<(?P<name>\w+)>(?P<atom>\\[dw]|\[[^\]]+\]|\.)(?:\{(?P<length>\d+)\})?\)")
+
+# Classe di caratteri senza intervalli, negazioni o sequenze di escape
+_SIMPLE_CLASS = re.compile(r"\[[^\]\\^-]+\]")
+
+
+class FixedWidthLayout:
+    """
+    Tracciato record a larghezza fissa: ogni campo occupa sempre le stesse
+    posizioni della riga.
+    Il tracciato viene compilato in una funzione che controlla il contenuto
+    della riga ed estrae tutti i campi con un'unica chiamata ad un
+    operator.itemgetter di slice, assegnandoli con un'unica assegnazione
+    multipla agli attributi di un oggetto, senza eseguire l'espressione
+    regolare (come avviene per collections.namedtuple il codice della
+    funzione viene generato una sola volta alla creazione del tracciato).
+    """
+
+    def __init__(self, fields):
+        """
+        @param fields: lista di tuple (nome campo, lunghezza) oppure (nome campo,
+            lunghezza, espressione regolare di un singolo carattere del campo),
+            nell'ordine in cui compaiono nella riga.
+        """
+        self.names = tuple(field[0] for field in fields)
+        # Condizioni sul contenuto della riga, come sorgente Python, e
+        # oggetti da esse utilizzati
+        conditions = []
+        namespace = {}
+        slices = []
+        digits = None
+        start = 0
+        for field in fields:
+            length = field[1]
+            atom = field[2] if len(field) > 2 else None
+            end = start + length
+            slices.append(slice(start, end))
+
+            # I campi numerici consecutivi sono controllati insieme
+            if atom == r"\d":
+                digits = (digits[0] if digits else start, end)
+                start = end
+                continue
+            if digits:
+                conditions.append("line[%d:%d].isdecimal()" % digits)
+                digits = None
+
+            if atom == r"\w":
+                # \w corrisponde ai caratteri alfanumerici e al carattere _
+                conditions.append("line[%d:%d].replace('_', 'a').isalnum()" % (start, end))
+            elif atom is not None and _SIMPLE_CLASS.fullmatch(atom):
+                namespace["_chars%d" % start] = frozenset(atom[1:-1])
+                if length == 1:
+                    conditions.append("line[%d] in _chars%d" % (start, start))
+                else:
+                    conditions.append("_chars%d.issuperset(line[%d:%d])" % (start, start, end))
+            elif atom is not None and atom != ".":
+                namespace["_check%d" % start] = re.compile("%s{%d}" % (atom, length)).fullmatch
+                conditions.append("_check%d(line[%d:%d])" % (start, start, end))
+            start = end
+        if digits:
+            conditions.append("line[%d:%d].isdecimal()" % digits)
+        self.width = start
+
+        # Con un solo campo itemgetter non restituisce una tupla
+        namespace["_fields"] = itemgetter(*slices) if len(slices) > 1 else (lambda line: (line[slices[0]],))
+        source = "def parse(line, target):\n" \
+                 "    if len(line) != %d or not (%s):\n" \
+                 "        return False\n" \
+                 "    %s, = _fields(line)\n" \
+                 "    return True\n" % (self.width, " and ".join(conditions) or "True",
+                                        ", ".join("target." + name for name in self.names))
+        exec(source, namespace)
+
+        # parse(line, target): se la riga corrisponde al tracciato ne assegna i
+        # campi agli attributi omonimi di target e restituisce True,
+        # altrimenti restituisce False senza modificare target
+        self.parse = namespace["parse"]
+
+    @staticmethod
+    def fromRegex(regex):
+        """
+        Ricava il tracciato da un'espressione regolare ancorata (^...$)
+        composta solamente da gruppi con nome di larghezza fissa, come
+        quella di default per gli SmartClock. Restituisce None se
+        l'espressione non è di questo tipo.
+        """
+        if not (regex.startswith("^") and regex.endswith("$")):
+            return None
+        fields = []
+        pos = 1
+        while pos < len(regex) - 1:
+            group = _FIXED_GROUP.match(regex, pos)
+            if group is None:
+                return None
+            fields.append((group.group("name"), int(group.group("length") or 1), group.group("atom")))
+            pos = group.end()
+        return FixedWidthLayout(fields) if fields else None
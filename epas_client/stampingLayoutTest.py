@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+###############################################################################
+# File: stampingLayoutTest.py                                                 #
+# Description: test relativi al tracciato a larghezza fissa delle timbrature  #
+#                                                                             #
+###############################################################################
+
+import unittest
+
+from stamping import Stamping
+from stampingLayout import FixedWidthLayout
+
+SMARTCLOCK_REGEX = "^(?P<operazione>[0,E,U,T])(?P<tipo>\\w{1})(?P<giornoSettimana>\\d{1})(?P<matricolaFirma>\\d{6})(?P<causale>\\d{4})(?P<ora>\\d{2})(?P<minuti>\\d{2})(?P<secondi>\\d{2})(?P<giorno>\\d{2})(?P<mese>\\d{2})(?P<anno>\\d{2})(?P<lettore>\\d{2})$"
+
+
+class FixedWidthLayoutTest(unittest.TestCase):
+    def test_layout_from_regex(self):
+        layout = FixedWidthLayout.fromRegex(SMARTCLOCK_REGEX)
+        self.assertEqual(layout.width, 27)
+
+        stamping = Stamping()
+        self.assertTrue(layout.parse("E11000092000013505605031400", stamping))
+        self.assertEqual(stamping.operazione, "E")
+        self.assertEqual(stamping.matricolaFirma, "000092")
+        self.assertEqual(stamping.anno, "14")
+        self.assertEqual(stamping.lettore, "00")
+
+    def test_lines_not_matching_layout(self):
+        layout = FixedWidthLayout.fromRegex(SMARTCLOCK_REGEX)
+        for line in ("X11000092000013505605031400", "E1100009200001350560503140a", "E1100009200001350560503140"):
+            stamping = Stamping()
+            self.assertFalse(layout.parse(line, stamping))
+            self.assertIsNone(stamping.operazione)
+
+    def test_regex_not_fixed_width(self):
+        self.assertIsNone(FixedWidthLayout.fromRegex("^(?P<matricolaFirma>\\d+);(?P<ora>\\d{2})$"))
+        self.assertIsNone(FixedWidthLayout.fromRegex("(?P<matricolaFirma>\\d{6})"))
+
+
+if __name__ == '__main__':
+    unittest.main()
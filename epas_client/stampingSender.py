@@ -29,14 +29,181 @@
 
 import json
 import logging
+import threading
+from base64 import b64encode
+from json.encoder import encode_basestring_ascii
 
 import requests
-from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from config import EPAS_REST_USERNAME, EPAS_REST_PASSWORD, \
     EPAS_SERVER_PROTOCOL, EPAS_SERVER_NAME, EPAS_SERVER_PORT, \
-    EPAS_STAMPING_URL, CONNECTION_TIMEOUT
-from metrics import SEND_TIME
+    EPAS_STAMPING_URL, CONNECTION_TIMEOUT, HTTP_POOL_SIZE, \
+    EPAS_STAMPINGS_BATCH_URL
+from metrics import SEND_TIME, HTTP_POOL_HITS, HTTP_POOL_MISSES
+from stamping import STAMPING_FIELDS
+
+# L'url di inserimento delle timbrature non cambia durante l'esecuzione
+STAMPING_URL = "%s://%s:%d%s" % (EPAS_SERVER_PROTOCOL, EPAS_SERVER_NAME,
+                                 EPAS_SERVER_PORT, EPAS_STAMPING_URL)
+STAMPINGS_BATCH_URL = "%s://%s:%d%s" % (EPAS_SERVER_PROTOCOL, EPAS_SERVER_NAME,
+                                        EPAS_SERVER_PORT, EPAS_STAMPINGS_BATCH_URL)
+
+# Header aggiunti a tutte le richieste, l'header di autenticazione viene
+# calcolato una sola volta invece che ad ogni invio
+REQUEST_HEADERS = {}
+if EPAS_REST_USERNAME and EPAS_REST_PASSWORD:
+    REQUEST_HEADERS["Authorization"] = "Basic " + b64encode(
+        ("%s:%s" % (EPAS_REST_USERNAME, EPAS_REST_PASSWORD)).encode("latin1")).decode("ascii")
+
+# Template JSON precompilato delle timbrature, con i campi nell'ordine di
+# STAMPING_FIELDS
+_PAYLOAD_TEMPLATE = "{" + ", ".join('"%s": %%s' % field for field in STAMPING_FIELDS) + "}"
+
+# Chiavi JSON dei campi, per le timbrature in cui alcuni campi non sono presenti
+_PAYLOAD_KEYS = tuple('"%s": ' % field for field in STAMPING_FIELDS)
+
+_payloadEncoder = json.JSONEncoder()
+
+
+def _encodeValue(value):
+    if value.__class__ is int:
+        return str(value)
+    if value.__class__ is str:
+        return encode_basestring_ascii(value)
+    return _payloadEncoder.encode(value)
+
+
+def encodeStamping(stamping):
+    """
+    Serializza in JSON i campi della timbratura previsti da ePAS, sempre
+    nello stesso ordine. I campi non presenti nel tracciato (None) non
+    vengono inviati.
+    """
+    values = stamping.payloadValues()
+    if None in values:
+        return "{" + ", ".join([key + _encodeValue(value) for key, value in zip(_PAYLOAD_KEYS, values)
+                                if value is not None]) + "}"
+    return _PAYLOAD_TEMPLATE % tuple([_encodeValue(value) for value in values])
+
+
+def encodeStampings(stampings):
+    """
+    Serializza in una lista JSON un blocco di timbrature da inviare ad ePAS.
+    """
+    return "[" + ", ".join([encodeStamping(stamping) for stamping in stampings]) + "]"
+
+
+class _CountingPoolMixin:
+    """
+    Conta quante volte una richiesta riutilizza una connessione già aperta
+    (hit) e quante volte invece è necessario aprirne una nuova (miss), con
+    relativo handshake TCP/TLS.
+    """
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if getattr(conn, "sock", None) is None:
+            HTTP_POOL_MISSES.inc()
+        else:
+            HTTP_POOL_HITS.inc()
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter che mantiene in keep-alive fino a HTTP_POOL_SIZE connessioni
+    verso il server di ePAS ed esporta le metriche di riutilizzo del pool.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+class RequestTemplate:
+    """
+    Richiesta PUT verso un url di ePAS preparata una sola volta: url, header,
+    autenticazione e impostazioni di ambiente (proxy, certificati) non
+    vengono ricalcolati ad ogni invio, per il quale è sufficiente copiare la
+    richiesta ed impostarne il contenuto.
+    """
+
+    def __init__(self, session, url):
+        self.session = session
+        self.prepared = session.prepare_request(requests.Request("PUT", url, data=""))
+        self.settings = session.merge_environment_settings(url, {}, None, None, None)
+
+    def put(self, body, timeout):
+        prepared = self.prepared.copy()
+        prepared.prepare_body(body, None)
+        return self.session.send(prepared, timeout=timeout, **self.settings)
+
+
+_session = None
+_templates = {}
+_session_lock = threading.Lock()
+
+
+def getSession():
+    """
+    Restituisce la sessione HTTP condivisa tra tutti i thread di invio.
+    La sessione viene creata alla prima richiesta e riutilizzata per tutti
+    i file processati nella stessa esecuzione del client.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # pool_block evita di aprire connessioni "usa e getta" quando
+                # i thread di invio sono più delle connessioni disponibili
+                adapter = PooledHTTPAdapter(pool_connections=1,
+                                            pool_maxsize=HTTP_POOL_SIZE,
+                                            pool_block=True)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(REQUEST_HEADERS)
+                _session = session
+    return _session
+
+
+def getTemplate(url):
+    """
+    Restituisce il RequestTemplate, legato alla sessione condivisa, per
+    l'url passato.
+    """
+    template = _templates.get(url)
+    if template is None:
+        session = getSession()
+        with _session_lock:
+            template = _templates.setdefault(url, RequestTemplate(session, url))
+    return template
+
+
+def closeSession():
+    """
+    Chiude le connessioni keep-alive aperte verso il server di ePAS.
+    """
+    global _session
+    with _session_lock:
+        _templates.clear()
+        if _session is not None:
+            _session.close()
+            _session = None
+
 
 @SEND_TIME.time()
 def sendStamping(stamping):
@@ -45,18 +212,10 @@ def sendStamping(stamping):
     """
 
     logging.debug("Sto per inviare la timbratura %s", stamping)
-    stampingJson = json.dumps(stamping.__dict__)
-
-    url = "%s://%s:%d%s" % (EPAS_SERVER_PROTOCOL, EPAS_SERVER_NAME, 
-                            EPAS_SERVER_PORT, EPAS_STAMPING_URL)
+    stampingJson = encodeStamping(stamping)
 
     try:
-        if EPAS_REST_USERNAME and EPAS_REST_PASSWORD:
-            response = requests.put(url, data=stampingJson,
-                                    auth=HTTPBasicAuth(EPAS_REST_USERNAME, EPAS_REST_PASSWORD),
-                                    timeout=(3.05, CONNECTION_TIMEOUT))
-        else:
-            response = requests.put(url, data=stampingJson)
+        response = getTemplate(STAMPING_URL).put(stampingJson, (3.05, CONNECTION_TIMEOUT))
 
     except requests.exceptions.RequestException as re:
         logging.warn("Errore di Connessione al server: %s", re)
@@ -71,6 +230,33 @@ def sendStamping(stamping):
     return response
 
 
+@SEND_TIME.time()
+def sendStampings(stampings):
+    """
+    Effettua una PUT Restful di un blocco di timbrature sul sistema Epas.
+    Le timbrature sono inviate come lista JSON in un'unica richiesta.
+    """
+
+    logging.debug("Sto per inviare un blocco di %d timbrature", len(stampings))
+    stampingsJson = encodeStampings(stampings)
+
+    try:
+        response = getTemplate(STAMPINGS_BATCH_URL).put(stampingsJson, (3.05, CONNECTION_TIMEOUT))
+
+    except requests.exceptions.RequestException as re:
+        logging.warn("Errore di Connessione al server: %s", re)
+        return None
+    except Exception as e:
+        logging.warn("Errore durante l'invio di un blocco di %d timbrature al server: %s",
+                     len(stampings), e)
+        return None
+
+    logging.info("Inviato un blocco di %d timbrature. Response code=%d, response content = %s",
+                 len(stampings), response.status_code, response.content)
+
+    return response
+
+
 if __name__ == "__main__":
     import sys
     from stampingImporter import StampingImporter
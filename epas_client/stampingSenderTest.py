@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: stampingSenderTest.py                                                 #
+# Description: test relativi alla serializzazione delle timbrature inviate   #
+# ad ePAS.                                                                    #
+#                                                                             #
+###############################################################################
+
+import json
+import unittest
+
+from stamping import Stamping
+from stampingSender import encodeStamping, encodeStampings
+
+
+class StampingSenderTest(unittest.TestCase):
+    def _stamping(self, **values):
+        stamping = Stamping()
+        for field, value in values.items():
+            setattr(stamping, field, value)
+        return stamping
+
+    def test_all_fields_are_encoded_in_order(self):
+        stamping = self._stamping(operazione="0", tipo="1", giornoSettimana="1", matricolaFirma="000092",
+                                  causale="motiviDiServizio", ora=13, minuti=50, secondi=56,
+                                  giorno=5, mese=3, anno=2014, lettore="00")
+        self.assertEqual(encodeStamping(stamping), json.dumps(stamping.payload()))
+
+    def test_missing_fields_are_not_sent(self):
+        stamping = self._stamping(operazione="1", matricolaFirma="000092", ora=8, minuti=30,
+                                  secondi=0, giorno=5, mese=3, anno=2014)
+        expected = {"operazione": "1", "matricolaFirma": "000092", "ora": 8, "minuti": 30,
+                    "secondi": 0, "giorno": 5, "mese": 3, "anno": 2014}
+        self.assertEqual(json.loads(encodeStamping(stamping)), expected)
+        self.assertEqual(json.loads(encodeStampings([stamping, stamping])), [expected, expected])
+        self.assertNotIn("null", encodeStamping(stamping))
+
+
+if __name__ == '__main__':
+    unittest.main()
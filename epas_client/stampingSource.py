@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#         Copyright (C) 2020  Consiglio Nazionale delle Ricerche              #
+#                                                                             #
+#   This program is free software: you can redistribute it and/or modify      #
+#   it under the terms of the GNU Affero General Public License as            #
+#   published by the Free Software Foundation, either version 3 of the        #
+#   License, or (at your option) any later version.                           #
+#                                                                             #
+#   This program is distributed in the hope that it will be useful,           #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+#   GNU Affero General Public License for more details.                       #
+#                                                                             #
+#   You should have received a copy of the GNU Affero General Public License  #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                             #
+###############################################################################
+
+
+
+###############################################################################
+# File: stampingSource.py                                                     #
+# Description: sorgente dei file di timbrature (lettore badge o server        #
+# FTP/SFTP) con i propri parametri di accesso, formato e file di stato.       #
+#                                                                             #
+###############################################################################
+
+import os
+
+from config import STAMPINGS_SERVER_PROTOCOL, FTP_SERVER_NAME, FTP_SERVER_PORT, \
+    FTP_CONNECTION_TIMEOUT, FTP_USERNAME, FTP_PASSWORD, FTP_SERVER_DIR, \
+    FTP_FILE_PREFIX, FTP_FILE_SUFFIX, STAMPING_SOURCES, BADGE_READER_IP, \
+    BADGE_READER_PORT, BADGE_READER_USER, BADGE_READER_PSW
+
+from config import DATA_DIR, STAMPINGS_DIR, ARCHIVES_DIR
+
+from stampingImporter import stampingFormat
+
+# Protocolli utilizzabili dalle sorgenti definite in STAMPING_SOURCES
+SOURCE_PROTOCOLS = ("ftp", "sftp", "local", "smartclock")
+
+# Porte standard utilizzate quando FTP_SERVER_PORT non è impostato
+DEFAULT_SERVER_PORTS = {"ftp": 21, "sftp": 22}
+
+# Parametri globali che possono essere impostati diversamente per ogni
+# sorgente, con il relativo valore di default
+SOURCE_PARAMETERS = {
+    "STAMPINGS_SERVER_PROTOCOL": STAMPINGS_SERVER_PROTOCOL,
+    "FTP_SERVER_NAME": FTP_SERVER_NAME,
+    "FTP_SERVER_PORT": FTP_SERVER_PORT,
+    "FTP_CONNECTION_TIMEOUT": FTP_CONNECTION_TIMEOUT,
+    "FTP_USERNAME": FTP_USERNAME,
+    "FTP_PASSWORD": FTP_PASSWORD,
+    "FTP_SERVER_DIR": FTP_SERVER_DIR,
+    "FTP_FILE_PREFIX": FTP_FILE_PREFIX,
+    "FTP_FILE_SUFFIX": FTP_FILE_SUFFIX,
+    "REGEX_STAMPING": None,
+    "BADGE_READER_IP": BADGE_READER_IP,
+    "BADGE_READER_PORT": BADGE_READER_PORT,
+    "BADGE_READER_USER": BADGE_READER_USER,
+    "BADGE_READER_PSW": BADGE_READER_PSW,
+}
+
+
+class StampingSource:
+    """
+    Sorgente dei file di timbrature: protocollo, server (o lettore badge) e
+    credenziali di accesso, prefisso e suffisso dei file e formato delle
+    timbrature.
+
+    La sorgente senza nome corrisponde ai parametri globali della
+    configurazione e utilizza DATA_DIR, STAMPINGS_DIR e ARCHIVES_DIR; quelle
+    definite in STAMPING_SOURCES hanno ognuna una propria sottodirectory (con
+    il nome della sorgente) per i file scaricati, per l'archivio delle
+    timbrature dei lettori e per i file di stato (ultimo file processato,
+    timbrature da re-inviare, errori di parsing, catalogo).
+    """
+
+    def __init__(self, name=None, parameters=None):
+        parameters = dict(parameters or {})
+        unknown = set(parameters) - set(SOURCE_PARAMETERS)
+        if unknown:
+            raise ValueError("Parametri non previsti per la sorgente %s: %s"
+                             % (name, ", ".join(sorted(unknown))))
+        values = dict(SOURCE_PARAMETERS, **parameters)
+
+        self.name = name
+        self.protocol = values["STAMPINGS_SERVER_PROTOCOL"]
+        self.serverName = values["FTP_SERVER_NAME"]
+        port = values["FTP_SERVER_PORT"]
+        self.serverPort = int(port) if port else DEFAULT_SERVER_PORTS.get(self.protocol, 21)
+        self.connectionTimeout = values["FTP_CONNECTION_TIMEOUT"]
+        self.username = values["FTP_USERNAME"]
+        self.password = values["FTP_PASSWORD"]
+        self.serverDir = values["FTP_SERVER_DIR"]
+        self.filePrefix = values["FTP_FILE_PREFIX"]
+        self.fileSuffix = values["FTP_FILE_SUFFIX"]
+        self.stampingFormat = stampingFormat(values["REGEX_STAMPING"])
+        self.badgeReaderIp = values["BADGE_READER_IP"]
+        self.badgeReaderPort = int(values["BADGE_READER_PORT"])
+        self.badgeReaderUser = values["BADGE_READER_USER"]
+        self.badgeReaderPassword = values["BADGE_READER_PSW"]
+
+        self.dataDir = os.path.join(DATA_DIR, name) if name else DATA_DIR
+        self.stampingsDir = os.path.join(STAMPINGS_DIR, name) if name else STAMPINGS_DIR
+        self.archivesDir = os.path.join(ARCHIVES_DIR, name) if name else ARCHIVES_DIR
+
+    @staticmethod
+    def fromDefinition(definition):
+        """
+        Crea la sorgente a partire da un elemento di STAMPING_SOURCES: un
+        dizionario con il nome della sorgente ("NAME") e i parametri da
+        utilizzare al posto di quelli globali.
+        """
+        parameters = dict(definition)
+        name = parameters.pop("NAME", None)
+        if not name or os.sep in name or name in (os.curdir, os.pardir):
+            raise ValueError("Nome della sorgente di timbrature non valido: %r" % (name,))
+
+        source = StampingSource(name, parameters)
+        if source.protocol not in SOURCE_PROTOCOLS:
+            raise ValueError("Protocollo %s non utilizzabile per la sorgente %s, "
+                             "valori possibili: %s" % (source.protocol, name, ", ".join(SOURCE_PROTOCOLS)))
+        return source
+
+    def makedirs(self):
+        """
+        Crea, se non presenti, le directory della sorgente.
+        """
+        os.makedirs(self.dataDir, exist_ok=True)
+        os.makedirs(self.stampingsDir, exist_ok=True)
+        os.makedirs(self.archivesDir, exist_ok=True)
+
+    def __str__(self):
+        if self.protocol == "local":
+            location = self.stampingsDir
+        elif self.protocol == "smartclock":
+            location = self.badgeReaderIp
+        else:
+            location = self.serverName
+        return "%s (%s://%s)" % (self.name, self.protocol, location)
+
+
+def configuredSources():
+    """
+    Restituisce le sorgenti definite in STAMPING_SOURCES, verificando che i
+    nomi non siano ripetuti.
+    """
+    sources = [StampingSource.fromDefinition(definition) for definition in STAMPING_SOURCES]
+    names = [source.name for source in sources]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError("Nomi delle sorgenti di timbrature ripetuti: %s" % ", ".join(duplicates))
+    return sources